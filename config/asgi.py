@@ -3,6 +3,15 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Асинхронные представления (checkout/async/ в payments/urls.py) не держат
+поток на время ожидания внешних API только под ASGI-сервером:
+
+    uvicorn config.asgi:application --workers 4
+
+Синхронные представления при этом выполняются в пуле потоков Django.
+События lifespan обрабатываются здесь: Django их не принимает, а при
+остановке сервера нужно закрыть соединения клиента Stripe.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -13,4 +22,25 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def lifespan(receive, send):
+    """Запуск и остановка ASGI-сервера"""
+    from payments.stripe_async import close_client
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
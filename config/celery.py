@@ -16,7 +16,7 @@ app.autodiscover_tasks()
 # Конфигурация beat schedule
 app.conf.beat_schedule = {
     'check-inactive-users-daily': {
-        'task': 'user.tasks.check_inactive_users',
+        'task': 'users.tasks.check_inactive_users',
         'schedule': crontab(hour=0, minute=0),  # Ежедневно в полночь
         'args': (),
     },
@@ -25,6 +25,21 @@ app.conf.beat_schedule = {
         'schedule': crontab(hour='*/1', minute=0),  # Каждый час
         'args': (),
     },
+    'dispatch-outbox-every-minute': {
+        'task': 'lms.tasks.dispatch_outbox',
+        'schedule': crontab(minute='*'),  # Каждую минуту
+        'args': (),
+    },
+    'send-daily-digests': {
+        'task': 'lms.tasks.send_daily_digests',
+        'schedule': crontab(hour=8, minute=0),  # Ежедневно в 8:00
+        'args': (),
+    },
+    'process-stripe-events-every-minute': {
+        'task': 'payments.tasks.process_stripe_events',
+        'schedule': crontab(minute='*'),  # Каждую минуту
+        'args': (),
+    },
 }
 
 app.conf.timezone = 'Europe/Moscow'
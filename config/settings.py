@@ -32,6 +32,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_filters',
     'drf_yasg',
     
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lms.middleware.PerformanceMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -102,8 +104,15 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'lms.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Конфигурация PostgreSQL для полнотекстового поиска (lms/search.py)
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+
 # Кастомная модель пользователя
 AUTH_USER_MODEL = 'users.User'
 
@@ -166,6 +175,22 @@ REDOC_SETTINGS = {
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY', 'sk_test_your_test_key_here')
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY', 'pk_test_your_test_key_here')
 STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', 'whsec_your_secret_here')
+# Валюта цен курсов в Stripe (payments/tasks.py)
+STRIPE_CURRENCY = os.environ.get('STRIPE_CURRENCY', 'usd')
+# Адрес Stripe API; для разработки без сети - адрес локальной замены
+# (manage.py fake_stripe, payments/fake_stripe.py)
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE', 'https://api.stripe.com')
+# Асинхронный checkout (payments/stripe_async.py): одновременных запросов
+# к Stripe на процесс, ожидание свободного места, таймаут запроса и время
+# жизни неиспользуемого keep-alive соединения, в секундах
+STRIPE_MAX_CONCURRENCY = int(os.environ.get('STRIPE_MAX_CONCURRENCY', 100))
+STRIPE_QUEUE_TIMEOUT = float(os.environ.get('STRIPE_QUEUE_TIMEOUT', 5))
+STRIPE_TIMEOUT = float(os.environ.get('STRIPE_TIMEOUT', 30))
+STRIPE_KEEPALIVE_EXPIRY = float(os.environ.get('STRIPE_KEEPALIVE_EXPIRY', 60))
+# События webhook (payments/events.py): размер пачки обработчика и число
+# попыток, после которых событие помечается как необработанное
+STRIPE_EVENTS_BATCH_SIZE = int(os.environ.get('STRIPE_EVENTS_BATCH_SIZE', 100))
+STRIPE_EVENTS_MAX_ATTEMPTS = int(os.environ.get('STRIPE_EVENTS_MAX_ATTEMPTS', 8))
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
 BACKEND_URL = os.environ.get('BACKEND_URL', 'http://localhost:8000')
 
@@ -181,6 +206,34 @@ if REDIS_PASSWORD:
 else:
     REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
 
+# Redis для кэша (отдельная база, чтобы не смешивать с очередями Celery)
+REDIS_CACHE_DB = os.getenv('REDIS_CACHE_DB', '1')
+
+if REDIS_PASSWORD:
+    REDIS_CACHE_URL = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_CACHE_DB}"
+else:
+    REDIS_CACHE_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_CACHE_DB}"
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_CACHE_URL,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+}
+
+# Время жизни закэшированных ответов API (секунды)
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', '300'))
+
+# Метрики запросов (Server-Timing и /metrics): доля замеряемых запросов
+# от 0 до 1 и токен для доступа к /metrics. Без токена /metrics доступен
+# только сотрудникам; METRICS_PUBLIC=True открывает его без проверки
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '1.0'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', 'False') == 'True'
+
 # Celery settings
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
@@ -193,20 +246,79 @@ CELERY_ENABLE_UTC = True
 # Celery Beat settings
 CELERY_BEAT_SCHEDULE = {
     'check-inactive-users': {
-        'task': 'user.tasks.check_inactive_users',
+        'task': 'users.tasks.check_inactive_users',
         'schedule': crontab(hour=0, minute=0),  # Каждый день в полночь
     },
     'send-course-updates-notifications': {
         'task': 'lms.tasks.send_course_updates_notifications',
         'schedule': crontab(minute='*/30'),  # Каждые 30 минут
     },
+    'dispatch-outbox': {
+        'task': 'lms.tasks.dispatch_outbox',
+        'schedule': crontab(minute='*'),  # Каждую минуту
+    },
+    'send-daily-digests': {
+        'task': 'lms.tasks.send_daily_digests',
+        'schedule': crontab(hour=8, minute=0),  # Каждый день в 8:00
+    },
+    'process-stripe-events': {
+        'task': 'payments.tasks.process_stripe_events',
+        'schedule': crontab(minute='*'),  # Каждую минуту
+    },
 }
 
 # Email settings (для отправки писем)
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# SMTP с пулом соединений на процесс (lms/mail.py)
+EMAIL_BACKEND = 'lms.mail.PooledEmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
-DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
\ No newline at end of file
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
+
+# Пул SMTP-соединений: размер на процесс, через сколько секунд простоя
+# проверять соединение командой NOOP, сколько ждать свободное соединение
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', '4'))
+EMAIL_POOL_CHECK_INTERVAL = int(os.getenv('EMAIL_POOL_CHECK_INTERVAL', '30'))
+EMAIL_POOL_TIMEOUT = int(os.getenv('EMAIL_POOL_TIMEOUT', '30'))
+
+# Квоты SMTP-провайдера, общие для всех воркеров (lms/ratelimit.py):
+# писем в секунду (0 - без ограничения), запас токенов и писем в сутки
+EMAIL_RATE_LIMIT = float(os.getenv('EMAIL_RATE_LIMIT', '0'))
+EMAIL_RATE_BURST = int(os.getenv('EMAIL_RATE_BURST', '10'))
+EMAIL_DAILY_LIMIT = int(os.getenv('EMAIL_DAILY_LIMIT', '0'))
+# Доля квоты, недоступная приоритету: массовые рассылки оставляют запас
+# для транзакционных писем
+EMAIL_RATE_PRIORITIES = {
+    'transactional': 0.0,
+    'bulk': float(os.getenv('EMAIL_BULK_RESERVE', '0.2')),
+}
+# Через сколько секунд повторить отправку после временного отказа
+# сервера (коды 4xx)
+EMAIL_THROTTLE_BACKOFF = int(os.getenv('EMAIL_THROTTLE_BACKOFF', '60'))
+
+# Подписчиков в одной задаче рассылки об обновлении курса
+NOTIFICATION_CHUNK_SIZE = int(os.getenv('NOTIFICATION_CHUNK_SIZE', '500'))
+
+# Окно объединения изменений курса в одно уведомление (секунды)
+NOTIFICATION_DEBOUNCE = int(os.getenv('NOTIFICATION_DEBOUNCE', '60'))
+
+# Outbox уведомлений: размер пачки диспетчера и число попыток отправки
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+# Сколько диспетчеров outbox запускать параллельно после массовой проверки
+OUTBOX_DISPATCHERS = int(os.getenv('OUTBOX_DISPATCHERS', '4'))
+# Через сколько секунд диспетчер заново запускает задачу рассылки,
+# которая не отметила переданное ей уведомление
+OUTBOX_TASK_TIMEOUT = int(os.getenv('OUTBOX_TASK_TIMEOUT', '3600'))
+
+# Ежедневная сводка обновлений курсов (lms/digest.py): получателей в
+# пачке обхода и в одном письме outbox. Письмо уходит целиком, поэтому
+# при ограничении скорости группа дополнительно ограничена квотой
+# массовой рассылки за раз: EMAIL_RATE_BURST за вычетом запаса bulk
+DIGEST_BATCH_SIZE = int(os.getenv('DIGEST_BATCH_SIZE', '1000'))
+DIGEST_GROUP_SIZE = int(os.getenv('DIGEST_GROUP_SIZE', '10'))
+
+# Пользователей в одной пачке (транзакции) блокировки check_inactive_users
+INACTIVE_USERS_BATCH_SIZE = int(os.getenv('INACTIVE_USERS_BATCH_SIZE', '1000'))
@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from lms.metrics import metrics_view
 
 # Настройки схемы OpenAPI
 schema_view = get_schema_view(
@@ -36,6 +37,9 @@ urlpatterns = [
          schema_view.with_ui('redoc', cache_timeout=0),
          name='schema-redoc'),
     path('api/payments/', include('payments.urls')),
+
+    # Метрики для Prometheus
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
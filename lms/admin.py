@@ -1,14 +1,48 @@
 from django.contrib import admin
-from .models import Course, Lesson
+from django.utils import timezone
+from .models import Course, Lesson, StripeEvent
+from .search import search
+
+
+class FullTextSearchAdminMixin:
+    """Поиск в админке по тому же индексу search_vector, что и в API"""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search(queryset, search_term), False
+
 
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(FullTextSearchAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'created_at')
     search_fields = ('title',)
     list_filter = ('created_at',)
 
 @admin.register(Lesson)
-class LessonAdmin(admin.ModelAdmin):
+class LessonAdmin(FullTextSearchAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'course', 'created_at')
     search_fields = ('title', 'course__title')
-    list_filter = ('course', 'created_at')
\ No newline at end of file
+    list_filter = ('course', 'created_at')
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'type', 'object_id', 'status', 'attempts', 'created', 'processed_at')
+    list_filter = ('status', 'type')
+    search_fields = ('event_id', 'object_id')
+    readonly_fields = (
+        'event_id', 'type', 'object_id', 'created', 'payload', 'status', 'attempts',
+        'available_at', 'last_error', 'received_at', 'processed_at',
+    )
+    ordering = ('-created',)
+    actions = ('retry_events',)
+
+    @admin.action(description='Обработать повторно')
+    def retry_events(self, request, queryset):
+        from payments.events import schedule_processing
+
+        count = queryset.exclude(status=StripeEvent.Status.PROCESSED).update(
+            status=StripeEvent.Status.PENDING, attempts=0, available_at=timezone.now()
+        )
+        schedule_processing()
+        self.message_user(request, f'Событий поставлено на обработку: {count}')
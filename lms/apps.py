@@ -6,4 +6,8 @@ class LmsConfig(AppConfig):
     name = 'lms'
 
     def ready(self):
-        import lms.signals  # Регистрируем сигналы
\ No newline at end of file
+        import lms.signals  # Регистрируем сигналы
+        from django.db.backends.signals import connection_created
+        from .metrics import install_db_wrapper
+
+        connection_created.connect(install_db_wrapper)
\ No newline at end of file
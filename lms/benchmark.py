@@ -0,0 +1,512 @@
+"""
+Нагрузочный прогон API (manage.py bench).
+
+Набор данных генерируется детерминированно по seed, каждый маршрут из
+lms/urls.py, users/urls.py и payments/urls.py описан сценарием. Запросы
+идут через тестовый клиент в нескольких потоках. Количество SQL-запросов
+берется из заголовка Server-Timing (lms/middleware.py).
+
+Отдельно замеряется рассылка уведомлений (manage.py notification_bench):
+курс с N подписчиками, письма уходят в локальный SMTP-сервер
+(lms/smtp_sink.py), считаются писем в секунду, время до последней
+доставки и пиковая память процесса.
+
+Checkout замеряется по HTTP отдельно (payments/benchmark.py).
+"""
+import itertools
+import json
+import math
+import random
+import re
+import resource
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Callable, Optional
+
+import stripe
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, URLResolver
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Course, Lesson, Subscription
+from .search import build_search_vector
+
+User = get_user_model()
+
+BENCH_PASSWORD = 'bench-password'
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+WORDS = [
+    'python', 'django', 'алгоритмы', 'данные', 'веб', 'разработка', 'анализ',
+    'дизайн', 'тестирование', 'базы', 'сети', 'безопасность', 'машинное',
+    'обучение', 'интерфейсы', 'архитектура',
+]
+
+
+@contextmanager
+def bench_environment(keepdb=False, stripe_api_base=None, **overrides):
+    """
+    Окружение замера: отдельная тестовая база и отдельный префикс кэша.
+
+    Настройки overrides действуют внутри блока. stripe_api_base
+    направляет в другой адрес и асинхронный клиент (STRIPE_API_BASE),
+    и синхронный SDK (stripe.api_base). После замера ключи кэша прогона
+    удаляются, а база - если не задан keepdb.
+    """
+    api_base = stripe.api_base
+    if stripe_api_base:
+        overrides['STRIPE_API_BASE'] = stripe_api_base
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    caches = {
+        alias: {**config, 'KEY_PREFIX': f'bench:{uuid.uuid4().hex}'}
+        for alias, config in settings.CACHES.items()
+    }
+    try:
+        with override_settings(CACHES=caches, **overrides):
+            if stripe_api_base:
+                stripe.api_base = stripe_api_base
+            try:
+                yield
+            finally:
+                if hasattr(cache, 'delete_pattern'):
+                    cache.delete_pattern('*')
+    finally:
+        stripe.api_base = api_base
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+@dataclass
+class Dataset:
+    """Параметры генерируемого набора данных"""
+    courses: int = 50
+    lessons_per_course: int = 10
+    users: int = 100
+    subscriptions_per_user: int = 5
+    payments_per_user: int = 3
+    seed: int = 42
+
+
+@dataclass
+class Context:
+    """Объекты, на которые ссылаются сценарии"""
+    user: object
+    admin: object
+    course_ids: list
+    own_course_ids: list
+    lesson_ids: list
+    own_lesson_ids: list
+    subscription_ids: list
+    payment_ids: list
+    counter: itertools.count = field(default_factory=itertools.count)
+
+    def unique(self):
+        return next(self.counter)
+
+
+@dataclass
+class Scenario:
+    """
+    Один маршрут API.
+
+    prepare(ctx) вызывается перед каждым запросом вне замера и возвращает
+    аргументы для path и data (например, свежий объект для удаления).
+    """
+    name: str
+    route: str
+    method: str
+    path: Callable
+    data: Optional[Callable] = None
+    prepare: Optional[Callable] = None
+    auth: str = 'user'
+    expected_status: tuple = ()
+    requires_stripe: bool = False
+
+    def is_error(self, status_code):
+        if self.expected_status:
+            return status_code not in self.expected_status
+        return status_code >= 400
+
+
+def _title(rnd, words=3):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def seed_dataset(dataset):
+    """Заполнение базы набором данных, возвращает контекст для сценариев"""
+    from users.models import Payment
+
+    rnd = random.Random(dataset.seed)
+    password = make_password(BENCH_PASSWORD)
+
+    admin = User.objects.create(
+        email='bench-admin@bench.local', password=password,
+        is_staff=True, is_superuser=True
+    )
+    users = User.objects.bulk_create([
+        User(email=f'bench{i}@bench.local', password=password, first_name=f'User{i}')
+        for i in range(dataset.users)
+    ])
+    user = users[0]
+
+    courses = Course.objects.bulk_create([
+        Course(
+            title=_title(rnd),
+            description=_title(rnd, 12),
+            owner=users[i % len(users)],
+            price=Decimal(rnd.randint(10, 500) * 100),
+        )
+        for i in range(dataset.courses)
+    ])
+    lessons = Lesson.objects.bulk_create([
+        Lesson(
+            course=course,
+            title=_title(rnd),
+            description=_title(rnd, 20),
+            video_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            owner=course.owner,
+        )
+        for course in courses
+        for _ in range(dataset.lessons_per_course)
+    ])
+    subscriptions = Subscription.objects.bulk_create([
+        Subscription(user=subscriber, course=course)
+        for subscriber in users
+        for course in rnd.sample(courses, min(dataset.subscriptions_per_user, len(courses)))
+    ])
+    payments = Payment.objects.bulk_create([
+        Payment(user=payer, course=rnd.choice(courses), amount=Decimal(rnd.randint(100, 5000)))
+        for payer in users
+        for _ in range(dataset.payments_per_user)
+    ])
+
+    # bulk_create не вызывает сигналы, поисковый индекс заполняется отдельно
+    for model in (Course, Lesson):
+        model.objects.update(search_vector=build_search_vector())
+
+    return Context(
+        user=user,
+        admin=admin,
+        course_ids=[course.id for course in courses],
+        own_course_ids=[course.id for course in courses if course.owner_id == user.id],
+        lesson_ids=[lesson.id for lesson in lessons],
+        own_lesson_ids=[lesson.id for lesson in lessons if lesson.owner_id == user.id],
+        subscription_ids=[sub.id for sub in subscriptions if sub.user_id == user.id],
+        payment_ids=[payment.id for payment in payments if payment.user_id == user.id],
+    )
+
+
+def _choose(ctx, attr):
+    """Очередной id из списка контекста (по кругу)"""
+    ids = getattr(ctx, attr)
+    return ids[ctx.unique() % len(ids)]
+
+
+def _new_course(ctx):
+    course = Course.objects.create(title=f'Bench course {ctx.unique()}', owner=ctx.user)
+    return {'pk': course.id}
+
+
+def _new_lesson(ctx):
+    lesson = Lesson.objects.create(
+        course_id=ctx.own_course_ids[0], title=f'Bench lesson {ctx.unique()}', owner=ctx.user
+    )
+    return {'pk': lesson.id}
+
+
+def _active_subscription(ctx):
+    course_id = _choose(ctx, 'course_ids')
+    Subscription.objects.update_or_create(
+        user=ctx.user, course_id=course_id, defaults={'is_active': True}
+    )
+    return {'course_id': course_id}
+
+
+def _refresh_token(ctx):
+    return {'refresh': str(RefreshToken.for_user(ctx.user))}
+
+
+SCENARIOS = [
+    # lms/urls.py
+    Scenario('courses-list', 'course-list', 'get', lambda ctx, **kw: '/api/courses/'),
+    Scenario('courses-list-expand', 'course-list', 'get',
+             lambda ctx, **kw: '/api/courses/?expand=lessons'),
+    Scenario('courses-search', 'course-list', 'get',
+             lambda ctx, **kw: '/api/courses/?search=python'),
+    Scenario('course-detail', 'course-detail', 'get',
+             lambda ctx, **kw: f'/api/courses/{_choose(ctx, "course_ids")}/'),
+    Scenario('course-create', 'course-list', 'post', lambda ctx, **kw: '/api/courses/',
+             data=lambda ctx, **kw: {'title': f'New course {ctx.unique()}', 'price': '1000.00'}),
+    Scenario('course-update', 'course-detail', 'patch',
+             lambda ctx, **kw: f'/api/courses/{_choose(ctx, "own_course_ids")}/',
+             data=lambda ctx, **kw: {'description': f'Updated {ctx.unique()}'}),
+    Scenario('course-delete', 'course-detail', 'delete',
+             lambda ctx, pk: f'/api/courses/{pk}/', prepare=_new_course),
+    Scenario('lessons-list', 'lesson-list', 'get', lambda ctx, **kw: '/api/lessons/'),
+    Scenario('lessons-list-course', 'lesson-list', 'get',
+             lambda ctx, **kw: f'/api/lessons/?course={_choose(ctx, "course_ids")}'),
+    Scenario('lesson-detail', 'lesson-detail', 'get',
+             lambda ctx, **kw: f'/api/lessons/{_choose(ctx, "own_lesson_ids")}/'),
+    Scenario('lesson-create', 'lesson-list', 'post', lambda ctx, **kw: '/api/lessons/',
+             data=lambda ctx, **kw: {
+                 'course': ctx.own_course_ids[0],
+                 'title': f'New lesson {ctx.unique()}',
+                 'video_url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+             }),
+    Scenario('lesson-update', 'lesson-update', 'patch',
+             lambda ctx, **kw: f'/api/lessons/{_choose(ctx, "own_lesson_ids")}/update/',
+             data=lambda ctx, **kw: {'description': f'Updated {ctx.unique()}'}),
+    Scenario('lesson-delete', 'lesson-delete', 'delete',
+             lambda ctx, pk: f'/api/lessons/{pk}/delete/', prepare=_new_lesson),
+    Scenario('search', 'search', 'get', lambda ctx, **kw: '/api/search/?q=python'),
+    Scenario('search-lessons', 'search', 'get',
+             lambda ctx, **kw: '/api/search/?q=данные&type=lessons'),
+    Scenario('search-autocomplete', 'search-autocomplete', 'get',
+             lambda ctx, **kw: '/api/search/autocomplete/?q=разраб'),
+    Scenario('cache-stats', 'cache-stats', 'get',
+             lambda ctx, **kw: '/api/cache/stats/', auth='admin'),
+    Scenario('subscriptions-list', 'subscription-list', 'get',
+             lambda ctx, **kw: '/api/subscriptions/'),
+    Scenario('subscription-detail', 'subscription-detail', 'get',
+             lambda ctx, **kw: f'/api/subscriptions/{_choose(ctx, "subscription_ids")}/'),
+    Scenario('subscribe', 'subscription-subscribe', 'post',
+             lambda ctx, **kw: '/api/subscriptions/subscribe/',
+             data=lambda ctx, **kw: {'course_id': _choose(ctx, 'course_ids')}),
+    Scenario('unsubscribe', 'subscription-unsubscribe', 'post',
+             lambda ctx, **kw: '/api/subscriptions/unsubscribe/',
+             data=lambda ctx, course_id: {'course_id': course_id},
+             prepare=_active_subscription),
+
+    # users/urls.py
+    Scenario('user-register', 'user-register', 'post', lambda ctx, **kw: '/api/users/register/',
+             data=lambda ctx, **kw: {
+                 'email': f'new{ctx.unique()}-{time.monotonic_ns()}@bench.local',
+                 'first_name': 'New', 'last_name': 'User',
+                 'password': BENCH_PASSWORD, 'password_confirm': BENCH_PASSWORD,
+             }, auth='anon'),
+    Scenario('token-obtain', 'token-obtain-pair', 'post', lambda ctx, **kw: '/api/users/token/',
+             data=lambda ctx, **kw: {'email': ctx.user.email, 'password': BENCH_PASSWORD},
+             auth='anon'),
+    Scenario('token-refresh', 'token-refresh', 'post', lambda ctx, **kw: '/api/users/token/refresh/',
+             data=lambda ctx, refresh: {'refresh': refresh}, prepare=_refresh_token, auth='anon'),
+    Scenario('token-verify', 'token-verify', 'post', lambda ctx, **kw: '/api/users/token/verify/',
+             data=lambda ctx, refresh: {'token': refresh}, prepare=_refresh_token, auth='anon'),
+    Scenario('users-list', 'user-list', 'get', lambda ctx, **kw: '/api/users/', auth='admin'),
+    Scenario('user-profile', 'user-profile', 'get', lambda ctx, **kw: '/api/users/profile/'),
+    Scenario('user-detail', 'user-detail', 'get', lambda ctx, **kw: f'/api/users/{ctx.user.id}/'),
+    Scenario('payments-list', 'payment-list', 'get', lambda ctx, **kw: '/api/users/payments/'),
+    Scenario('payment-detail', 'payment-detail', 'get',
+             lambda ctx, **kw: f'/api/users/payments/{_choose(ctx, "payment_ids")}/'),
+
+    # payments/urls.py
+    Scenario('course-price', 'course-price', 'get',
+             lambda ctx, **kw: f'/api/payments/courses/{_choose(ctx, "course_ids")}/price/'),
+    Scenario('stripe-checkout', 'stripe-checkout', 'post', lambda ctx, **kw: '/api/payments/checkout/',
+             data=lambda ctx, **kw: {
+                 'course_id': _choose(ctx, 'course_ids'),
+                 'success_url': 'http://localhost/success/',
+                 'cancel_url': 'http://localhost/cancel/',
+             }, requires_stripe=True),
+    # Обычное представление Django: только JWT, без force_authenticate
+    Scenario('stripe-checkout-async', 'stripe-checkout-async', 'post',
+             lambda ctx, **kw: '/api/payments/checkout/async/',
+             data=lambda ctx, **kw: {
+                 'course_id': _choose(ctx, 'course_ids'),
+                 'success_url': 'http://localhost/success/',
+                 'cancel_url': 'http://localhost/cancel/',
+             }, auth='jwt', requires_stripe=True),
+    # Без подписи Stripe: замеряется отказ в обработке webhook
+    Scenario('stripe-webhook', 'stripe-webhook', 'post', lambda ctx, **kw: '/api/payments/webhook/',
+             data=lambda ctx, **kw: {'type': 'ping'}, auth='anon', expected_status=(400,)),
+]
+
+
+def _route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+def uncovered_routes(scenarios=SCENARIOS):
+    """Именованные маршруты API, для которых нет сценария"""
+    from lms.urls import urlpatterns as lms_urls
+    from payments.urls import urlpatterns as payments_urls
+    from users.urls import urlpatterns as users_urls
+
+    names = set(_route_names(lms_urls + users_urls + payments_urls))
+    # Корень DefaultRouter и форматные суффиксы не являются эндпоинтами API
+    names -= {'api-root'}
+    return sorted(names - {scenario.route for scenario in scenarios})
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _client(ctx, auth):
+    client = APIClient()
+    if auth == 'user':
+        client.force_authenticate(user=ctx.user)
+    elif auth == 'admin':
+        client.force_authenticate(user=ctx.admin)
+    elif auth == 'jwt':
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(ctx.user).access_token}')
+    return client
+
+
+def _request(scenario, ctx, client):
+    """Один запрос сценария: (задержка в секундах, число SQL-запросов, статус)"""
+    kwargs = scenario.prepare(ctx) if scenario.prepare else {}
+    path = scenario.path(ctx, **kwargs)
+    data = scenario.data(ctx, **kwargs) if scenario.data else None
+
+    start = time.perf_counter()
+    response = getattr(client, scenario.method)(path, data, format='json')
+    latency = time.perf_counter() - start
+
+    match = QUERIES_RE.search(response.get('Server-Timing', ''))
+    return latency, int(match.group(1)) if match else None, response.status_code
+
+
+def _worker(scenario, ctx, count, threaded):
+    client = _client(ctx, scenario.auth)
+    try:
+        return [_request(scenario, ctx, client) for _ in range(count)]
+    finally:
+        if threaded:
+            # Соединения потоков нужно закрыть до удаления тестовой базы
+            connections.close_all()
+
+
+def run_scenario(scenario, ctx, requests=50, concurrency=4, warmup=2):
+    """Прогон сценария, возвращает сводку задержек, пропускной способности и SQL"""
+    _worker(scenario, ctx, warmup, threaded=False)
+
+    chunks = [requests // concurrency + (1 if i < requests % concurrency else 0)
+              for i in range(concurrency)]
+    start = time.perf_counter()
+    if concurrency == 1:
+        samples = _worker(scenario, ctx, requests, threaded=False)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(_worker, scenario, ctx, chunk, True) for chunk in chunks if chunk]
+            samples = [sample for future in futures for sample in future.result()]
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _, _ in samples]
+    queries = [count for _, count, _ in samples if count is not None]
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'rps': round(len(samples) / elapsed, 1),
+        'queries': round(sum(queries) / len(queries), 2) if queries else None,
+        'errors': sum(1 for _, _, code in samples if scenario.is_error(code)),
+    }
+
+
+def compare(results, baseline, tolerance=0.5, min_delta_ms=5.0):
+    """
+    Сравнение с базовой линией.
+
+    Регрессия: медиана задержки выросла больше чем на tolerance (и больше
+    чем на min_delta_ms), либо выросло среднее число SQL-запросов на запрос.
+    Хвосты (p95/p99) на коротком прогоне слишком шумные для автоматической
+    проверки и только выводятся в отчете.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+
+        delta = current['p50_ms'] - previous['p50_ms']
+        if delta > min_delta_ms and current['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {previous['p50_ms']} -> {current['p50_ms']} ms")
+
+        if None not in (current['queries'], previous['queries']) \
+                and current['queries'] > previous['queries']:
+            regressions.append(f"{name}: SQL {previous['queries']} -> {current['queries']} на запрос")
+
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_baseline(path, dataset, options, results):
+    report = {
+        'dataset': dataset.__dict__,
+        'requests': options['requests'],
+        'concurrency': options['concurrency'],
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+# Рассылка уведомлений
+
+def seed_subscribers(subscribers, batch_size=1000):
+    """Курс с subscribers активными подписчиками"""
+    course = Course.objects.create(title='Замер рассылки', description='Курс для замера рассылки')
+    users = User.objects.bulk_create([
+        User(email=f'fanout{i}@bench.local', password=make_password(None), first_name=f'User{i}')
+        for i in range(subscribers)
+    ], batch_size=batch_size)
+    Subscription.objects.bulk_create(
+        [Subscription(user=user, course=course) for user in users], batch_size=batch_size
+    )
+    return course
+
+
+def peak_rss_mb():
+    """Пиковый размер резидентной памяти процесса (Linux: ru_maxrss в КБ)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_fanout(course, sink, expected, timeout=300):
+    """
+    Рассылка по курсу и замер доставки в sink.
+
+    Время считается от постановки send_course_update_notification до
+    приема последнего письма сервером. В режиме eager и с воркером в
+    этом же процессе пиковая память процесса - память воркера.
+    """
+    from .tasks import send_course_update_notification
+
+    sink.reset()
+    started = time.monotonic()
+    send_course_update_notification.delay(course.id)
+    complete = sink.wait_for(expected, timeout)
+
+    elapsed = (sink.last_at or started) - started
+    return {
+        'subscribers': expected,
+        'delivered': sink.count,
+        'complete': complete,
+        'first_delivery_s': round(sink.first_at - started, 3) if sink.first_at else None,
+        'last_delivery_s': round(elapsed, 3),
+        'messages_per_s': round(sink.count / elapsed, 1) if elapsed > 0 else 0.0,
+        'smtp_connections': sink.connections,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
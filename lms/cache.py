@@ -0,0 +1,170 @@
+"""
+Кэш ответов API для курсов и уроков.
+
+Ключи ответов включают номер версии курса (или всего каталога для списка),
+поэтому инвалидация сводится к увеличению версии в сигналах, а устаревшие
+записи просто перестают читаться и истекают по таймауту.
+
+Флаг is_subscribed зависит от пользователя, поэтому в кэше хранится общий
+ответ, а флаг пересчитывается одним запросом после чтения из кэша.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import record_cache_lookup
+
+CATALOG_VERSION_KEY = 'lms:catalog:version'
+COURSE_VERSION_KEY = 'lms:course:{course_id}:version'
+HITS_KEY = 'lms:cache:hits'
+MISSES_KEY = 'lms:cache:misses'
+
+
+def _initial_version():
+    # Версия от текущего времени не пересекается с версиями,
+    # которые могли остаться в кэше после вытеснения ключа
+    return int(time.time() * 1000)
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = _initial_version()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def _incr_counter(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def _query_hash(request):
+    """Хэш параметров запроса (страница, размер страницы и т.д.)"""
+    query = request.META.get('QUERY_STRING', '')
+    return hashlib.md5(query.encode()).hexdigest()
+
+
+def bump_course_version(course_id):
+    """Инвалидация кэша курса, его уроков и списка курсов"""
+    _bump_version(COURSE_VERSION_KEY.format(course_id=course_id))
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def bump_course_versions(course_ids):
+    """Инвалидация кэша нескольких курсов, версия каталога растет один раз"""
+    for course_id in course_ids:
+        _bump_version(COURSE_VERSION_KEY.format(course_id=course_id))
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def catalog_version():
+    """Версия каталога, меняется при любом изменении курсов и уроков"""
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def course_list_key(request):
+    version = catalog_version()
+    return f'lms:courses:v{version}:{_query_hash(request)}'
+
+
+def course_detail_key(course_id, request):
+    version = _get_version(COURSE_VERSION_KEY.format(course_id=course_id))
+    return f'lms:course:{course_id}:v{version}:{_query_hash(request)}'
+
+
+def get_response(key):
+    """Получение сохраненного ответа с учетом счетчиков попаданий"""
+    data = cache.get(key)
+    _incr_counter(MISSES_KEY if data is None else HITS_KEY)
+    record_cache_lookup(data is not None)
+    return data
+
+
+def set_response(key, data):
+    cache.set(key, data, timeout=settings.API_CACHE_TIMEOUT)
+
+
+def get_lesson_response(lesson_id, request):
+    """
+    Получение сохраненного ответа урока.
+
+    Запись хранит версию курса на момент сохранения и считается
+    промахом, если с тех пор курс или его уроки изменились.
+    """
+    entry = cache.get(f'lms:lesson:{lesson_id}:{_query_hash(request)}')
+    if entry is not None:
+        version = _get_version(COURSE_VERSION_KEY.format(course_id=entry['course']))
+        if entry['version'] != version:
+            entry = None
+    _incr_counter(MISSES_KEY if entry is None else HITS_KEY)
+    record_cache_lookup(entry is not None)
+    return entry
+
+
+def set_lesson_response(lesson, request, data):
+    version = _get_version(COURSE_VERSION_KEY.format(course_id=lesson.course_id))
+    entry = {
+        'course': lesson.course_id,
+        'owner': lesson.owner_id,
+        'version': version,
+        'data': data,
+    }
+    cache.set(
+        f'lms:lesson:{lesson.id}:{_query_hash(request)}',
+        entry,
+        timeout=settings.API_CACHE_TIMEOUT
+    )
+
+
+def overlay_is_subscribed(items, user):
+    """Проставляет флаг подписки текущего пользователя в общий ответ"""
+    from .models import Subscription
+
+    items = [item for item in items if 'is_subscribed' in item]
+    if not items:
+        return
+
+    subscribed = set()
+    if user.is_authenticated:
+        subscribed = set(
+            Subscription.objects.filter(
+                user=user,
+                course_id__in=[item['id'] for item in items],
+                is_active=True
+            ).values_list('course_id', flat=True)
+        )
+
+    for item in items:
+        item['is_subscribed'] = item['id'] in subscribed
+
+
+def get_stats():
+    """Счетчики попаданий и промахов кэша"""
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else 0.0,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,52 @@
+"""
+Условные GET-запросы (ETag / Last-Modified / 304).
+
+Валидаторы считаются дешево (один запрос или вовсе без запросов) до
+сериализации. Если клиент прислал совпадающие If-None-Match или
+If-Modified-Since, ответ 304 возвращается без построения тела.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """
+    Миксин представления для условных GET-запросов.
+
+    Представление переопределяет get_conditional_validators() и оборачивает
+    обработчик в conditional_response(). Проверка выполняется внутри
+    обработчика, то есть после аутентификации и проверки прав.
+    """
+
+    def get_conditional_validators(self, request):
+        """
+        Возвращает (части ETag, дата последнего изменения или None)
+        либо None, если объект не найден и валидаторов нет.
+        """
+        return None
+
+    def get_etag(self, request, parts):
+        # Параметры запроса (?fields=, ?expand=, курсор) меняют тело ответа
+        raw = repr((parts, request.get_full_path()))
+        return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        validators = self.get_conditional_validators(request)
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        parts, last_modified = validators
+        etag = self.get_etag(request, parts)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
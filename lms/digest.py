@@ -0,0 +1,204 @@
+"""
+Ежедневная сводка обновлений курсов.
+
+Пользователь с notification_mode = digest не получает письмо на каждое
+обновление курса, вместо этого раз в день приходит одно письмо со всеми
+обновленными курсами, на которые он подписан.
+
+Обновления копятся не по пользователям, а по курсам: sorted set Redis с
+id обновленных курсов и множество пар "курс:урок". Размер не зависит от
+числа подписчиков, запись - две команды в том же pipeline, что и отметка
+курса для обычного уведомления (lms/notifications.py).
+
+Задача send_daily_digests фиксирует накопленное за день (переименование
+ключей, новые обновления копятся уже к следующей сводке), обходит
+получателей сводки пачками по id и для каждой пачки одним запросом к
+Subscription находит их обновленные курсы. Получатели с одинаковым
+набором курсов объединяются в одно письмо outbox с общим контекстом.
+Курсор обхода сохраняется после каждой пачки: повтор задачи продолжает
+с места остановки, а ключи идемпотентности outbox не дают отправить
+сводку дважды.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .models import Outbox, Subscription
+from .outbox import email_payload, enqueue_many, max_recipients
+
+User = get_user_model()
+
+COURSES_KEY = 'lms:digest:courses'
+LESSONS_KEY = 'lms:digest:lessons'
+SNAPSHOT_COURSES_KEY = 'lms:digest:{day}:courses'
+SNAPSHOT_LESSONS_KEY = 'lms:digest:{day}:lessons'
+CURSOR_KEY = 'lms:digest:{day}:cursor'
+DONE_KEY = 'lms:digest:{day}:done'
+
+DIGEST_TEMPLATE = 'course_digest'
+# Накопленные ключи живут двое суток на случай пропуска запуска
+SNAPSHOT_TIMEOUT = 2 * 24 * 60 * 60
+
+# KEYS: накопленные курсы, уроки, снимок курсов, снимок уроков
+# Снимок создается один раз за день: повтор задачи берет тот же снимок
+SNAPSHOT_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[3])
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        redis.call('RENAME', KEYS[2], KEYS[4])
+    end
+end
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+redis.call('EXPIRE', KEYS[4], ARGV[1])
+return redis.call('EXISTS', KEYS[3])
+"""
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def record_course_update(course_id, lesson_id=None, pipe=None):
+    """
+    Отметка обновления курса для сводки.
+
+    pipe - pipeline Redis вызывающего кода, команды выполнит он.
+    """
+    own = pipe is None
+    if own:
+        pipe = _redis().pipeline()
+    pipe.zadd(cache.make_key(COURSES_KEY), {course_id: time.time()})
+    if lesson_id:
+        pipe.sadd(cache.make_key(LESSONS_KEY), f'{course_id}:{lesson_id}')
+    if own:
+        pipe.execute()
+
+
+def take_snapshot(day):
+    """
+    Фиксация обновлений для сводки за день day.
+
+    Возвращает {id курса: [id уроков]}; пустой словарь, если обновлений
+    не было.
+    """
+    client = _redis()
+    keys = [
+        cache.make_key(COURSES_KEY),
+        cache.make_key(LESSONS_KEY),
+        cache.make_key(SNAPSHOT_COURSES_KEY.format(day=day)),
+        cache.make_key(SNAPSHOT_LESSONS_KEY.format(day=day)),
+    ]
+    if not client.eval(SNAPSHOT_SCRIPT, len(keys), *keys, SNAPSHOT_TIMEOUT):
+        return {}
+
+    pipe = client.pipeline()
+    pipe.zrange(keys[2], 0, -1)
+    pipe.smembers(keys[3])
+    course_ids, pairs = pipe.execute()
+
+    updates = {int(course_id): [] for course_id in course_ids}
+    for pair in pairs:
+        course_id, lesson_id = map(int, pair.split(b':'))
+        if course_id in updates:
+            updates[course_id].append(lesson_id)
+    for lesson_ids in updates.values():
+        lesson_ids.sort()
+    return updates
+
+
+def drop_snapshot(day):
+    cache.delete_many([
+        SNAPSHOT_COURSES_KEY.format(day=day),
+        SNAPSHOT_LESSONS_KEY.format(day=day),
+        CURSOR_KEY.format(day=day),
+    ])
+
+
+def digest_batches(course_ids, after_id=0, batch_size=1000):
+    """
+    Получатели сводки пачками по курсору id.
+
+    На пачку два запроса: id получателей по частичному индексу
+    user_digest_idx и их активные подписки на обновленные курсы.
+    Генератор возвращает (id последнего пользователя, {id: [курсы]}).
+    """
+    recipients = User.objects.filter(
+        is_active=True, notification_mode=User.NotificationMode.DIGEST
+    ).exclude(email='').order_by('id')
+
+    while True:
+        user_ids = list(recipients.filter(id__gt=after_id).values_list('id', flat=True)[:batch_size])
+        if not user_ids:
+            return
+
+        courses = {}
+        subscriptions = Subscription.objects.filter(
+            user_id__in=user_ids,
+            is_active=True,
+            course_id__in=course_ids,
+        ).order_by('user_id', 'course_id').values_list('user_id', 'course_id')
+        for user_id, course_id in subscriptions:
+            courses.setdefault(user_id, []).append(course_id)
+
+        after_id = user_ids[-1]
+        yield after_id, courses
+        if len(user_ids) < batch_size:
+            return
+
+
+def build_entries(day, updates, courses_by_user, group_size):
+    """
+    Письма outbox для пачки получателей.
+
+    Получатели с одинаковым набором курсов попадают в одно письмо (не
+    больше group_size получателей и квоты отправки за раз), контекст
+    шаблона строится один раз на письмо. Ключ идемпотентности - день и
+    первый получатель.
+    """
+    group_size = max_recipients(DIGEST_TEMPLATE, group_size)
+    groups = {}
+    for user_id, course_ids in courses_by_user.items():
+        groups.setdefault(tuple(course_ids), []).append(user_id)
+
+    entries = []
+    for course_ids, user_ids in groups.items():
+        params = {'updates': [[course_id, updates[course_id]] for course_id in course_ids]}
+        for start in range(0, len(user_ids), group_size):
+            chunk = user_ids[start:start + group_size]
+            entries.append((f'digest:{day}:{chunk[0]}', email_payload(DIGEST_TEMPLATE, params, chunk)))
+    return entries
+
+
+def send_digests(day, batch_size=1000):
+    """
+    Сводка за день day: запись писем в outbox.
+
+    Возвращает количество получателей. Повторный вызов за тот же день
+    продолжает с сохраненного курсора, завершенная сводка не повторяется.
+    """
+    if cache.get(DONE_KEY.format(day=day)):
+        return 0
+
+    updates = take_snapshot(day)
+    if not updates:
+        return 0
+
+    cursor_key = CURSOR_KEY.format(day=day)
+    recipients = 0
+    for after_id, courses_by_user in digest_batches(
+        list(updates), after_id=cache.get(cursor_key, 0), batch_size=batch_size
+    ):
+        entries = build_entries(day, updates, courses_by_user, settings.DIGEST_GROUP_SIZE)
+        if entries:
+            with transaction.atomic():
+                enqueue_many(Outbox.Kind.EMAIL, entries)
+        cache.set(cursor_key, after_id, timeout=SNAPSHOT_TIMEOUT)
+        recipients += len(courses_by_user)
+
+    cache.set(DONE_KEY.format(day=day), 1, timeout=SNAPSHOT_TIMEOUT)
+    drop_snapshot(day)
+    return recipients
@@ -0,0 +1,178 @@
+"""
+Реестр шаблонов писем.
+
+Каждое письмо описывается ключом: тема, текст и HTML лежат в шаблонах
+emails/<ключ>_subject.txt, emails/<ключ>.txt и emails/<ключ>.html, а
+функция контекста превращает параметры из задачи (только id и простые
+значения) в объекты для шаблона. Шаблоны компилируются один раз на
+процесс воркера.
+
+render_messages собирает multipart-письма для пачки получателей за один
+проход: общий контекст (build_context) строится один раз, для каждого
+получателя в него добавляется только recipient. Время рендеринга одного
+письма пишется в гистограмму lms_email_render_seconds.
+"""
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.template import Context, engines
+
+from .metrics import EMAIL_RENDER_DURATION
+from .ratelimit import BULK, TRANSACTIONAL
+
+REGISTRY = {}
+
+# Адресов в письме-отчете о заблокированных пользователях
+REPORT_EMAILS_LIMIT = 100
+
+
+class EmailTemplate:
+    """Шаблон письма: тема, текст, HTML и функция контекста"""
+
+    def __init__(self, key, context=None, priority=TRANSACTIONAL):
+        self.key = key
+        self.context = context or (lambda **params: {})
+        self.priority = priority
+
+    @property
+    def subject(self):
+        return _compile(f'emails/{self.key}_subject.txt')
+
+    @property
+    def text(self):
+        return _compile(f'emails/{self.key}.txt')
+
+    @property
+    def html(self):
+        return _compile(f'emails/{self.key}.html')
+
+
+@lru_cache(maxsize=None)
+def _compile(name):
+    # Шаблон из загрузчика Django (django.template.base.Template),
+    # рендерится с готовым Context без копирования словаря
+    return engines['django'].get_template(name).template
+
+
+def register(key, priority=TRANSACTIONAL):
+    """
+    Регистрация функции контекста для шаблона письма.
+
+    priority - приоритет в ограничителе скорости (lms/ratelimit.py).
+    """
+    def decorator(func):
+        REGISTRY[key] = EmailTemplate(key, func, priority)
+        return func
+    return decorator
+
+
+def get_template(key):
+    try:
+        return REGISTRY[key]
+    except KeyError:
+        raise ValueError(f'Неизвестный шаблон письма: {key}')
+
+
+def build_context(key, params):
+    """Общий контекст письма: строится один раз на пачку получателей"""
+    return Context({
+        'frontend_url': settings.FRONTEND_URL,
+        **get_template(key).context(**params),
+    })
+
+
+def render_messages(key, context, recipients, connection=None):
+    """
+    Письма по шаблону key для пачки получателей.
+
+    context - результат build_context. recipients - словари с ключами
+    email и first_name (или объекты пользователей). Возвращает список
+    EmailMultiAlternatives.
+    """
+    template = get_template(key)
+    messages = []
+    for recipient in recipients:
+        if not isinstance(recipient, dict):
+            recipient = {'email': recipient.email, 'first_name': recipient.first_name}
+        if not recipient.get('email'):
+            continue
+
+        started = time.perf_counter()
+        with context.push(recipient=recipient):
+            subject = ' '.join(template.subject.render(context).split())
+            text = template.text.render(context)
+            html = template.html.render(context)
+        EMAIL_RENDER_DURATION.labels(key).observe(time.perf_counter() - started)
+
+        message = EmailMultiAlternatives(
+            subject=subject,
+            body=text,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[recipient['email']],
+            connection=connection,
+        )
+        message.attach_alternative(html, 'text/html')
+        messages.append(message)
+    return messages
+
+
+# Контексты шаблонов
+
+@register('course_update', priority=BULK)
+def course_update_context(course_id, lesson_ids=None):
+    from .models import Course
+
+    course = Course.objects.get(id=course_id)
+    lessons = list(course.lessons.filter(id__in=lesson_ids).order_by('id')) if lesson_ids else []
+    return {
+        'course': course,
+        'lessons': lessons,
+        'course_url': f'{settings.FRONTEND_URL}/courses/{course.id}/',
+    }
+
+
+@register('course_digest', priority=BULK)
+def course_digest_context(updates):
+    from .models import Course, Lesson
+
+    # updates: [[id курса, [id уроков]], ...]
+    lesson_ids = {course_id: set(ids) for course_id, ids in updates}
+    lessons = {}
+    for lesson in Lesson.objects.filter(
+        id__in=[lesson_id for ids in lesson_ids.values() for lesson_id in ids]
+    ).order_by('id'):
+        if lesson.id in lesson_ids.get(lesson.course_id, ()):
+            lessons.setdefault(lesson.course_id, []).append(lesson)
+
+    courses = list(Course.objects.filter(id__in=lesson_ids).order_by('title', 'id'))
+    for course in courses:
+        course.updated_lessons = lessons.get(course.id, [])
+        course.url = f'{settings.FRONTEND_URL}/courses/{course.id}/'
+    return {'courses': courses}
+
+
+@register('welcome')
+def welcome_context():
+    return {}
+
+
+@register('user_unblocked')
+def user_unblocked_context():
+    return {'login_url': f'{settings.FRONTEND_URL}/login/'}
+
+
+@register('inactive_users_report')
+def inactive_users_report_context(report_id):
+    from users.models import InactiveUsersReport
+
+    # Полный список остается в отчете, в письмо попадает начало списка
+    report = InactiveUsersReport.objects.get(id=report_id)
+    emails = list(report.users.order_by('id').values_list('email', flat=True)[:REPORT_EMAILS_LIMIT])
+    return {
+        'count': report.count,
+        'emails': emails,
+        'more': report.count - len(emails),
+        'finished_at': report.finished_at,
+    }
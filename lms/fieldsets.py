@@ -0,0 +1,84 @@
+"""
+Выборочные поля в ответах API.
+
+?fields=id,title,price оставляет в ответе только перечисленные поля,
+?expand=lessons добавляет вложенные объекты, которые по умолчанию
+не отдаются. Набор полей сериализатора затем переносится в .only()
+queryset, чтобы неиспользуемые колонки не читались из базы.
+"""
+from drf_yasg import openapi
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+fields_parameter = openapi.Parameter(
+    FIELDS_PARAM,
+    openapi.IN_QUERY,
+    description="Список полей через запятую, например id,title,price",
+    type=openapi.TYPE_STRING
+)
+
+expand_parameter = openapi.Parameter(
+    EXPAND_PARAM,
+    openapi.IN_QUERY,
+    description="Вложенные объекты через запятую, например lessons",
+    type=openapi.TYPE_STRING
+)
+
+
+def parse_field_list(value):
+    """Разбор значения вида 'id, title,price' в множество имен"""
+    if not value:
+        return set()
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Миксин сериализатора для ?fields= и ?expand=.
+
+    Поля из expandable_fields отдаются только по ?expand=.
+    Поле id остается всегда, по нему клиенты и кэш сопоставляют объекты.
+    Параметры читаются только для GET-запросов, запись работает как обычно.
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+        if request is not None and request.method == 'GET':
+            requested = parse_field_list(request.query_params.get(FIELDS_PARAM))
+            expand = parse_field_list(request.query_params.get(EXPAND_PARAM))
+        else:
+            requested, expand = set(), set()
+
+        if not requested and not self.expandable_fields:
+            return
+
+        for name in list(self.fields):
+            if name in self.expandable_fields:
+                keep = name in expand
+            else:
+                keep = not requested or name in requested or name == 'id'
+            if not keep:
+                self.fields.pop(name)
+
+
+def restrict_to_serializer(queryset, serializer, extra=()):
+    """
+    Ограничивает queryset колонками, которые читает сериализатор.
+
+    extra - поля, нужные самому представлению (например, owner для
+    проверки прав), даже если клиент их не запросил.
+    """
+    model = queryset.model
+    concrete = {field.name for field in model._meta.concrete_fields}
+    names = {model._meta.pk.name, *extra}
+
+    for field in serializer.fields.values():
+        source = field.source.split('.')[0]
+        if source in concrete:
+            names.add(source)
+
+    return queryset.only(*names)
@@ -0,0 +1,229 @@
+"""
+SMTP-бэкенд с пулом соединений.
+
+Стандартный smtp.EmailBackend открывает соединение (TCP, STARTTLS, AUTH)
+на каждый send_mail и сразу закрывает его. PooledEmailBackend - замена
+для EMAIL_BACKEND: соединения берутся из пула процесса и возвращаются в
+него вместо QUIT, поэтому рукопожатие TLS выполняется один раз на
+соединение, а не на письмо.
+
+Пул ограничен EMAIL_POOL_SIZE соединениями на процесс (для каждого
+набора host/port/логин свой пул). Соединение, простоявшее дольше
+EMAIL_POOL_CHECK_INTERVAL секунд, перед выдачей проверяется командой NOOP.
+Если сервер разорвал соединение во время отправки, письмо отправляется
+повторно через новое соединение.
+
+После fork (воркеры Celery) дочерний процесс создает свои пулы и не
+трогает сокеты родителя.
+"""
+import atexit
+import logging
+import os
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail.backends import smtp
+
+from .metrics import SMTP_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых соединение считается потерянным
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Ограниченный набор открытых SMTP-соединений"""
+
+    def __init__(self, size):
+        self.size = size
+        self.idle = []  # (соединение, время возврата в пул)
+        self.opened = 0
+        self.created = 0
+        self.reused = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, connect, timeout=None):
+        """
+        Выдача соединения: свободное из пула, новое (пока не достигнут
+        размер пула) или первое освободившееся.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            connection = None
+            with self.condition:
+                while not self.idle and self.opened >= self.size:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise smtplib.SMTPServerDisconnected(
+                            'Нет свободных SMTP-соединений в пуле'
+                        )
+                    self.condition.wait(remaining)
+                if self.idle:
+                    connection, released_at = self.idle.pop()
+                else:
+                    self.opened += 1
+
+            if connection is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    self.discard(None)
+                    raise
+                self.created += 1
+                SMTP_CONNECTIONS.labels('opened').inc()
+                return connection
+
+            if self._is_alive(connection, released_at):
+                self.reused += 1
+                SMTP_CONNECTIONS.labels('reused').inc()
+                return connection
+
+            SMTP_CONNECTIONS.labels('health_check_failed').inc()
+            self.discard(connection)
+
+    def _is_alive(self, connection, released_at):
+        if time.monotonic() - released_at < settings.EMAIL_POOL_CHECK_INTERVAL:
+            return True
+        try:
+            return connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def release(self, connection):
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        """Закрытие соединения и освобождение места в пуле"""
+        if connection is not None:
+            _close_quietly(connection)
+        with self.condition:
+            self.opened -= 1
+            self.condition.notify()
+
+    def close_idle(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+            self.condition.notify_all()
+        for connection, _ in idle:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                _close_quietly(connection)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'opened': self.opened,
+                'idle': len(self.idle),
+                'created': self.created,
+                'reused': self.reused,
+            }
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except OSError:
+        pass
+
+
+def get_pool(backend):
+    key = (os.getpid(), backend.host, backend.port, backend.username, backend.use_tls, backend.use_ssl)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(settings.EMAIL_POOL_SIZE)
+        return pool
+
+
+def pool_stats():
+    """Статистика пулов текущего процесса: {(host, port): {...}}"""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items() if key[0] == pid]
+    return {(key[1], key[2]): pool.stats() for key, pool in pools}
+
+
+@atexit.register
+def close_all():
+    """Закрытие свободных соединений (при завершении процесса и в тестах)"""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[0] == pid]
+        for key in [key for key in _pools if key[0] == pid]:
+            del _pools[key]
+    for pool in pools:
+        pool.close_idle()
+
+
+class PooledEmailBackend(smtp.EmailBackend):
+    """Замена smtp.EmailBackend, соединения переиспользуются через пул"""
+
+    def open(self):
+        if self.connection:
+            return False
+        try:
+            self.connection = get_pool(self).acquire(
+                self._connect, timeout=settings.EMAIL_POOL_TIMEOUT
+            )
+            return True
+        except OSError:
+            if not self.fail_silently:
+                raise
+
+    def _connect(self):
+        # Подключение, STARTTLS и AUTH - как в smtp.EmailBackend
+        super().open()
+        connection, self.connection = self.connection, None
+        if connection is None:
+            raise smtplib.SMTPServerDisconnected('Не удалось подключиться к SMTP-серверу')
+        return connection
+
+    def close(self):
+        """Возврат соединения в пул вместо QUIT"""
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        get_pool(self).release(connection)
+
+    def _discard(self):
+        connection, self.connection = self.connection, None
+        get_pool(self).discard(connection)
+
+    def _send(self, email_message):
+        try:
+            return self._send_once(email_message)
+        except CONNECTION_ERRORS as e:
+            # Сервер закрыл соединение между проверкой и отправкой:
+            # повторяем письмо один раз через новое соединение
+            logger.warning(f"SMTP-соединение потеряно ({e}), переподключение")
+            self._discard()
+            SMTP_CONNECTIONS.labels('reconnected').inc()
+            if not self.open():
+                return False
+            return super()._send(email_message)
+
+    def _send_once(self, email_message):
+        # Разрыв соединения нужно увидеть даже при fail_silently,
+        # остальные ошибки SMTP обрабатываются как в smtp.EmailBackend
+        fail_silently, self.fail_silently = self.fail_silently, False
+        try:
+            return super()._send(email_message)
+        except CONNECTION_ERRORS:
+            raise
+        except smtplib.SMTPException:
+            if not fail_silently:
+                raise
+            return False
+        finally:
+            self.fail_silently = fail_silently
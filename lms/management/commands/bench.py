@@ -0,0 +1,130 @@
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from config.celery import app as celery_app
+from lms import benchmark
+from payments.tasks import provision_stripe_product
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный прогон всех эндпоинтов API со сравнением с базовой линией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=50, help='Количество курсов')
+        parser.add_argument('--lessons', type=int, default=10, help='Уроков на курс')
+        parser.add_argument('--users', type=int, default=100, help='Количество пользователей')
+        parser.add_argument('--subscriptions', type=int, default=5, help='Подписок на пользователя')
+        parser.add_argument('--payments', type=int, default=3, help='Платежей на пользователя')
+        parser.add_argument('--seed', type=int, default=42, help='Seed генератора данных')
+        parser.add_argument('--requests', type=int, default=50, help='Запросов на сценарий')
+        parser.add_argument('--concurrency', type=int, default=4, help='Количество потоков')
+        parser.add_argument('--scenario', action='append', help='Запустить только эти сценарии')
+        parser.add_argument('--include-stripe', action='store_true',
+                            help='Включить сценарии, которые обращаются к Stripe API')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                            help='JSON с базовой линией для сравнения')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Сохранить результаты как новую базовую линию')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Допустимый рост медианы задержки (доля), по умолчанию 0.5')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Завершиться с ошибкой при регрессии')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять тестовую базу после прогона')
+
+    def handle(self, *args, **options):
+        scenarios = self.get_scenarios(options)
+        dataset = benchmark.Dataset(
+            courses=options['courses'],
+            lessons_per_course=options['lessons'],
+            users=options['users'],
+            subscriptions_per_user=options['subscriptions'],
+            payments_per_user=options['payments'],
+            seed=options['seed'],
+        )
+
+        for route in benchmark.uncovered_routes():
+            self.stdout.write(self.style.WARNING(f'Маршрут без сценария: {route}'))
+
+        # Прогон идет в отдельной тестовой базе с отдельным префиксом кэша;
+        # задачи Celery выполняются на месте, письма остаются в памяти.
+        # Цена курса в Stripe создается в фоне и не входит во время создания
+        # и изменения курса: эта задача не выполняется
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            with benchmark.bench_environment(keepdb=options['keepdb'], METRICS_SAMPLE_RATE=1.0), \
+                    mock.patch.object(provision_stripe_product, 'delay'):
+                results = self.run(dataset, scenarios, options)
+        finally:
+            celery_app.conf.task_always_eager = always_eager
+
+        self.report(dataset, results, options)
+
+    def get_scenarios(self, options):
+        scenarios = [
+            scenario for scenario in benchmark.SCENARIOS
+            if options['include_stripe'] or not scenario.requires_stripe
+        ]
+        if options['scenario']:
+            names = set(options['scenario'])
+            unknown = names - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+            scenarios = [scenario for scenario in scenarios if scenario.name in names]
+        return scenarios
+
+    def run(self, dataset, scenarios, options):
+        self.stdout.write('Генерация данных...')
+        ctx = benchmark.seed_dataset(dataset)
+
+        header = f'{"сценарий":<24}{"p50":>9}{"p95":>9}{"p99":>9}{"rps":>9}{"SQL":>7}{"ошибки":>8}'
+        self.stdout.write(header)
+        results = {}
+        for scenario in scenarios:
+            result = benchmark.run_scenario(
+                scenario, ctx,
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+            )
+            results[scenario.name] = result
+            queries = '-' if result['queries'] is None else result['queries']
+            line = (
+                f'{scenario.name:<24}{result["p50_ms"]:>9}{result["p95_ms"]:>9}'
+                f'{result["p99_ms"]:>9}{result["rps"]:>9}{queries:>7}{result["errors"]:>8}'
+            )
+            self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
+        return results
+
+    def report(self, dataset, results, options):
+        path = Path(options['baseline'])
+
+        if options['save_baseline']:
+            benchmark.save_baseline(path, dataset, options, results)
+            self.stdout.write(self.style.SUCCESS(f'Базовая линия сохранена в {path}'))
+            return
+
+        if not path.exists():
+            self.stdout.write(self.style.WARNING(f'Базовая линия {path} не найдена'))
+            return
+
+        baseline = benchmark.load_baseline(path)
+        if baseline['dataset'] != dataset.__dict__:
+            self.stdout.write(self.style.WARNING(
+                'Параметры данных отличаются от базовой линии, сравнение неточное'
+            ))
+
+        regressions = benchmark.compare(results, baseline['results'], tolerance=options['tolerance'])
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно базовой линии нет'))
+            return
+
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f'Регрессия: {regression}'))
+        if options['fail_on_regression']:
+            raise CommandError(f'Найдено регрессий: {len(regressions)}')
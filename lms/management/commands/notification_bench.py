@@ -0,0 +1,102 @@
+import json
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from config.celery import app as celery_app
+from lms import benchmark, mail
+from lms.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = 'Замер рассылки уведомлений: курс с N подписчиками, письма в локальный SMTP-сервер'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=1000, help='Количество подписчиков')
+        parser.add_argument('--mode', choices=['eager', 'worker'], default='eager',
+                            help='eager - задачи на месте, worker - воркер Celery в этом процессе')
+        parser.add_argument('--concurrency', type=int, default=4, help='Потоков воркера (режим worker)')
+        parser.add_argument('--chunk-size', type=int, help='NOTIFICATION_CHUNK_SIZE на время замера')
+        parser.add_argument('--smtp-delay', type=float, default=0,
+                            help='Задержка ответа SMTP-сервера на письмо, секунды')
+        parser.add_argument('--timeout', type=float, default=300, help='Ожидание доставки, секунды')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять тестовую базу после прогона')
+
+    def handle(self, *args, **options):
+        # Прогон идет в отдельной тестовой базе с отдельным префиксом кэша,
+        # письма уходят через EMAIL_BACKEND проекта в локальный SMTP-сервер
+        always_eager = celery_app.conf.task_always_eager
+        eager_propagates = celery_app.conf.task_eager_propagates
+        overrides = {}
+        if options['chunk_size']:
+            overrides['NOTIFICATION_CHUNK_SIZE'] = options['chunk_size']
+
+        try:
+            with SMTPSink(delay=options['smtp_delay']) as sink, benchmark.bench_environment(
+                keepdb=options['keepdb'],
+                EMAIL_BACKEND='lms.mail.PooledEmailBackend',
+                EMAIL_HOST=sink.host,
+                EMAIL_PORT=sink.port,
+                EMAIL_USE_TLS=False,
+                EMAIL_USE_SSL=False,
+                EMAIL_HOST_USER='',
+                EMAIL_HOST_PASSWORD='',
+                DEFAULT_FROM_EMAIL=settings.DEFAULT_FROM_EMAIL or 'lms@bench.local',
+                **overrides,
+            ):
+                self.stdout.write(f'Генерация {options["subscribers"]} подписчиков...')
+                course = benchmark.seed_subscribers(options['subscribers'])
+                with ExitStack() as stack:
+                    self.start_tasks(stack, options)
+                    result = benchmark.run_fanout(
+                        course, sink, options['subscribers'], timeout=options['timeout']
+                    )
+                mail.close_all()
+        finally:
+            celery_app.conf.task_always_eager = always_eager
+            celery_app.conf.task_eager_propagates = eager_propagates
+
+        result['mode'] = options['mode']
+        self.report(result, options)
+
+    def start_tasks(self, stack, options):
+        if options['mode'] == 'eager':
+            # Ошибка отправки прерывает замер, а не теряется в EagerResult
+            celery_app.conf.task_always_eager = True
+            celery_app.conf.task_eager_propagates = True
+            return
+
+        # Воркер в потоке этого процесса видит тестовую базу; отдельная
+        # очередь не дает воркерам проекта забрать задачи замера
+        from celery.contrib.testing.worker import start_worker
+
+        queue = f'bench-{uuid.uuid4().hex}'
+        celery_app.conf.task_always_eager = False
+        routes = celery_app.conf.task_routes
+        celery_app.conf.task_routes = {'*': {'queue': queue}}
+        stack.callback(setattr, celery_app.conf, 'task_routes', routes)
+        stack.enter_context(start_worker(
+            celery_app,
+            pool='threads',
+            concurrency=options['concurrency'],
+            queues=[queue],
+            perform_ping_check=False,
+            shutdown_timeout=options['timeout'],
+        ))
+
+    def report(self, result, options):
+        if options['json']:
+            self.stdout.write(json.dumps(result, ensure_ascii=False, sort_keys=True))
+        else:
+            for key, value in result.items():
+                self.stdout.write(f'{key:<20}{value}')
+
+        if not result['complete']:
+            raise CommandError(
+                f'Доставлено {result["delivered"]} из {result["subscribers"]} '
+                f'за {options["timeout"]} с'
+            )
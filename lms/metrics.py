@@ -0,0 +1,210 @@
+"""
+Метрики производительности запросов.
+
+Middleware (lms/middleware.py) кладет RequestMetrics в contextvar на время
+запроса. Обертка курсора, кэш ответов API и JSON-рендерер дописывают в него
+свои замеры. По завершении запроса цифры уходят в заголовок Server-Timing и
+в гистограммы Prometheus, которые отдаются по /metrics.
+
+contextvar копируется в поток sync_to_async, поэтому замеры работают и под
+WSGI, и под ASGI. Вне выборки (METRICS_SAMPLE_RATE) contextvar пуст и все
+хуки сводятся к одному ContextVar.get().
+"""
+import contextvars
+import os
+import random
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from rest_framework.renderers import JSONRenderer
+
+_current = contextvars.ContextVar('lms_request_metrics', default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUEST_DURATION = Histogram(
+    'lms_request_duration_seconds',
+    'Полное время обработки запроса',
+    ['view', 'method'],
+    buckets=LATENCY_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'lms_request_db_duration_seconds',
+    'Время SQL-запросов за один HTTP-запрос',
+    ['view'],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'lms_request_db_queries',
+    'Количество SQL-запросов за один HTTP-запрос',
+    ['view'],
+    buckets=QUERY_BUCKETS,
+)
+SERIALIZE_DURATION = Histogram(
+    'lms_request_serialize_duration_seconds',
+    'Время рендеринга ответа в JSON',
+    ['view'],
+    buckets=LATENCY_BUCKETS,
+)
+EMAIL_RENDER_DURATION = Histogram(
+    'lms_email_render_seconds',
+    'Время рендеринга одного письма (тема, текст и HTML)',
+    ['template'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+SMTP_CONNECTIONS = Counter(
+    'lms_smtp_connections_total',
+    'События пула SMTP-соединений: opened, reused, health_check_failed, reconnected',
+    ['event'],
+)
+EMAIL_RATE_LIMITED = Counter(
+    'lms_email_rate_limited_total',
+    'Отказы ограничителя скорости отправки писем (отправка отложена)',
+    ['priority'],
+)
+CACHE_LOOKUPS = Counter(
+    'lms_cache_lookups_total',
+    'Обращения к кэшу ответов API',
+    ['view', 'result'],
+)
+
+
+class RequestMetrics:
+    """Замеры одного запроса"""
+    __slots__ = ('start', 'db_queries', 'db_time', 'cache_hits', 'cache_misses', 'serialize_time')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serialize_time = 0.0
+
+    def server_timing(self, total):
+        """Значение заголовка Server-Timing (длительности в миллисекундах)"""
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'cache;desc="hits={self.cache_hits} misses={self.cache_misses}"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+    def observe(self, view, method, total):
+        REQUEST_DURATION.labels(view, method).observe(total)
+        DB_DURATION.labels(view).observe(self.db_time)
+        DB_QUERIES.labels(view).observe(self.db_queries)
+        SERIALIZE_DURATION.labels(view).observe(self.serialize_time)
+        if self.cache_hits:
+            CACHE_LOOKUPS.labels(view, 'hit').inc(self.cache_hits)
+        if self.cache_misses:
+            CACHE_LOOKUPS.labels(view, 'miss').inc(self.cache_misses)
+
+
+def sample_request():
+    """Новые замеры или None, если запрос не попал в выборку"""
+    rate = settings.METRICS_SAMPLE_RATE
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return None
+    return RequestMetrics()
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """Обертка курсора: считает запросы и их время для текущего запроса"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """Обработчик connection_created: подключает обертку к новому соединению"""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+def record_cache_lookup(hit):
+    metrics = _current.get()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer с замером времени рендеринга ответа"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            metrics.serialize_time += time.perf_counter() - start
+
+
+def _metrics_allowed(request):
+    if settings.METRICS_PUBLIC:
+        return True
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and user.is_staff)
+
+
+def metrics_view(request):
+    """
+    Экспорт метрик в текстовом формате Prometheus.
+
+    Доступ - по заголовку Authorization: Bearer <METRICS_TOKEN> или
+    сотруднику (is_staff) с сессией; METRICS_PUBLIC открывает метрики всем.
+    При нескольких процессах (gunicorn) метрики собираются из
+    PROMETHEUS_MULTIPROC_DIR. Размер очереди outbox берется из базы.
+    """
+    if not _metrics_allowed(request):
+        return HttpResponse(status=403)
+
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    # Очередь outbox считается запросом к базе в момент сбора
+    from .outbox import OutboxCollector
+
+    outbox_registry = CollectorRegistry()
+    outbox_registry.register(OutboxCollector())
+
+    output = generate_latest(registry) + generate_latest(outbox_registry)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
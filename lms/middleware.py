@@ -0,0 +1,60 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+
+class PerformanceMetricsMiddleware:
+    """
+    Замеры запроса по имени представления: SQL-запросы и их время,
+    попадания в кэш, рендеринг ответа и полное время обработки.
+
+    Результат отдается в заголовке Server-Timing и копится в гистограммах
+    Prometheus (см. lms/metrics.py). Должен стоять первым в MIDDLEWARE,
+    чтобы полное время включало остальные middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        request_metrics = metrics.sample_request()
+        if request_metrics is None:
+            return self.get_response(request)
+
+        token = metrics.activate(request_metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+        return self.finish(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        request_metrics = metrics.sample_request()
+        if request_metrics is None:
+            return await self.get_response(request)
+
+        token = metrics.activate(request_metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+        return self.finish(request, response, request_metrics)
+
+    def finish(self, request, response, request_metrics):
+        total = time.perf_counter() - request_metrics.start
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+
+        response['Server-Timing'] = request_metrics.server_timing(total)
+        request_metrics.observe(view, request.method, total)
+        return response
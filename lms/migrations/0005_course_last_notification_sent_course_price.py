@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-17 00:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0004_stripeproduct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='last_notification_sent',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='последнее уведомление отправлено'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=10, verbose_name='цена'),
+        ),
+    ]
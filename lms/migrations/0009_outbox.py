@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-17 00:58
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0008_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Outbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('email', 'письмо'), ('course_update', 'обновление курса')], max_length=32, verbose_name='тип')),
+                ('idempotency_key', models.CharField(max_length=255, unique=True, verbose_name='ключ идемпотентности')),
+                ('payload', models.JSONField(default=dict, verbose_name='данные')),
+                ('status', models.CharField(choices=[('pending', 'ожидает отправки'), ('delivered', 'отправлено'), ('failed', 'ошибка')], default='pending', max_length=16, verbose_name='статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='попыток')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='доступно для отправки с')),
+                ('last_error', models.TextField(blank=True, verbose_name='последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='отправлено')),
+            ],
+            options={
+                'verbose_name': 'исходящее уведомление',
+                'verbose_name_plural': 'исходящие уведомления',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outbox',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['available_at', 'id'], name='outbox_pending_idx'),
+        ),
+    ]
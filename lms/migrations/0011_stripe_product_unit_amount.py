@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0010_course_updated_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeproduct',
+            name='unit_amount',
+            field=models.PositiveIntegerField(default=0, verbose_name='сумма цены в Stripe (в копейках/центах)'),
+        ),
+    ]
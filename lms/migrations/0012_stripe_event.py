@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-17 01:43
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0011_stripe_product_unit_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='ID события в Stripe')),
+                ('type', models.CharField(max_length=100, verbose_name='тип')),
+                ('object_id', models.CharField(blank=True, max_length=255, verbose_name='ID объекта в Stripe')),
+                ('created', models.DateTimeField(verbose_name='создано в Stripe')),
+                ('payload', models.JSONField(verbose_name='событие')),
+                ('status', models.CharField(choices=[('pending', 'ожидает обработки'), ('processed', 'обработано'), ('dead', 'не обработано')], default='pending', max_length=16, verbose_name='статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='попыток')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='доступно для обработки с')),
+                ('last_error', models.TextField(blank=True, verbose_name='последняя ошибка')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='получено')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='обработано')),
+            ],
+            options={
+                'verbose_name': 'событие Stripe',
+                'verbose_name_plural': 'события Stripe',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created', 'id'], name='stripe_event_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['object_id', 'created', 'id'], name='stripe_event_object_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0012_stripe_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outbox',
+            name='kind',
+            field=models.CharField(choices=[('email', 'письмо'), ('course_update', 'обновление курса'), ('course_update_chunk', 'чанк рассылки по курсу')], max_length=32, verbose_name='тип'),
+        ),
+    ]
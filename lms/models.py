@@ -1,4 +1,7 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 from django.conf import settings
@@ -37,10 +40,23 @@ class Course(models.Model):
         default=0.00
     )
 
+    # Полнотекстовый индекс по title и description (см. lms/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         verbose_name = _('course')
         verbose_name_plural = _('courses')
         ordering = ['-created_at']
+        indexes = [
+            # Курсорная пагинация CoursePagination
+            models.Index(fields=['-created_at', '-id'], name='course_created_id_idx'),
+            # Выборка недавно обновленных курсов для рассылки уведомлений
+            # (курсор по (updated_at, id) в schedule_course_notifications)
+            models.Index(fields=['updated_at', 'id'], name='course_updated_idx'),
+            # Полнотекстовый поиск и автодополнение по заголовку
+            GinIndex(fields=['search_vector'], name='course_search_idx'),
+            GinIndex(fields=['title'], name='course_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.title
@@ -69,10 +85,20 @@ class Lesson(models.Model):
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
+    # Полнотекстовый индекс по title и description (см. lms/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         verbose_name = _('lesson')
         verbose_name_plural = _('lessons')
         ordering = ['created_at']
+        indexes = [
+            # Курсорная пагинация LessonPagination
+            models.Index(fields=['created_at', 'id'], name='lesson_created_id_idx'),
+            # Полнотекстовый поиск и автодополнение по заголовку
+            GinIndex(fields=['search_vector'], name='lesson_search_idx'),
+            GinIndex(fields=['title'], name='lesson_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.course.title})"
@@ -101,6 +127,16 @@ class Subscription(models.Model):
         verbose_name_plural = _('подписки')
         unique_together = ['user', 'course']  # Одна подписка на курс для пользователя
         ordering = ['-subscribed_at']
+        indexes = [
+            # Курсорная пагинация SubscriptionPagination по подпискам пользователя
+            models.Index(fields=['user', '-subscribed_at', '-id'], name='subscription_user_date_idx'),
+            # Активные подписчики курса для рассылок (частичный индекс)
+            models.Index(
+                fields=['course', 'user'],
+                name='subscription_course_active_idx',
+                condition=models.Q(is_active=True)
+            ),
+        ]
 
     def __str__(self):
         status = "активна" if self.is_active else "неактивна"
@@ -125,6 +161,8 @@ class StripeProduct(models.Model):
         max_length=100,
         unique=True
     )
+    # Цена в Stripe неизменяема: при смене цены курса создается новая
+    unit_amount = models.PositiveIntegerField(_('сумма цены в Stripe (в копейках/центах)'), default=0)
     created_at = models.DateTimeField(_('создан'), auto_now_add=True)
     updated_at = models.DateTimeField(_('обновлен'), auto_now=True)
 
@@ -136,5 +174,105 @@ class StripeProduct(models.Model):
         return f"{self.course.title} - {self.product_id}"
 
 
-class Payment:
-    pass
\ No newline at end of file
+
+class Outbox(models.Model):
+    """
+    Исходящее уведомление.
+
+    Строка пишется в той же транзакции, что и изменение, которое
+    вызвало уведомление, а отправляет ее dispatch_outbox.
+    """
+
+    class Kind(models.TextChoices):
+        EMAIL = 'email', _('письмо')
+        COURSE_UPDATE = 'course_update', _('обновление курса')
+        COURSE_UPDATE_CHUNK = 'course_update_chunk', _('чанк рассылки по курсу')
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('ожидает отправки')
+        DELIVERED = 'delivered', _('отправлено')
+        FAILED = 'failed', _('ошибка')
+
+    kind = models.CharField(_('тип'), max_length=32, choices=Kind.choices)
+    idempotency_key = models.CharField(_('ключ идемпотентности'), max_length=255, unique=True)
+    payload = models.JSONField(_('данные'), default=dict)
+    status = models.CharField(
+        _('статус'),
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    attempts = models.PositiveIntegerField(_('попыток'), default=0)
+    available_at = models.DateTimeField(_('доступно для отправки с'), default=timezone.now)
+    last_error = models.TextField(_('последняя ошибка'), blank=True)
+    created_at = models.DateTimeField(_('создано'), auto_now_add=True)
+    delivered_at = models.DateTimeField(_('отправлено'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('исходящее уведомление')
+        verbose_name_plural = _('исходящие уведомления')
+        indexes = [
+            # Очередь диспетчера и метрика бэклога (частичный индекс)
+            models.Index(
+                fields=['available_at', 'id'],
+                name='outbox_pending_idx',
+                condition=models.Q(status='pending')
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.idempotency_key} ({self.status})"
+
+
+class StripeEvent(models.Model):
+    """
+    Событие webhook Stripe.
+
+    Webhook только проверяет подпись и сохраняет событие, обрабатывает его
+    задача process_stripe_events (payments/events.py). Повторная доставка
+    того же события отсекается уникальным event_id.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('ожидает обработки')
+        PROCESSED = 'processed', _('обработано')
+        DEAD = 'dead', _('не обработано')
+
+    event_id = models.CharField(_('ID события в Stripe'), max_length=255, unique=True)
+    type = models.CharField(_('тип'), max_length=100)
+    # События одного объекта (сессии, платежа) обрабатываются по порядку
+    object_id = models.CharField(_('ID объекта в Stripe'), max_length=255, blank=True)
+    created = models.DateTimeField(_('создано в Stripe'))
+    payload = models.JSONField(_('событие'))
+    status = models.CharField(
+        _('статус'),
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    attempts = models.PositiveIntegerField(_('попыток'), default=0)
+    available_at = models.DateTimeField(_('доступно для обработки с'), default=timezone.now)
+    last_error = models.TextField(_('последняя ошибка'), blank=True)
+    received_at = models.DateTimeField(_('получено'), auto_now_add=True)
+    processed_at = models.DateTimeField(_('обработано'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('событие Stripe')
+        verbose_name_plural = _('события Stripe')
+        indexes = [
+            # Очередь обработчика (частичный индекс)
+            models.Index(
+                fields=['created', 'id'],
+                name='stripe_event_pending_idx',
+                condition=models.Q(status='pending')
+            ),
+            # Более раннее необработанное событие того же объекта
+            models.Index(
+                fields=['object_id', 'created', 'id'],
+                name='stripe_event_object_idx',
+                condition=models.Q(status='pending')
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id} ({self.status})"
@@ -0,0 +1,198 @@
+"""
+Объединение уведомлений об обновлении курсов.
+
+Сигналы не ставят задачу рассылки на каждое сохранение курса или урока:
+в той же транзакции, что и изменение, в outbox пишется уведомление по
+курсу на окно NOTIFICATION_DEBOUNCE. Повторные изменения в окне не
+добавляют строк, а дописывают id измененных уроков в уже записанное
+уведомление. Диспетчер outbox забирает его после конца окна, так что по
+курсу за окно уходит не больше одного уведомления. Пользователи,
+выбравшие ежедневную сводку, получают обновления только в ней
+(lms/digest.py).
+
+Правило "не чаще раза в 4 часа" проверяется одним условным UPDATE при
+отправке, поэтому параллельные диспетчеры не могут отправить уведомление
+по курсу дважды.
+"""
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_course_version, bump_course_versions
+from .digest import record_course_update
+from .models import Course, Outbox
+
+DISPATCH_SCHEDULED_KEY = 'lms:notifications:dispatch:{window}'
+
+# Минимальный интервал между уведомлениями по одному курсу
+NOTIFICATION_INTERVAL = timedelta(hours=4)
+
+
+def _register_sql():
+    outbox = connection.ops.quote_name(Outbox._meta.db_table)
+    # Уведомление окна уже записано: id уроков объединяются без повторов.
+    # Уже забранное диспетчером уведомление не меняется (rowcount 0)
+    return f"""
+        INSERT INTO {outbox}
+            (kind, idempotency_key, payload, status, attempts, available_at, last_error, created_at)
+        VALUES (%(kind)s, %(key)s, %(payload)s, %(status)s, 0, %(available_at)s, '', %(now)s)
+        ON CONFLICT (idempotency_key) DO UPDATE
+        SET payload = jsonb_set({outbox}.payload, '{{lesson_ids}}', (
+            SELECT coalesce(jsonb_agg(DISTINCT lesson.id ORDER BY lesson.id), '[]'::jsonb)
+            FROM jsonb_array_elements(
+                ({outbox}.payload -> 'lesson_ids') || (EXCLUDED.payload -> 'lesson_ids')
+            ) AS lesson(id)
+        ))
+        WHERE {outbox}.status = %(status)s
+    """
+
+
+def register_course_update(course_id, lesson_id=None):
+    """
+    Запись уведомления об обновлении курса в outbox.
+
+    Вызывается в транзакции изменения: уведомление сохраняется вместе с
+    ним или не сохраняется вовсе. Интервал 4 часа проверяется при
+    отправке (claim_notification). После коммита обновление учитывается
+    в ежедневной сводке и ставится диспетчер на конец окна.
+    """
+    now = timezone.now()
+    debounce = max(settings.NOTIFICATION_DEBOUNCE, 0)
+    window = int(now.timestamp()) // max(debounce, 1) * max(debounce, 1)
+    params = {
+        'kind': Outbox.Kind.COURSE_UPDATE,
+        'payload': json.dumps({
+            'course_id': course_id,
+            'lesson_ids': [lesson_id] if lesson_id else [],
+            'claim': True,
+        }),
+        'status': Outbox.Status.PENDING,
+        'now': now,
+    }
+    sql = _register_sql()
+    with connection.cursor() as cursor:
+        while True:
+            available_at = max(datetime.fromtimestamp(window + debounce, tz=now.tzinfo), now)
+            cursor.execute(sql, {
+                **params,
+                'key': f'course_update:{course_id}:window:{window}',
+                'available_at': available_at,
+            })
+            if cursor.rowcount:
+                break
+            # Уведомление окна уже забрал диспетчер - изменение уходит в следующее
+            window += max(debounce, 1)
+
+    transaction.on_commit(lambda: record_course_update(course_id, lesson_id))
+    transaction.on_commit(lambda: schedule_dispatch(window, available_at))
+
+
+def schedule_dispatch(window, available_at):
+    """Постановка диспетчера outbox на конец окна, не больше одного на окно"""
+    from .tasks import dispatch_outbox
+
+    countdown = max((available_at - timezone.now()).total_seconds(), 0)
+    if cache.add(DISPATCH_SCHEDULED_KEY.format(window=window), 1, timeout=max(int(countdown), 1)):
+        dispatch_outbox.apply_async(countdown=countdown)
+
+
+def claim_notification(course_id):
+    """
+    Резервирование уведомления по курсу.
+
+    Время последнего уведомления обновляется одним UPDATE с условием
+    на интервал, поэтому из конкурирующих вызовов успешен только один.
+    Возвращает время резервирования или None, если уведомление по курсу
+    уже отправлялось в последние 4 часа.
+    """
+    now = timezone.now()
+    claimed = Course.objects.filter(
+        Q(last_notification_sent__isnull=True) |
+        Q(last_notification_sent__lt=now - NOTIFICATION_INTERVAL),
+        id=course_id,
+    ).update(last_notification_sent=now)
+    if not claimed:
+        return None
+    bump_course_version(course_id)
+    return now
+
+
+def _claim_updated_sql():
+    course = connection.ops.quote_name(Course._meta.db_table)
+    outbox = connection.ops.quote_name(Outbox._meta.db_table)
+    # Курсор (updated_at, id) идет по индексу course_updated_idx; курс
+    # резервируется тем же UPDATE с условием на интервал (= ANY по массиву
+    # дает поиск по первичному ключу вместо hash join по всей таблице),
+    # а уведомление пишется в outbox тем же запросом
+    return f"""
+        WITH batch AS (
+            SELECT id, updated_at FROM {course}
+            WHERE (updated_at, id) > (%(after_updated)s, %(after_id)s)
+              AND updated_at <= %(until)s
+            ORDER BY updated_at, id
+            LIMIT %(limit)s
+        ), claimed AS (
+            UPDATE {course} SET last_notification_sent = %(now)s
+            WHERE id = ANY(ARRAY(SELECT id FROM batch))
+              AND (last_notification_sent IS NULL
+                   OR last_notification_sent < %(interval_start)s)
+            RETURNING id
+        ), queued AS (
+            INSERT INTO {outbox}
+                (kind, idempotency_key, payload, status, attempts, available_at, last_error, created_at)
+            SELECT
+                %(kind)s,
+                'course_update:' || id || ':' || %(now_key)s,
+                jsonb_build_object('course_id', id, 'lesson_ids', NULL),
+                %(status)s, 0, %(now)s, '', %(now)s
+            FROM claimed
+            ON CONFLICT (idempotency_key) DO NOTHING
+        )
+        SELECT batch.id, batch.updated_at, claimed.id IS NOT NULL
+        FROM batch LEFT JOIN claimed ON claimed.id = batch.id
+        ORDER BY batch.updated_at, batch.id
+    """
+
+
+def claim_updated_courses(since, until, batch_size=1000):
+    """
+    Резервирование уведомлений по всем курсам, обновленным в [since, until].
+
+    Курсы выбираются пачками по курсору (updated_at, id), каждая пачка -
+    один запрос в своей транзакции: в памяти не больше batch_size строк,
+    блокировки держатся недолго. Уведомления сразу записываются в outbox.
+    Генератор возвращает id зарезервированных курсов по пачкам.
+    """
+    now = timezone.now()
+    params = {
+        'until': until,
+        'limit': batch_size,
+        'now': now,
+        'now_key': now.isoformat(),
+        'interval_start': now - NOTIFICATION_INTERVAL,
+        'kind': Outbox.Kind.COURSE_UPDATE,
+        'status': Outbox.Status.PENDING,
+    }
+    # Курсор стоит перед первым курсом с updated_at = since (id > 0)
+    after_updated, after_id = since, 0
+    sql = _claim_updated_sql()
+
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, {**params, 'after_updated': after_updated, 'after_id': after_id})
+            rows = cursor.fetchall()
+            claimed = [course_id for course_id, _, is_claimed in rows if is_claimed]
+            if claimed:
+                bump_course_versions(claimed)
+
+        if claimed:
+            yield claimed
+        if len(rows) < batch_size:
+            break
+        after_id, after_updated = rows[-1][0], rows[-1][1]
+
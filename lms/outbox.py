@@ -0,0 +1,266 @@
+"""
+Outbox уведомлений.
+
+Уведомление записывается в таблицу Outbox в той же транзакции, что и
+изменение, которое его вызвало, поэтому не теряется при падении воркера
+или очистке Redis. Задача dispatch_outbox забирает пачки строк через
+SELECT ... FOR UPDATE SKIP LOCKED (несколько диспетчеров не мешают друг
+другу), отправляет их и отмечает доставленными.
+
+Доставка "хотя бы один раз": если процесс упадет между отправкой и
+отметкой, строка будет отправлена повторно. Повторная запись того же
+уведомления отсекается уникальным ключом идемпотентности.
+
+Рассылку по курсу диспетчер передает задачам Celery: строка остается в
+очереди, пока задача не отметит ее сама (complete), а потерянную задачу
+диспетчер запустит заново через OUTBOX_TASK_TIMEOUT. Задача разбивки
+рассылки пишет в outbox чанки подписчиков, поэтому уведомление по курсу
+закрыто, только когда каждый чанк отправлен.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from prometheus_client.core import GaugeMetricFamily
+
+from .emails import build_context, get_template, render_messages
+from .models import Outbox
+from .ratelimit import RateLimited, acquire, max_grant
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Задержка повторной отправки: 30 с, 1 мин, 2 мин ... но не больше часа
+RETRY_DELAY = timedelta(seconds=30)
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+
+class Undeliverable(Exception):
+    """Уведомление не может быть отправлено никогда, повтор бессмыслен"""
+
+
+class InProgress(Exception):
+    """Уведомление отправляет задача Celery, строку отметит она сама"""
+
+
+def enqueue(kind, idempotency_key, payload):
+    """
+    Запись уведомления в outbox.
+
+    Вызывается внутри транзакции изменения. Уведомление с уже записанным
+    ключом игнорируется. После коммита ставится задача диспетчера, чтобы
+    не ждать следующего запуска по расписанию.
+    """
+    enqueue_many(kind, [(idempotency_key, payload)])
+
+
+def enqueue_many(kind, entries, batch_size=1000):
+    """Запись пачки уведомлений [(ключ, payload), ...] одним INSERT"""
+    Outbox.objects.bulk_create(
+        [Outbox(kind=kind, idempotency_key=key, payload=payload) for key, payload in entries],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+    from .tasks import dispatch_outbox
+
+    transaction.on_commit(dispatch_outbox.delay)
+
+
+def email_payload(template, params, user_ids):
+    """
+    Payload письма в outbox.
+
+    Хранятся только ключ шаблона, его параметры и id получателей;
+    письмо рендерится при отправке (lms/emails.py).
+    """
+    return {'template': template, 'params': params, 'user_ids': list(user_ids)}
+
+
+def max_recipients(template, limit=None):
+    """
+    Сколько получателей можно записать в одно письмо outbox.
+
+    Письмо уходит целиком, поэтому получателей не больше квоты, которую
+    приоритет шаблона получает за раз (ratelimit.max_grant), и не больше
+    limit. None - ограничения нет.
+    """
+    sizes = [size for size in (limit, max_grant(get_template(template).priority)) if size is not None]
+    return max(min(sizes), 1) if sizes else None
+
+
+def enqueue_email(idempotency_key, template, params, user_ids):
+    """Запись письма в outbox"""
+    enqueue(Outbox.Kind.EMAIL, idempotency_key, email_payload(template, params, user_ids))
+
+
+def claim_batch(batch_size):
+    """
+    Блокировка пачки готовых к отправке строк.
+
+    Должна вызываться в транзакции: строки, заблокированные другим
+    диспетчером, пропускаются.
+    """
+    return list(
+        Outbox.objects.select_for_update(skip_locked=True)
+        .filter(status=Outbox.Status.PENDING, available_at__lte=timezone.now())
+        .order_by('available_at', 'id')[:batch_size]
+    )
+
+
+def _send_email(entry, connection):
+    payload = entry.payload
+    template = payload['template']
+    recipients = User.objects.filter(id__in=payload['user_ids']).values('email', 'first_name')
+    messages = render_messages(
+        template, build_context(template, payload['params']), recipients, connection
+    )
+    # Письмо уходит целиком или откладывается: частичная отправка
+    # привела бы к повтору уже полученных писем. Письмо больше квоты,
+    # которую можно получить за раз, не дождется ее никогда
+    priority = get_template(template).priority
+    limit = max_grant(priority)
+    if limit is not None and len(messages) > limit:
+        raise Undeliverable(
+            f'{len(messages)} получателей больше квоты отправки за раз ({limit}, {priority})'
+        )
+    granted, retry_after = acquire(priority, len(messages))
+    if granted < len(messages):
+        raise RateLimited(retry_after)
+    connection.send_messages(messages)
+
+
+def _hand_over(entry, task, *args):
+    """
+    Передача уведомления задаче Celery.
+
+    Задача ставится после коммита пачки, ее id привязан к строке:
+    повторная передача продолжит отправку с сохраненного прогресса,
+    а не начнет ее заново.
+    """
+    transaction.on_commit(lambda: task.apply_async(
+        args=args, kwargs={'outbox_id': entry.id}, task_id=f'outbox-{entry.id}'
+    ))
+    raise InProgress
+
+
+def _send_course_update(entry, connection):
+    from .notifications import claim_notification
+    from .tasks import send_course_update_notification
+
+    payload = entry.payload
+    # Уведомление, записанное при изменении курса, резервирует интервал
+    # 4 часа при отправке; периодическая проверка резервирует его сама
+    if payload.get('claim') and claim_notification(payload['course_id']) is None:
+        return
+    _hand_over(entry, send_course_update_notification, payload['course_id'], payload.get('lesson_ids') or None)
+
+
+def _send_course_update_chunk(entry, connection):
+    from .tasks import send_course_update_chunk
+
+    payload = entry.payload
+    _hand_over(
+        entry, send_course_update_chunk,
+        payload['template'], payload['course_id'], payload['after_id'], payload['up_to_id'],
+        payload['lesson_ids'],
+    )
+
+
+def complete(outbox_id):
+    """Отметка уведомления, которое отправила задача Celery"""
+    if outbox_id is not None:
+        Outbox.objects.filter(id=outbox_id, status=Outbox.Status.PENDING).update(
+            status=Outbox.Status.DELIVERED, delivered_at=timezone.now(), last_error=''
+        )
+
+
+def postpone(outbox_id, seconds):
+    """Задача Celery отложила отправку: диспетчер не запускает ее заново раньше времени"""
+    if outbox_id is not None:
+        Outbox.objects.filter(id=outbox_id, status=Outbox.Status.PENDING).update(
+            available_at=timezone.now() + timedelta(seconds=seconds + settings.OUTBOX_TASK_TIMEOUT)
+        )
+
+
+HANDLERS = {
+    Outbox.Kind.EMAIL: _send_email,
+    Outbox.Kind.COURSE_UPDATE: _send_course_update,
+    Outbox.Kind.COURSE_UPDATE_CHUNK: _send_course_update_chunk,
+}
+
+
+def deliver(entries):
+    """
+    Отправка пачки уведомлений через одно SMTP-соединение.
+
+    Ошибка отдельного уведомления откладывает его повтор с растущей
+    задержкой, после OUTBOX_MAX_ATTEMPTS попыток оно помечается как
+    ошибочное. Письмо, на которое не хватило квоты отправки, откладывается
+    до ее восстановления без расхода попытки, а письмо, которое в квоту
+    не помещается, сразу помечается ошибочным. Уведомление, переданное
+    задаче Celery, ждет ее отметки. Возвращает количество доставленных
+    уведомлений.
+    """
+    delivered = 0
+    with get_connection() as connection:
+        for entry in entries:
+            now = timezone.now()
+            entry.attempts += 1
+            if entry.attempts > settings.OUTBOX_MAX_ATTEMPTS:
+                # Задача, которой передавалось уведомление, так и не отметила его
+                logger.error(f"Уведомление {entry.idempotency_key} не отправлено задачей")
+                entry.last_error = entry.last_error or 'задача не отметила отправку'
+                entry.status = Outbox.Status.FAILED
+                continue
+            try:
+                HANDLERS[entry.kind](entry, connection)
+            except InProgress:
+                entry.available_at = now + timedelta(seconds=settings.OUTBOX_TASK_TIMEOUT)
+            except RateLimited as e:
+                entry.attempts -= 1
+                entry.available_at = now + timedelta(seconds=e.retry_after)
+            except Undeliverable as e:
+                logger.error(f"Уведомление {entry.idempotency_key} не может быть отправлено: {e}")
+                entry.last_error = str(e)
+                entry.status = Outbox.Status.FAILED
+            except Exception as e:
+                logger.warning(f"Уведомление {entry.idempotency_key} не отправлено: {e}")
+                entry.last_error = str(e)
+                entry.available_at = now + min(RETRY_DELAY * 2 ** (entry.attempts - 1), MAX_RETRY_DELAY)
+                if entry.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    entry.status = Outbox.Status.FAILED
+            else:
+                entry.status = Outbox.Status.DELIVERED
+                entry.delivered_at = now
+                entry.last_error = ''
+                delivered += 1
+
+    Outbox.objects.bulk_update(
+        entries, ['status', 'attempts', 'available_at', 'delivered_at', 'last_error']
+    )
+    return delivered
+
+
+class OutboxCollector:
+    """Размер и возраст очереди outbox для /metrics, считается при сборе метрик"""
+
+    def collect(self):
+        pending = Outbox.objects.filter(status=Outbox.Status.PENDING)
+        stats = pending.aggregate(oldest=Min('available_at'))
+        oldest = stats['oldest']
+        age = max((timezone.now() - oldest).total_seconds(), 0) if oldest else 0
+
+        yield GaugeMetricFamily(
+            'lms_outbox_pending', 'Уведомления, ожидающие отправки', value=pending.count()
+        )
+        yield GaugeMetricFamily(
+            'lms_outbox_oldest_pending_seconds',
+            'Сколько ждет самое старое готовое к отправке уведомление',
+            value=age,
+        )
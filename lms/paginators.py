@@ -1,22 +1,84 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
+from .search import SEARCH_RANK
 
-class CoursePagination(PageNumberPagination):
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация.
+
+    Страница выбирается условием по индексированным колонкам из ordering,
+    без COUNT(*) и OFFSET, поэтому дальние страницы не медленнее первых.
+    Клиенты, которые передают ?page=, по-прежнему получают постраничную
+    выдачу с номерами страниц.
+    """
+    page_size_query_param = 'page_size'
+    legacy_page_query_param = 'page'
+
+    def get_ordering(self, request, queryset, view):
+        # Результаты полнотекстового поиска идут по убыванию релевантности
+        if SEARCH_RANK in queryset.query.annotations:
+            return ('-' + SEARCH_RANK, '-id')
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.legacy_paginator = None
+        if self.legacy_page_query_param in request.query_params:
+            self.legacy_paginator = self.get_legacy_paginator()
+            queryset = queryset.order_by(*self.get_ordering(request, queryset, view))
+            return self.legacy_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.legacy_paginator is not None:
+            return self.legacy_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_legacy_paginator(self):
+        """Постраничная пагинация с теми же размерами страниц"""
+        paginator = PageNumberPagination()
+        paginator.page_size = self.page_size
+        paginator.page_query_param = self.legacy_page_query_param
+        paginator.page_size_query_param = self.page_size_query_param
+        paginator.max_page_size = self.max_page_size
+        return paginator
+
+
+class CoursePagination(KeysetPagination):
     """Пагинация для курсов"""
     page_size = 10  # Количество элементов на странице по умолчанию
     page_size_query_param = 'page_size'  # Параметр для изменения размера страницы
     max_page_size = 50  # Максимальный размер страницы
+    ordering = ('-created_at', '-id')
 
 
-class LessonPagination(PageNumberPagination):
+class LessonPagination(KeysetPagination):
     """Пагинация для уроков"""
     page_size = 15
     page_size_query_param = 'page_size'
     max_page_size = 100
+    ordering = ('created_at', 'id')
 
 
-class SubscriptionPagination(PageNumberPagination):
+class SubscriptionPagination(KeysetPagination):
     """Пагинация для подписок"""
     page_size = 20
     page_size_query_param = 'limit'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+    ordering = ('-subscribed_at', '-id')
+
+
+class PaymentPagination(KeysetPagination):
+    """Пагинация для платежей"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-payment_date', '-id')
+
+
+class SearchPagination(KeysetPagination):
+    """Пагинация для результатов поиска"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = ('-' + SEARCH_RANK, '-id')
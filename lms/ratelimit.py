@@ -0,0 +1,195 @@
+"""
+Ограничение скорости отправки писем, общее для всех воркеров.
+
+Квоты SMTP-провайдера (писем в секунду и в сутки) считаются в Redis:
+token bucket пополняется со скоростью EMAIL_RATE_LIMIT писем в секунду
+до EMAIL_RATE_BURST, суточный счетчик ограничен EMAIL_DAILY_LIMIT.
+Проверка и списание выполняются одним Lua-скриптом по часам Redis,
+поэтому воркеры на разных машинах не могут вместе превысить квоту.
+
+Приоритеты: для каждого приоритета в EMAIL_RATE_PRIORITIES задана доля
+квоты, которую он не может занять. Массовые рассылки (bulk) оставляют
+запас, который расходуют только транзакционные письма (приветствие,
+разблокировка), поэтому они уходят даже во время большой рассылки.
+
+Если токенов нет, вызывающий код откладывает отправку на retry_after
+секунд вместо ошибки (defer_task).
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from .metrics import EMAIL_RATE_LIMITED
+
+TRANSACTIONAL = 'transactional'
+BULK = 'bulk'
+
+BUCKET_KEY = 'lms:email:bucket'
+DAILY_KEY = 'lms:email:daily:{day}'
+
+# KEYS: bucket, суточный счетчик
+# ARGV: скорость, емкость, запрошено, минимум, запас в bucket,
+#       суточный лимит, запас суточного лимита, TTL суточного счетчика
+# Возвращает {выдано, через сколько секунд повторить (-1 - завтра)};
+# при частичной выдаче - когда будет доступен следующий токен
+ACQUIRE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local minimum = tonumber(ARGV[4])
+local reserve = tonumber(ARGV[5])
+local daily_limit = tonumber(ARGV[6])
+local daily_reserve = tonumber(ARGV[7])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local granted = requested
+local tokens = burst
+if rate > 0 then
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    granted = math.min(granted, math.floor(tokens - reserve))
+end
+
+local daily_left = nil
+if daily_limit > 0 then
+    local used = tonumber(redis.call('GET', KEYS[2]) or '0')
+    daily_left = daily_limit - daily_reserve - used
+    granted = math.min(granted, math.floor(daily_left))
+end
+
+if granted < minimum then
+    if daily_left ~= nil and daily_left < minimum then
+        return {0, '-1'}
+    end
+    local wait = (minimum + reserve - tokens) / rate
+    return {0, tostring(wait)}
+end
+
+if rate > 0 then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - granted), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+end
+if daily_limit > 0 then
+    redis.call('INCRBY', KEYS[2], granted)
+    redis.call('EXPIRE', KEYS[2], ARGV[8])
+end
+
+-- Выдана часть запроса: когда можно будет получить следующий токен
+if granted < requested then
+    if daily_left ~= nil and daily_left - granted < 1 then
+        return {granted, '-1'}
+    end
+    return {granted, tostring((1 + reserve - (tokens - granted)) / rate)}
+end
+return {granted, '0'}
+"""
+
+_script = None
+
+
+class RateLimited(Exception):
+    """Квота исчерпана, повторить через retry_after секунд"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Квота отправки писем исчерпана, повтор через {retry_after:.1f} с')
+        self.retry_after = retry_after
+
+
+def is_enabled():
+    return settings.EMAIL_RATE_LIMIT > 0 or settings.EMAIL_DAILY_LIMIT > 0
+
+
+def max_grant(priority):
+    """
+    Наибольшее число писем, которое приоритет может получить одним acquire.
+
+    В bucket не бывает больше EMAIL_RATE_BURST токенов, а запас для других
+    приоритетов недоступен; так же и с суточным лимитом. Запрос больше
+    этого числа не будет выполнен никогда. None - ограничения нет.
+    """
+    if not is_enabled():
+        return None
+
+    share = settings.EMAIL_RATE_PRIORITIES.get(priority, 0)
+    limits = []
+    if settings.EMAIL_RATE_LIMIT > 0:
+        burst = max(settings.EMAIL_RATE_BURST, 1)
+        limits.append(math.floor(burst - burst * share))
+    if settings.EMAIL_DAILY_LIMIT > 0:
+        limits.append(settings.EMAIL_DAILY_LIMIT - math.floor(settings.EMAIL_DAILY_LIMIT * share))
+    return max(min(limits), 0)
+
+
+def _seconds_until_tomorrow(now):
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+
+def acquire(priority, requested=1, minimum=None):
+    """
+    Получение до requested токенов на отправку писем.
+
+    Токены выдаются, только если доступно не меньше minimum (по
+    умолчанию все requested). Возвращает (выдано, retry_after): при
+    отказе выдано 0, а retry_after - сколько секунд ждать; при частичной
+    выдаче retry_after - когда можно будет получить следующий токен.
+    """
+    minimum = requested if minimum is None else minimum
+    if not is_enabled() or requested <= 0:
+        return requested, 0
+
+    global _script
+    client = get_redis_connection('default')
+    if _script is None:
+        _script = client.register_script(ACQUIRE_SCRIPT)
+
+    share = settings.EMAIL_RATE_PRIORITIES.get(priority, 0)
+    burst = max(settings.EMAIL_RATE_BURST, 1)
+    now = datetime.now(dt_timezone.utc)
+    granted, retry_after = _script(
+        keys=[
+            cache.make_key(BUCKET_KEY),
+            cache.make_key(DAILY_KEY.format(day=now.strftime('%Y%m%d'))),
+        ],
+        args=[
+            settings.EMAIL_RATE_LIMIT,
+            burst,
+            requested,
+            minimum,
+            burst * share,
+            settings.EMAIL_DAILY_LIMIT,
+            math.floor(settings.EMAIL_DAILY_LIMIT * share),
+            2 * 24 * 60 * 60,
+        ],
+        client=client,
+    )
+
+    granted = int(granted)
+    retry_after = float(retry_after)
+    if retry_after < 0:
+        retry_after = _seconds_until_tomorrow(now)
+    if not granted:
+        EMAIL_RATE_LIMITED.labels(priority).inc()
+    return granted, retry_after
+
+
+def defer_task(task, countdown):
+    """
+    Повторная постановка задачи с тем же id через countdown секунд.
+
+    В отличие от retry() не расходует попытки: ожидание квоты - не ошибка.
+    Прогресс, сохраненный по id задачи, продолжает действовать.
+    """
+    task.apply_async(
+        args=task.request.args,
+        kwargs=task.request.kwargs,
+        task_id=task.request.id,
+        countdown=math.ceil(countdown),
+    )
@@ -0,0 +1,82 @@
+"""
+Полнотекстовый и нечеткий поиск по курсам и урокам (PostgreSQL).
+
+Заголовок и описание хранятся в колонке search_vector (tsvector) с
+GIN-индексом и обновляются сигналом при сохранении объекта. Для
+автодополнения используется триграммный GIN-индекс по заголовку.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from drf_yasg import openapi
+from rest_framework.filters import BaseFilterBackend
+
+SEARCH_PARAM = 'search'
+SEARCH_RANK = 'search_rank'
+
+search_parameter = openapi.Parameter(
+    SEARCH_PARAM,
+    openapi.IN_QUERY,
+    description="Полнотекстовый поиск по названию и описанию",
+    type=openapi.TYPE_STRING
+)
+
+
+def build_search_vector():
+    """Вектор для колонки search_vector: заголовок важнее описания"""
+    config = settings.SEARCH_CONFIG
+    return (
+        SearchVector('title', weight='A', config=config)
+        + SearchVector('description', weight='B', config=config)
+    )
+
+
+def update_search_vector(instance):
+    """Пересчет search_vector одной строки без повторного вызова сигналов"""
+    type(instance).objects.filter(pk=instance.pk).update(
+        search_vector=build_search_vector()
+    )
+
+
+def search(queryset, text):
+    """Фильтр по индексу search_vector с аннотацией релевантности"""
+    query = SearchQuery(text, search_type='websearch', config=settings.SEARCH_CONFIG)
+    # ts_rank возвращает real; приведение к double precision нужно, чтобы
+    # значение из курсора пагинации сравнивалось с рангом без потери точности
+    rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+    return queryset.filter(search_vector=query).annotate(**{SEARCH_RANK: rank})
+
+
+def autocomplete(queryset, text, limit=10):
+    """Нечеткий поиск по началу слов заголовка (триграммный индекс)"""
+    return queryset.filter(title__trigram_word_similar=text).annotate(
+        similarity=TrigramWordSimilarity(text, 'title')
+    ).order_by('-similarity', 'id')[:limit]
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Фильтр ?search= для представлений курсов и уроков.
+
+    Результаты упорядочиваются по релевантности, KeysetPagination
+    переключается на курсор по (search_rank, id).
+    """
+
+    def get_search_text(self, request):
+        return request.query_params.get(SEARCH_PARAM, '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        text = self.get_search_text(request)
+        if not text:
+            return queryset
+        return search(queryset, text)
+
+    def get_schema_fields(self, view):
+        # Параметр описан в manual_parameters через search_parameter
+        return []
@@ -2,14 +2,15 @@ from rest_framework import serializers
 from .models import Course, Lesson
 # НЕ импортируйте Subscription здесь, импортируйте внутри класса если нужно
 from .validators import YouTubeURLValidator, validate_youtube_url
+from .fieldsets import SparseFieldsMixin
 
 
-class LessonSerializer(serializers.ModelSerializer):
+class LessonSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для урока"""
 
     class Meta:
         model = Lesson
-        fields = '__all__'
+        exclude = ('search_vector',)
         read_only_fields = ('created_at', 'updated_at', 'owner')
         # Используем валидатор (можно использовать класс или функцию)
         validators = [
@@ -30,22 +31,30 @@ class LessonSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для курса"""
     lessons_count = serializers.SerializerMethodField()
     lessons = LessonSerializer(many=True, read_only=True)
     is_subscribed = serializers.SerializerMethodField()
 
+    # Уроки отдаются только по ?expand=lessons
+    expandable_fields = ('lessons',)
+
     class Meta:
         model = Course
-        fields = '__all__'
+        exclude = ('search_vector',)
         read_only_fields = ('created_at', 'updated_at', 'owner')
 
     def get_lessons_count(self, obj):
+        # Аннотация из CourseViewSet.get_queryset, иначе отдельный запрос
+        if hasattr(obj, 'lessons_count'):
+            return obj.lessons_count
         return obj.lessons.count()
 
     def get_is_subscribed(self, obj):
         """Проверяем подписан ли текущий пользователь на курс"""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             # Импортируем здесь чтобы избежать циклического импорта
@@ -64,6 +73,30 @@ class CourseSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class CourseSearchSerializer(serializers.ModelSerializer):
+    """Сериализатор для результатов поиска курсов"""
+    rank = serializers.FloatField(source='search_rank', read_only=True)
+
+    class Meta:
+        model = Course
+        fields = ['id', 'title', 'price', 'rank']
+
+
+class LessonSearchSerializer(serializers.ModelSerializer):
+    """Сериализатор для результатов поиска уроков"""
+    rank = serializers.FloatField(source='search_rank', read_only=True)
+
+    class Meta:
+        model = Lesson
+        fields = ['id', 'title', 'course', 'rank']
+
+
+class AutocompleteSerializer(serializers.Serializer):
+    """Сериализатор для подсказок автодополнения"""
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+
+
 class SubscriptionSerializer(serializers.ModelSerializer):
     """Сериализатор для подписки"""
 
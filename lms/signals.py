@@ -1,52 +1,77 @@
-from django.conf import settings
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from datetime import timedelta
 
+from .cache import bump_course_version
+from .digest import record_course_update
 from .models import Course, Lesson
-from .tasks import send_course_update_notification
+from .notifications import NOTIFICATION_INTERVAL, register_course_update
+from .search import update_search_vector
+
+
+def invalidate_course_cache(course_id):
+    """
+    Увеличение версии курса в кэше.
+
+    Версия увеличивается сразу и повторно после коммита транзакции,
+    чтобы ответ, собранный параллельным запросом по еще не
+    закоммиченным данным, не остался в кэше под новой версией.
+    """
+    bump_course_version(course_id)
+    transaction.on_commit(lambda: bump_course_version(course_id))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_cache_handler(sender, instance, **kwargs):
+    """Инвалидация кэша при изменении или удалении курса"""
+    invalidate_course_cache(instance.id)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def lesson_cache_handler(sender, instance, **kwargs):
+    """Инвалидация кэша курса при изменении или удалении урока"""
+    if instance.course_id:
+        invalidate_course_cache(instance.course_id)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lesson)
+def search_vector_handler(sender, instance, update_fields=None, **kwargs):
+    """Обновление поискового индекса при изменении заголовка или описания"""
+    if update_fields is None or {'title', 'description'} & set(update_fields):
+        update_search_vector(instance)
 
 
 @receiver(post_save, sender=Course)
 def course_updated_handler(sender, instance, created, **kwargs):
     """
-    Отправка уведомлений при обновлении курса
+    Запись уведомления об обновлении курса.
+
+    Уведомление пишется в outbox в той же транзакции, несколько
+    сохранений курса в одном окне дают одно уведомление.
     """
     if not created:  # Только при обновлении, не при создании
-        four_hours_ago = timezone.now() - timedelta(hours=4)
+        four_hours_ago = timezone.now() - NOTIFICATION_INTERVAL
 
-        # Проверяем, что уведомление не отправлялось за последние 4 часа
+        # Окончательно интервал проверяется при отправке, здесь только
+        # отсекаются заведомо лишние уведомления
+        course_id = instance.id
         if not instance.last_notification_sent or \
                 instance.last_notification_sent < four_hours_ago:
-            # Запускаем асинхронную задачу
-            send_course_update_notification.delay(instance.id)
+            register_course_update(course_id)
+        else:
+            # Интервал 4 часа не касается ежедневной сводки
+            transaction.on_commit(lambda: record_course_update(course_id))
 
 
 @receiver(post_save, sender=Lesson)
 def lesson_updated_handler(sender, instance, created, **kwargs):
     """
-    Отправка уведомлений при обновлении урока
+    Запись уведомления об обновлении курса при обновлении урока
     (Дополнительное задание)
     """
-    if not created and instance.course:
-        four_hours_ago = timezone.now() - timedelta(hours=4)
-        course = instance.course
-
-        # Проверяем, что уведомление не отправлялось за последние 4 часа
-        if not course.last_notification_sent or \
-                course.last_notification_sent < four_hours_ago:
-            message = f"""
-            Добрый день!
-
-            В курсе "{course.title}" был обновлен урок "{instance.title}".
-
-            Новые материалы уже доступны в вашем личном кабинете.
-
-            Ссылка на курс: {settings.FRONTEND_URL}/courses/{course.id}/
-
-            С уважением,
-            Команда LMS платформы
-            """
-
-            send_course_update_notification.delay(course.id, message)
\ No newline at end of file
+    if not created and instance.course_id:
+        register_course_update(instance.course_id, instance.id)
@@ -0,0 +1,201 @@
+"""
+Локальный SMTP-сервер для замеров и тестов рассылки.
+
+Принимает письма по SMTP (без TLS и авторизации), считает их и при
+необходимости сохраняет. Работает на asyncio в отдельном потоке, поэтому
+запускается рядом с кодом, который отправляет письма через обычный
+EMAIL_BACKEND:
+
+    with SMTPSink() as sink:
+        with override_settings(EMAIL_HOST=sink.host, EMAIL_PORT=sink.port, EMAIL_USE_TLS=False):
+            ...
+        sink.wait_for(100)
+
+Время приема каждого письма (time.monotonic) позволяет посчитать
+пропускную способность и время до последней доставки.
+"""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+
+# Ограничение размера письма, которое сервер объявляет в EHLO
+MAX_MESSAGE_SIZE = 10 * 1024 * 1024
+
+
+@dataclass
+class ReceivedMessage:
+    """Принятое письмо"""
+    sender: str
+    recipients: list
+    data: bytes
+    received_at: float
+
+
+class SMTPSink:
+    """
+    SMTP-сервер, который принимает все письма.
+
+    port=0 - свободный порт, выбранный системой (атрибут port после
+    start). store=False - письма только считаются, без хранения текста.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, store=False, delay=0):
+        self.host = host
+        self.port = port
+        self.store = store
+        # Задержка ответа на DATA, имитирует медленный сервер провайдера
+        self.delay = delay
+        self.messages = []
+        self.count = 0
+        self.recipients = 0
+        self.connections = 0
+        self.first_at = None
+        self.last_at = None
+        self._condition = threading.Condition()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._writers = set()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port)
+                )
+            except OSError as e:
+                errors.append(e)
+                started.set()
+                self._loop.close()
+                return
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            try:
+                self._loop.run_forever()
+            finally:
+                # Открытые соединения клиентов (например, в пуле SMTP)
+                # закрываются, чтобы клиент не ждал ответа остановленного сервера
+                self._server.close()
+                for writer in list(self._writers):
+                    writer.close()
+                self._loop.run_until_complete(self._server.wait_closed())
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        with self._condition:
+            self.messages = []
+            self.count = 0
+            self.recipients = 0
+            self.connections = 0
+            self.first_at = None
+            self.last_at = None
+
+    def wait_for(self, count, timeout=None):
+        """Ожидание count принятых писем, возвращает True, если дождались"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.count >= count, timeout)
+
+    def _received(self, sender, recipients, data):
+        now = time.monotonic()
+        with self._condition:
+            self.count += 1
+            self.recipients += len(recipients)
+            if self.first_at is None:
+                self.first_at = now
+            self.last_at = now
+            if self.store:
+                self.messages.append(ReceivedMessage(sender, recipients, data, now))
+            self._condition.notify_all()
+
+    async def _handle(self, reader, writer):
+        with self._condition:
+            self.connections += 1
+        self._writers.add(writer)
+
+        async def reply(line):
+            writer.write(line.encode() + b'\r\n')
+            await writer.drain()
+
+        sender, recipients = None, []
+        await reply('220 smtp-sink ESMTP')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode('utf-8', 'replace').strip().partition(' ')
+                command = command.upper()
+
+                if command == 'EHLO':
+                    writer.write(f'250-smtp-sink\r\n250-SIZE {MAX_MESSAGE_SIZE}\r\n250 8BITMIME\r\n'.encode())
+                    await writer.drain()
+                elif command == 'HELO':
+                    await reply('250 smtp-sink')
+                elif command == 'MAIL':
+                    sender, recipients = argument.partition(':')[2].split(' ')[0].strip('<>'), []
+                    await reply('250 OK')
+                elif command == 'RCPT':
+                    recipients.append(argument.partition(':')[2].strip().strip('<>'))
+                    await reply('250 OK')
+                elif command == 'DATA':
+                    if not recipients:
+                        await reply('503 No valid recipients')
+                        continue
+                    await reply('354 End data with <CR><LF>.<CR><LF>')
+                    data = await self._read_data(reader)
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    self._received(sender, recipients, data)
+                    sender, recipients = None, []
+                    await reply('250 OK')
+                elif command == 'RSET':
+                    sender, recipients = None, []
+                    await reply('250 OK')
+                elif command == 'NOOP':
+                    await reply('250 OK')
+                elif command == 'QUIT':
+                    await reply('221 Bye')
+                    break
+                else:
+                    await reply('502 Command not implemented')
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _read_data(self, reader):
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line or line == b'.\r\n':
+                break
+            if line.startswith(b'..'):
+                line = line[1:]
+            lines.append(line)
+        return b''.join(lines) if self.store else b''
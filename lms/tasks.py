@@ -1,104 +1,222 @@
-from celery import shared_task
-from django.core.mail import send_mail
+from celery import group, shared_task
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.mail import get_connection
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 import logging
+import math
+import smtplib
 
-from .models import Course, Subscription
+from . import digest, outbox
+from .emails import build_context, get_template, render_messages
+from .models import Course, Outbox, Subscription
+from .notifications import claim_updated_courses, register_course_update
+from .ratelimit import RateLimited, acquire, defer_task
 
 # УДАЛИТЕ ЭТУ СТРОКУ: from user.models import User
 # ВМЕСТО ЭТОГО используйте get_user_model() если нужно
 
+User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Писем за одно обращение к базе и между сохранениями прогресса чанка
+NOTIFICATION_BATCH_SIZE = 100
+# Сколько хранится прогресс рассылки для повторных запусков (секунды)
+FANOUT_PROGRESS_TIMEOUT = 24 * 60 * 60
+# Курсов в одном запросе периодической проверки обновлений
+SCHEDULE_BATCH_SIZE = 1000
+# Шаблон письма об обновлении курса (lms/templates/emails/course_update.*)
+COURSE_UPDATE_TEMPLATE = 'course_update'
 
-@shared_task
-def send_course_update_notification(course_id, update_message=None):
+
+@shared_task(bind=True)
+def send_course_update_notification(self, course_id, lesson_ids=None, outbox_id=None):
     """
-    Отправка уведомлений об обновлении курса подписчикам
+    Отправка уведомлений об обновлении курса подписчикам.
+
+    Подписки читаются потоком по возрастанию id, на каждые
+    NOTIFICATION_CHUNK_SIZE подписчиков в outbox записывается чанк с
+    границами (after_id, up_to_id], который диспетчер передает задаче
+    send_course_update_chunk. Чанки пишутся одной транзакцией вместе с
+    отметкой уведомления outbox_id, ключ чанка - id задачи и граница,
+    поэтому повторный запуск с тем же id задачи чанки не дублирует.
+
+    В чанки передаются только id курса и уроков, текст письма
+    рендерится из шаблона в задаче чанка.
+
+    Время последнего уведомления здесь не меняется: его резервирует
+    вызывающий код через claim_notification.
     """
     try:
         course = Course.objects.get(id=course_id)
-
-        # Получаем всех подписчиков курса
-        subscriptions = Subscription.objects.filter(course=course, is_active=True)
-
-        if not subscriptions.exists():
+        chunk_size = settings.NOTIFICATION_CHUNK_SIZE
+
+        subscriptions = Subscription.objects.filter(
+            course=course, is_active=True
+        ).order_by('id').values_list('id', flat=True)
+
+        def chunk(after_id, up_to_id):
+            return f'course_update_chunk:{self.request.id}:{up_to_id}', {
+                'template': COURSE_UPDATE_TEMPLATE,
+                'course_id': course.id,
+                'after_id': after_id,
+                'up_to_id': up_to_id,
+                'lesson_ids': lesson_ids,
+            }
+
+        chunks = []
+        count = 0
+        after_id = last_id = 0
+        for subscription_id in subscriptions.iterator(chunk_size=chunk_size):
+            count += 1
+            last_id = subscription_id
+            if count % chunk_size == 0:
+                chunks.append(chunk(after_id, last_id))
+                after_id = last_id
+
+        if last_id != after_id:
+            chunks.append(chunk(after_id, last_id))
+
+        with transaction.atomic():
+            if chunks:
+                outbox.enqueue_many(Outbox.Kind.COURSE_UPDATE_CHUNK, chunks)
+            outbox.complete(outbox_id)
+
+        if not chunks:
             logger.info(f"У курса {course.title} нет активных подписчиков")
             return
 
-        subject = f"Обновление курса: {course.title}"
-
-        # Формируем сообщение
-        if update_message:
-            message = update_message
-        else:
-            message = f"""
-            Добрый день!
-
-            Курс "{course.title}" был обновлен.
-
-            Новые материалы уже доступны в вашем личном кабинете.
-
-            Ссылка на курс: {settings.FRONTEND_URL}/courses/{course.id}/
-
-            С уважением,
-            Команда LMS платформы
-            """
-
-        # Собираем email адреса подписчиков
-        recipients = [sub.user.email for sub in subscriptions.select_related('user')]
-
-        # Отправляем письма
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipients,
-            fail_silently=False,
-        )
-
-        logger.info(f"Отправлены уведомления {len(recipients)} подписчикам курса {course.title}")
-
-        # Обновляем время последнего уведомления
-        course.last_notification_sent = timezone.now()
-        course.save(update_fields=['last_notification_sent'])
+        logger.info(f"Рассылка по курсу {course.title}: {count} подписчиков, {len(chunks)} чанков")
 
     except Course.DoesNotExist:
         logger.error(f"Курс с ID {course_id} не найден")
+        outbox.complete(outbox_id)
     except Exception as e:
         logger.error(f"Ошибка при отправке уведомлений: {str(e)}")
         raise
 
 
+@shared_task(
+    bind=True,
+    autoretry_for=(smtplib.SMTPException, OSError),
+    retry_backoff=True,
+    max_retries=5,
+)
+def send_course_update_chunk(self, template, course_id, after_id, up_to_id, lesson_ids=None, outbox_id=None):
+    """
+    Отправка уведомлений подписчикам из диапазона id (after_id, up_to_id].
+
+    Общий контекст шаблона строится один раз на чанк, письма (текст и
+    HTML) рендерятся пачками по NOTIFICATION_BATCH_SIZE получателей.
+    Каждый подписчик получает отдельное письмо, все письма идут через
+    одно SMTP-соединение. Адрес, который сервер отклонил, пропускается
+    и не срывает отправку остальным. После каждой пачки сохраняется id
+    последней отправленной подписки, и повтор задачи продолжает с этого
+    места.
+
+    Отправка идет через общий ограничитель скорости (lms/ratelimit.py).
+    Когда квота исчерпана или сервер временно отказывает (4xx), задача
+    ставит себя заново с тем же id через нужное время, не расходуя
+    попытки повтора.
+
+    Чанк из outbox (outbox_id) отмечается отправленным, когда отправлены
+    все его подписчики.
+    """
+    progress_key = f'lms:fanout:chunk:{self.request.id}'
+    after_id = max(after_id, cache.get(progress_key, 0))
+
+    # Пользователи, выбравшие ежедневную сводку, получат обновление в ней
+    subscriptions = Subscription.objects.filter(
+        course_id=course_id, is_active=True, id__gt=after_id, id__lte=up_to_id,
+        user__notification_mode=User.NotificationMode.INSTANT,
+    ).exclude(user__email='').order_by('id').values_list('id', 'user__email', 'user__first_name')
+
+    context = build_context(template, {'course_id': course_id, 'lesson_ids': lesson_ids})
+    priority = get_template(template).priority
+    sent = 0
+    failed = 0
+    batch = []
+
+    with get_connection() as connection:
+        def flush():
+            nonlocal sent, failed
+            # Квота выдается на часть пачки: отправляем сколько разрешено,
+            # остаток дождется восстановления токенов
+            granted, retry_after = acquire(priority, len(batch), minimum=1)
+            allowed = batch[:granted]
+            recipients = [{'email': email, 'first_name': first_name} for _, email, first_name in allowed]
+            done = 0
+            try:
+                for message in render_messages(template, context, recipients, connection):
+                    try:
+                        sent += connection.send_messages([message])
+                    except smtplib.SMTPRecipientsRefused:
+                        failed += 1
+                        logger.warning(f"Адрес {message.to[0]} отклонен сервером")
+                    except smtplib.SMTPResponseException as e:
+                        if not 400 <= e.smtp_code < 500:
+                            raise
+                        # Временный отказ (провайдер ограничивает скорость)
+                        raise RateLimited(settings.EMAIL_THROTTLE_BACKOFF)
+                    done += 1
+            finally:
+                if done:
+                    cache.set(progress_key, batch[done - 1][0], timeout=FANOUT_PROGRESS_TIMEOUT)
+                del batch[:done]
+            if batch:
+                raise RateLimited(retry_after)
+
+        try:
+            for row in subscriptions.iterator(chunk_size=NOTIFICATION_BATCH_SIZE):
+                batch.append(row)
+                if len(batch) >= NOTIFICATION_BATCH_SIZE:
+                    flush()
+            if batch:
+                flush()
+        except RateLimited as e:
+            # Не ошибка: та же задача продолжит с сохраненного прогресса
+            logger.info(
+                f"Курс {course_id}, подписки ({after_id}, {up_to_id}]: отправлено {sent}, "
+                f"квота исчерпана, продолжение через {e.retry_after:.0f} с"
+            )
+            outbox.postpone(outbox_id, e.retry_after)
+            defer_task(self, e.retry_after)
+            return sent
+
+    outbox.complete(outbox_id)
+    logger.info(
+        f"Курс {course_id}, подписки ({after_id}, {up_to_id}]: отправлено {sent}, отклонено {failed}"
+    )
+    return sent
+
+
 @shared_task
 def send_course_updates_notifications():
     """
     Периодическая задача: проверка обновлений курсов за последние 4 часа
-    и отправка уведомлений
-    """
-    four_hours_ago = timezone.now() - timedelta(hours=4)
+    и отправка уведомлений.
 
-    # Находим курсы, обновленные за последние 4 часа
-    updated_courses = Course.objects.filter(
-        updated_at__gte=four_hours_ago,
-        updated_at__lte=timezone.now()
-    )
+    Отбор курсов, проверка интервала, отметка last_notification_sent и
+    запись в outbox выполняются в SQL пачками (claim_updated_courses),
+    в Python попадают только id. Отправку ведет группа диспетчеров
+    outbox, которые разбирают очередь параллельно.
+    """
+    now = timezone.now()
+    batch_size = settings.OUTBOX_BATCH_SIZE
 
-    # Проверяем, что уведомление не отправлялось за последние 4 часа
-    courses_to_notify = []
-    for course in updated_courses:
-        if not course.last_notification_sent or \
-                course.last_notification_sent < four_hours_ago:
-            courses_to_notify.append(course.id)
+    total = 0
+    for course_ids in claim_updated_courses(now - timedelta(hours=4), now, batch_size=SCHEDULE_BATCH_SIZE):
+        total += len(course_ids)
 
-    # Отправляем уведомления для каждого курса
-    for course_id in courses_to_notify:
-        send_course_update_notification.delay(course_id)
+    if total:
+        dispatchers = min(math.ceil(total / batch_size), settings.OUTBOX_DISPATCHERS)
+        group(dispatch_outbox.s(batch_size) for _ in range(dispatchers)).apply_async()
 
-    logger.info(f"Проверка обновлений завершена. Найдено курсов для уведомления: {len(courses_to_notify)}")
-    return f"Отправлено уведомлений для {len(courses_to_notify)} курсов"
+    logger.info(f"Проверка обновлений завершена. Найдено курсов для уведомления: {total}")
+    return f"Отправлено уведомлений для {total} курсов"
 
 
 @shared_task
@@ -121,23 +239,54 @@ def check_specific_lesson_update(course_id, lesson_title):
                 not course.last_notification_sent or
                 course.last_notification_sent < four_hours_ago
         ):
-            message = f"""
-            Добрый день!
+            # Уведомление уходит через общую отложенную рассылку,
+            # интервал 4 часа проверяется при отправке
+            for lesson_id in recent_lessons.values_list('id', flat=True):
+                register_course_update(course_id, lesson_id)
+            return f"Уведомление отправлено об обновлении урока {lesson_title}"
 
-            В курсе "{course.title}" был обновлен урок "{lesson_title}".
+        return "Обновлений не обнаружено или уведомление уже отправлялось"
 
-            Новые материалы уже доступны в вашем личном кабинете.
+    except Course.DoesNotExist:
+        return f"Курс с ID {course_id} не найден"
 
-            Ссылка на курс: {settings.FRONTEND_URL}/courses/{course.id}/
 
-            С уважением,
-            Команда LMS платформы
-            """
+@shared_task
+def dispatch_outbox(batch_size=None):
+    """
+    Отправка уведомлений из outbox пачками.
 
-            send_course_update_notification.delay(course_id, message)
-            return f"Уведомление отправлено об обновлении урока {lesson_title}"
+    Каждая пачка блокируется через SELECT ... FOR UPDATE SKIP LOCKED и
+    отмечается в той же транзакции, поэтому параллельные диспетчеры
+    не отправляют одно уведомление дважды. Работает, пока очередь не
+    опустеет.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    claimed = 0
+    delivered = 0
+    while True:
+        with transaction.atomic():
+            entries = outbox.claim_batch(batch_size)
+            if entries:
+                delivered += outbox.deliver(entries)
+        claimed += len(entries)
+        if len(entries) < batch_size:
+            break
+
+    if claimed:
+        logger.info(f"Outbox: обработано {claimed}, отправлено {delivered}")
+    return delivered
 
-        return "Обновлений не обнаружено или уведомление уже отправлялось"
 
-    except Course.DoesNotExist:
-        return f"Курс с ID {course_id} не найден"
\ No newline at end of file
+@shared_task
+def send_daily_digests():
+    """
+    Ежедневная сводка обновлений курсов (lms/digest.py).
+
+    Письма записываются в outbox пачками получателей; повтор задачи в
+    тот же день продолжает с места остановки.
+    """
+    day = timezone.localdate().isoformat()
+    recipients = digest.send_digests(day, batch_size=settings.DIGEST_BATCH_SIZE)
+    logger.info(f"Сводка за {day}: {recipients} получателей")
+    return recipients
@@ -1,11 +1,19 @@
-import self
-from django.test import TestCase
+import json
+import smtplib
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import ValidationError
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from .models import Course, Lesson, Subscription
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .models import Course, Lesson, Outbox, Subscription
 from .validators import validate_youtube_url
+from . import cache as api_cache
 
 User = get_user_model()
 
@@ -387,4 +395,1622 @@ class PermissionTestCase(APITestCase):
 
         # Модератор не может удалять
         response = self.moderator_client.delete(url)  # ИСПРАВЛЕНО
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class CourseListQueryCountTestCase(APITestCase):
+    """Тесты количества SQL-запросов при получении списка курсов"""
+
+    # Валидатор ETag по подпискам, курсы с аннотациями и prefetch уроков
+    # (курсорная пагинация без COUNT)
+    EXPECTED_QUERIES = 3
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='reader@test.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_courses(self, count, lessons_per_course):
+        """Создание курсов с уроками и подписками"""
+        for i in range(count):
+            course = Course.objects.create(title=f'Course {i}', owner=self.user)
+            Lesson.objects.bulk_create([
+                Lesson(course=course, title=f'Lesson {j}', owner=self.user)
+                for j in range(lessons_per_course)
+            ])
+            if i % 2 == 0:
+                Subscription.objects.create(user=self.user, course=course)
+
+    def test_list_query_count_does_not_grow(self):
+        """Число запросов не зависит от количества курсов и уроков"""
+        url = '/api/courses/?page_size=50&expand=lessons'
+
+        self.create_courses(3, lessons_per_course=1)
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+
+        self.create_courses(40, lessons_per_course=5)
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 43)
+
+    def test_list_uses_annotations(self):
+        """Аннотации дают те же значения, что и прямые запросы"""
+        self.create_courses(4, lessons_per_course=3)
+
+        response = self.client.get('/api/courses/?page_size=50&expand=lessons')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for item in response.data['results']:
+            course = Course.objects.get(id=item['id'])
+            self.assertEqual(item['lessons_count'], course.lessons.count())
+            self.assertEqual(len(item['lessons']), course.lessons.count())
+            self.assertEqual(
+                item['is_subscribed'],
+                course.subscriptions.filter(user=self.user, is_active=True).exists()
+            )
+
+
+class CourseCacheTestCase(APITestCase):
+    """Тесты кэширования ответов курсов и уроков"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='owner@test.com', password='pass')
+        self.reader = User.objects.create_user(email='reader@test.com', password='pass')
+
+        self.course = Course.objects.create(title='Cached Course', owner=self.owner)
+        self.lesson = Lesson.objects.create(
+            course=self.course,
+            title='Cached Lesson',
+            owner=self.owner
+        )
+        Subscription.objects.create(user=self.owner, course=self.course)
+
+        self.owner_client = APIClient()
+        self.owner_client.force_authenticate(user=self.owner)
+        self.reader_client = APIClient()
+        self.reader_client.force_authenticate(user=self.reader)
+
+    def test_list_served_from_cache(self):
+        """Повторный запрос списка читается из кэша"""
+        self.owner_client.get('/api/courses/')
+
+        # Остаются валидатор ETag и запрос флага подписки
+        with self.assertNumQueries(2):
+            response = self.owner_client.get('/api/courses/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['title'], 'Cached Course')
+        self.assertEqual(api_cache.get_stats()['hits'], 1)
+        self.assertEqual(api_cache.get_stats()['misses'], 1)
+
+    def test_is_subscribed_is_per_user(self):
+        """Общий ответ из кэша получает флаг подписки текущего пользователя"""
+        url = f'/api/courses/{self.course.id}/'
+
+        response = self.owner_client.get(url)
+        self.assertTrue(response.data['is_subscribed'])
+
+        response = self.reader_client.get(url)
+        self.assertFalse(response.data['is_subscribed'])
+        self.assertEqual(api_cache.get_stats()['hits'], 1)
+
+    def test_lesson_change_invalidates_course(self):
+        """Новый урок меняет версию курса и сбрасывает кэш"""
+        url = f'/api/courses/{self.course.id}/'
+        response = self.owner_client.get(url)
+        self.assertEqual(response.data['lessons_count'], 1)
+
+        Lesson.objects.create(course=self.course, title='New Lesson', owner=self.owner)
+
+        response = self.owner_client.get(url)
+        self.assertEqual(response.data['lessons_count'], 2)
+        self.assertEqual(api_cache.get_stats()['hits'], 0)
+
+    def test_lesson_permissions_checked_on_cache_hit(self):
+        """Права на урок проверяются и для ответа из кэша"""
+        url = f'/api/lessons/{self.lesson.id}/'
+
+        response = self.owner_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.owner_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], 'Cached Lesson')
+
+        response = self.reader_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(api_cache.get_stats()['hits'], 1)
+
+    def test_lesson_update_invalidates_lesson(self):
+        """Изменение урока сбрасывает его кэш"""
+        url = f'/api/lessons/{self.lesson.id}/'
+        self.owner_client.get(url)
+
+        self.lesson.title = 'Renamed Lesson'
+        self.lesson.save()
+
+        response = self.owner_client.get(url)
+        self.assertEqual(response.data['title'], 'Renamed Lesson')
+
+    def test_stats_admin_only(self):
+        """Статистика кэша доступна только администраторам"""
+        response = self.reader_client.get('/api/cache/stats/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = User.objects.create_superuser(email='admin@test.com', password='pass')
+        self.reader_client.force_authenticate(user=admin)
+        response = self.reader_client.get('/api/cache/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('hit_ratio', response.data)
+
+
+class SparseFieldsTestCase(APITestCase):
+    """Тесты выборочных полей ?fields= и ?expand="""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='fields@test.com', password='pass')
+        self.course = Course.objects.create(
+            title='Catalog Course',
+            description='Very long description',
+            price=100,
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            course=self.course,
+            title='Lesson',
+            description='Lesson description',
+            owner=self.user
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_lessons_not_nested_by_default(self):
+        """Уроки не вкладываются в курс без ?expand=lessons"""
+        response = self.client.get(f'/api/courses/{self.course.id}/')
+        self.assertNotIn('lessons', response.data)
+        self.assertEqual(response.data['lessons_count'], 1)
+
+        response = self.client.get(f'/api/courses/{self.course.id}/?expand=lessons')
+        self.assertEqual(len(response.data['lessons']), 1)
+
+    def test_fields_limit_response_and_columns(self):
+        """?fields= ограничивает ответ и колонки в SQL"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/courses/?fields=title,price')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'price'})
+
+        course_queries = [q['sql'] for q in context.captured_queries if 'lms_course' in q['sql']]
+        self.assertTrue(course_queries)
+        for sql in course_queries:
+            self.assertNotIn('"lms_course"."description"', sql)
+            self.assertNotIn('lms_lesson', sql)
+
+    def test_lesson_fields(self):
+        """?fields= работает для списка и детального просмотра уроков"""
+        response = self.client.get(f'/api/lessons/?course={self.course.id}&fields=title')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0], {'id': self.lesson.id, 'title': 'Lesson'})
+
+        response = self.client.get(f'/api/lessons/{self.lesson.id}/?fields=title')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'id': self.lesson.id, 'title': 'Lesson'})
+
+    def test_payment_detail_fields(self):
+        """?fields= работает для детального просмотра платежа"""
+        from users.models import Payment
+
+        payment = Payment.objects.create(user=self.user, course=self.course, amount=100)
+
+        response = self.client.get(f'/api/users/payments/{payment.id}/?fields=amount')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'id', 'amount'})
+
+        response = self.client.get(f'/api/users/payments/{payment.id}/')
+        self.assertEqual(response.data['course']['title'], 'Catalog Course')
+        self.assertNotIn('lessons', response.data['course'])
+
+
+class KeysetPaginationTestCase(APITestCase):
+    """Тесты курсорной пагинации"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='pager@test.com', password='pass')
+        self.other = User.objects.create_user(email='other@test.com', password='pass')
+        self.courses = [
+            Course.objects.create(title=f'Course {i}', owner=self.user)
+            for i in range(25)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_walk_courses_by_cursor(self):
+        """Проход по всем страницам курсов по ссылкам next"""
+        url = '/api/courses/?page_size=10&fields=id'
+        seen = []
+
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            for query in context.captured_queries:
+                if 'lms_subscription' in query['sql']:
+                    continue  # Валидатор ETag
+                self.assertNotIn('COUNT(', query['sql'])
+                self.assertNotIn('OFFSET', query['sql'])
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+
+        expected = list(
+            Course.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_page_numbers_still_supported(self):
+        """Клиенты с ?page= получают постраничную выдачу"""
+        response = self.client.get('/api/courses/?page=3&page_size=10')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+    def test_subscriptions_of_current_user(self):
+        """Список подписок содержит только подписки текущего пользователя"""
+        Subscription.objects.create(user=self.user, course=self.courses[0])
+        Subscription.objects.create(user=self.other, course=self.courses[1])
+
+        response = self.client.get('/api/subscriptions/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['course'], self.courses[0].id)
+
+    def test_payments_of_current_user(self):
+        """Список платежей пагинируется курсором и содержит только свои платежи"""
+        from users.models import Payment
+
+        for course in self.courses[:3]:
+            Payment.objects.create(user=self.user, course=course, amount=10)
+        Payment.objects.create(user=self.other, course=self.courses[0], amount=10)
+
+        response = self.client.get('/api/users/payments/?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+
+class ConditionalGetTestCase(APITestCase):
+    """Тесты условных GET-запросов (ETag / Last-Modified)"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='poller@test.com', password='pass')
+        self.other = User.objects.create_user(email='other@test.com', password='pass')
+        self.course = Course.objects.create(title='Polled Course', owner=self.user)
+        self.lesson = Lesson.objects.create(course=self.course, title='Lesson', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_course_not_modified(self):
+        """Совпадающий ETag дает 304 одним запросом к базе"""
+        url = f'/api/courses/{self.course.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_course_if_modified_since(self):
+        """Last-Modified учитывает изменения уроков"""
+        url = f'/api/courses/{self.course.id}/'
+        response = self.client.get(url)
+        last_modified = response['Last-Modified']
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_etag_changes(self):
+        """ETag меняется при изменении уроков и подписки пользователя"""
+        url = f'/api/courses/{self.course.id}/'
+        etag = self.client.get(url)['ETag']
+
+        Lesson.objects.create(course=self.course, title='Another', owner=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        Subscription.objects.create(user=self.user, course=self.course)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_subscribed'])
+
+    def test_course_list_not_modified(self):
+        """Список курсов тоже поддерживает ETag"""
+        etag = self.client.get('/api/courses/')['ETag']
+        response = self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.course.title = 'Renamed'
+        self.course.save()
+        response = self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_lesson_not_modified_requires_permission(self):
+        """304 по уроку отдается только пользователю с доступом"""
+        url = f'/api/lessons/{self.lesson.id}/'
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        other_client = APIClient()
+        other_client.force_authenticate(user=self.other)
+        response = other_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_profile_not_modified(self):
+        """ETag профиля меняется после обновления"""
+        url = '/api/users/profile/'
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(url, {'city': 'Казань'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class SearchTestCase(APITestCase):
+    """Тесты полнотекстового поиска и автодополнения"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='searcher@test.com', password='pass')
+        self.python = Course.objects.create(
+            title='Программирование на Python',
+            description='Основы языка и стандартная библиотека',
+            owner=self.user
+        )
+        self.django = Course.objects.create(
+            title='Веб-разработка на Django',
+            description='Фреймворк для Python: модели, представления, шаблоны',
+            owner=self.user
+        )
+        self.design = Course.objects.create(
+            title='Графический дизайн',
+            description='Композиция и цвет',
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            course=self.django,
+            title='Миграции базы данных',
+            description='Как Django применяет изменения схемы',
+            owner=self.user
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_search_ranked_by_title(self):
+        """Совпадение в заголовке весит больше совпадения в описании"""
+        response = self.client.get('/api/search/?q=python')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in response.data['results']]
+        self.assertEqual(ids, [self.python.id, self.django.id])
+        self.assertGreater(
+            response.data['results'][0]['rank'],
+            response.data['results'][1]['rank']
+        )
+
+    def test_search_lessons(self):
+        """Поиск по урокам с учетом морфологии"""
+        response = self.client.get('/api/search/?q=миграция&type=lessons')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['course'], self.django.id)
+
+    def test_search_filter_with_cursor(self):
+        """Фильтр ?search= в списке курсов проходится курсором по релевантности"""
+        url = '/api/courses/?search=python&page_size=1&fields=id'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(seen, [self.python.id, self.django.id])
+
+    def test_vector_updated_on_save(self):
+        """Поисковый индекс обновляется при изменении заголовка"""
+        self.design.title = 'Дизайн интерфейсов на Python'
+        self.design.save()
+
+        response = self.client.get('/api/search/?q=интерфейс')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.design.id])
+
+    def test_autocomplete_prefix_with_typo(self):
+        """Подсказки находят недописанное слово с опечаткой"""
+        response = self.client.get('/api/search/autocomplete/?q=програмир')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['id'], self.python.id)
+
+    def test_empty_query(self):
+        """Пустой запрос не возвращает результатов"""
+        response = self.client.get('/api/search/?q=')
+        self.assertEqual(response.data['results'], [])
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Регрессионные тесты планов запросов для горячих фильтров.
+
+    На маленькой тестовой базе планировщик выбирает Seq Scan даже при
+    наличии индекса, поэтому последовательное сканирование отключается
+    штрафом enable_seqscan = off. Если подходящего индекса нет, в плане
+    все равно остается полный проход таблицы и тест падает.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from users.models import Payment
+
+        users = User.objects.bulk_create([
+            User(
+                email=f'plan{i}@test.com',
+                is_active=i % 3 != 0,
+                last_login=timezone.now() - timedelta(days=i % 60)
+            )
+            for i in range(200)
+        ])
+        courses = Course.objects.bulk_create([
+            Course(title=f'Plan course {i}', owner=users[i]) for i in range(50)
+        ])
+        Subscription.objects.bulk_create([
+            Subscription(user=user, course=courses[i % 50], is_active=i % 4 != 0)
+            for i, user in enumerate(users)
+        ])
+        Payment.objects.bulk_create([
+            Payment(user=users[i % 200], course=courses[i % 50], amount=10)
+            for i in range(400)
+        ])
+        cls.user = users[1]
+        cls.course = courses[1]
+
+        # Недавно обновлена только часть курсов, как в рабочей базе;
+        # иначе диапазон по updated_at выбирает всю таблицу
+        Course.objects.filter(id__in=[course.id for course in courses[5:]]).update(
+            updated_at=timezone.now() - timedelta(days=30)
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            # SET LOCAL действует до конца транзакции теста
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def get_plan_nodes(self, queryset):
+        if isinstance(queryset, tuple):
+            sql, params = queryset
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                result = cursor.fetchone()[0]
+            plan = (json.loads(result) if isinstance(result, str) else result)[0]['Plan']
+        else:
+            plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        nodes = [plan]
+        for node in nodes:
+            nodes.extend(node.get('Plans', []))
+        return nodes
+
+    def assertNoSeqScan(self, queryset):
+        """queryset - QuerySet или пара (sql, params) для сырого запроса"""
+        for node in self.get_plan_nodes(queryset):
+            # Index Scan без условия по индексу - тоже полный проход таблицы
+            full_scan = node['Node Type'] == 'Seq Scan' or (
+                'Relation Name' in node
+                and 'Filter' in node
+                and 'Index Cond' not in node
+                and 'Recheck Cond' not in node
+            )
+            query = queryset[0] if isinstance(queryset, tuple) else queryset.query
+            self.assertFalse(
+                full_scan,
+                f"{node['Node Type']} по {node.get('Relation Name')}:\n{query}"
+            )
+
+    def test_active_course_subscribers(self):
+        """Активные подписчики курса (lms.tasks.send_course_update_notification)"""
+        queryset = Subscription.objects.filter(
+            course=self.course, is_active=True
+        ).select_related('user')
+        self.assertNoSeqScan(queryset)
+
+    def test_recently_updated_courses(self):
+        """Курсы, обновленные за 4 часа (send_course_updates_notifications)"""
+        now = timezone.now()
+        queryset = Course.objects.filter(
+            updated_at__gte=now - timedelta(hours=4),
+            updated_at__lte=now
+        )
+        self.assertNoSeqScan(queryset)
+
+    def test_claim_updated_courses(self):
+        """Пакетное резервирование уведомлений (notifications.claim_updated_courses)"""
+        from .notifications import _claim_updated_sql
+
+        now = timezone.now()
+        params = {
+            'after_updated': now - timedelta(hours=4),
+            'after_id': 0,
+            'until': now,
+            'limit': 1000,
+            'now': now,
+            'now_key': now.isoformat(),
+            'interval_start': now - timedelta(hours=4),
+            'kind': Outbox.Kind.COURSE_UPDATE,
+            'status': Outbox.Status.PENDING,
+        }
+        self.assertNoSeqScan((_claim_updated_sql(), params))
+
+    def test_inactive_users(self):
+        """Пачка блокировки неактивных пользователей (users.tasks.check_inactive_users)"""
+        from users.tasks import CURSOR_START, _deactivate_batch_sql
+
+        params = {
+            'cutoff': timezone.now() - timedelta(days=30),
+            'after_login': CURSOR_START,
+            'after_id': 0,
+            'limit': 1000,
+            'report_id': 1,
+        }
+        self.assertNoSeqScan((_deactivate_batch_sql(), params))
+
+    def test_user_payments(self):
+        """Список платежей пользователя (PaymentListAPIView)"""
+        from users.models import Payment
+
+        queryset = Payment.objects.filter(user=self.user).order_by('-payment_date', '-id')
+        self.assertNoSeqScan(queryset)
+
+
+class PerformanceMetricsTestCase(APITestCase):
+    """Тесты Server-Timing и экспорта метрик"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='metrics@test.com', password='pass')
+        Course.objects.create(title='Measured Course', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_header(self):
+        """Ответ содержит число запросов, кэш и время"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/courses/')
+
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(context.captured_queries)} queries"', timing)
+        self.assertIn('cache;desc="hits=0 misses=1"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+        response = self.client.get('/api/courses/')
+        self.assertIn('cache;desc="hits=1 misses=0"', response['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        """Гистограммы по имени представления доступны в формате Prometheus"""
+        self.client.get('/api/courses/')
+
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        samples = [
+            line.split('{')[0] for line in response.content.decode().splitlines()
+            if 'view="course-list"' in line
+        ]
+        self.assertIn('lms_request_duration_seconds_bucket', samples)
+        self.assertIn('lms_request_db_queries_count', samples)
+        self.assertIn('lms_request_serialize_duration_seconds_sum', samples)
+        self.assertIn('lms_cache_lookups_total', samples)
+
+    def test_metrics_access(self):
+        """Без токена /metrics доступен только сотрудникам или после явного открытия"""
+        client = APIClient()
+        self.assertEqual(client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        with self.settings(METRICS_TOKEN='secret'):
+            response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        client.force_login(self.user)
+        self.assertEqual(client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        staff = User.objects.create_user(email='staff@test.com', password='pass', is_staff=True)
+        client.force_login(staff)
+        self.assertEqual(client.get('/metrics').status_code, status.HTTP_200_OK)
+
+        with self.settings(METRICS_PUBLIC=True):
+            self.assertEqual(APIClient().get('/metrics').status_code, status.HTTP_200_OK)
+
+    def test_not_sampled(self):
+        """При нулевой доле выборки замеров нет"""
+        with self.settings(METRICS_SAMPLE_RATE=0):
+            response = self.client.get('/api/courses/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class BenchmarkTestCase(APITestCase):
+    """Тесты нагрузочного прогона (manage.py bench)"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_every_route_has_scenario(self):
+        """Для каждого маршрута API есть сценарий"""
+        from .benchmark import uncovered_routes
+        self.assertEqual(uncovered_routes(), [])
+
+    def test_scenarios_run_without_errors(self):
+        """Сценарии на маленьком наборе данных проходят без ошибок"""
+        from .benchmark import SCENARIOS, Dataset, run_scenario, seed_dataset
+
+        ctx = seed_dataset(Dataset(courses=3, lessons_per_course=2, users=4, payments_per_user=1))
+        for scenario in SCENARIOS:
+            if scenario.requires_stripe or scenario.route in ('user-register', 'token-obtain-pair'):
+                continue  # Хэширование пароля слишком медленное для юнит-теста
+            with self.subTest(scenario=scenario.name):
+                result = run_scenario(scenario, ctx, requests=2, concurrency=1, warmup=0)
+                self.assertEqual(result['errors'], 0)
+                self.assertIsNotNone(result['queries'])
+
+    def test_compare_with_baseline(self):
+        """Рост медианы и числа SQL-запросов считается регрессией"""
+        from .benchmark import compare
+
+        baseline = {'courses-list': {'p50_ms': 10.0, 'queries': 2.0}}
+        self.assertEqual(compare({'courses-list': {'p50_ms': 12.0, 'queries': 2.0}}, baseline), [])
+        regressions = compare({'courses-list': {'p50_ms': 30.0, 'queries': 3.0}}, baseline)
+        self.assertEqual(len(regressions), 2)
+
+
+class GenerateDataTestCase(TestCase):
+    """Тесты генератора тестовых данных (manage.py generate_data)"""
+
+    def test_generate_data(self):
+        """Данные загружаются с корректными связями и перекосом популярности"""
+        from io import StringIO
+        from django.core.management import call_command
+        from django.db.models import Count
+        from users.models import Payment
+
+        existing = User.objects.create_user(email='existing@test.com', password='pass')
+        call_command(
+            'generate_data', users=300, courses=20, lessons=5,
+            subscriptions=3, payments=2, seed=1, stdout=StringIO()
+        )
+
+        self.assertEqual(User.objects.count(), 301)
+        self.assertEqual(Course.objects.count(), 20)
+        self.assertTrue(Subscription.objects.exists())
+        self.assertTrue(Payment.objects.exists())
+
+        # Пароль захэширован один раз и подходит всем пользователям
+        generated = User.objects.exclude(pk=existing.pk)
+        self.assertEqual(generated.values('password').distinct().count(), 1)
+        self.assertTrue(generated.first().check_password('password123'))
+
+        # Несколько популярных курсов собирают большую часть подписок
+        counts = sorted(
+            Course.objects.annotate(total=Count('subscriptions')).values_list('total', flat=True),
+            reverse=True
+        )
+        self.assertGreater(counts[0], counts[len(counts) // 2] * 3)
+
+        # Последовательности продолжаются после загруженных id
+        course = Course.objects.create(title='After generation')
+        self.assertGreater(course.id, Course.objects.exclude(pk=course.pk).latest('id').id)
+        self.assertTrue(Course.objects.filter(search_vector__isnull=False).exists())
+
+
+@override_settings(NOTIFICATION_CHUNK_SIZE=2)
+class CourseUpdateNotificationTestCase(TestCase):
+    """Тесты рассылки уведомлений об обновлении курса по чанкам"""
+
+    def setUp(self):
+        from config.celery import app as celery_app
+
+        self.celery_app = celery_app
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+        self.course = Course.objects.create(title='Рассылка')
+        self.subscriptions = [
+            Subscription.objects.create(
+                user=User.objects.create_user(email=f'student{i}@test.com', password='pass'),
+                course=self.course,
+            )
+            for i in range(5)
+        ]
+        # Неактивная подписка уведомление не получает
+        Subscription.objects.create(
+            user=User.objects.create_user(email='inactive@test.com', password='pass'),
+            course=self.course,
+            is_active=False,
+        )
+
+    def tearDown(self):
+        self.celery_app.conf.task_always_eager = self.always_eager
+        cache.delete('lms:fanout:chunk:chunk-retry')
+
+    def test_each_subscriber_gets_own_message(self):
+        """Каждый активный подписчик получает отдельное письмо"""
+        from django.core import mail
+        from .tasks import send_course_update_notification
+
+        with self.captureOnCommitCallbacks(execute=True):
+            send_course_update_notification.delay(self.course.id)
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertTrue(all(len(message.to) == 1 for message in mail.outbox))
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [f'student{i}@test.com' for i in range(5)]
+        )
+
+    def test_retry_does_not_duplicate_chunks(self):
+        """Повтор родительской задачи не записывает чанки заново"""
+        from .tasks import send_course_update_notification
+
+        for _ in range(2):
+            send_course_update_notification.apply(args=(self.course.id,), task_id='notify-retry')
+
+        chunks = Outbox.objects.filter(kind=Outbox.Kind.COURSE_UPDATE_CHUNK).order_by('id')
+        ids = [subscription.id for subscription in self.subscriptions]
+        self.assertEqual(
+            [(entry.payload['after_id'], entry.payload['up_to_id']) for entry in chunks],
+            [(0, ids[1]), (ids[1], ids[3]), (ids[3], ids[4])]
+        )
+
+    def test_course_update_waits_for_chunks(self):
+        """Уведомление по курсу остается в outbox, пока задачи не отправят все чанки"""
+        from django.core import mail
+        from .outbox import enqueue
+        from .tasks import dispatch_outbox
+
+        enqueue(Outbox.Kind.COURSE_UPDATE, 'course_update:test', {'course_id': self.course.id, 'lesson_ids': None})
+
+        # Задача рассылки потерялась: уведомление ждет и не считается отправленным
+        with self.captureOnCommitCallbacks():
+            dispatch_outbox.delay()
+        entry = Outbox.objects.get()
+        self.assertEqual(entry.status, Outbox.Status.PENDING)
+        self.assertGreater(entry.available_at, timezone.now())
+
+        # По истечении OUTBOX_TASK_TIMEOUT диспетчер запускает ее заново
+        Outbox.objects.update(available_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatch_outbox.delay()
+
+        self.assertEqual(len(mail.outbox), 5)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, Outbox.Status.DELIVERED)
+        self.assertEqual(entry.attempts, 2)
+        chunks = Outbox.objects.filter(kind=Outbox.Kind.COURSE_UPDATE_CHUNK)
+        self.assertEqual(chunks.count(), 3)
+        self.assertFalse(chunks.exclude(status=Outbox.Status.DELIVERED).exists())
+
+    def test_chunk_retry_resumes_after_progress(self):
+        """Повтор задачи чанка продолжает с последней отправленной подписки"""
+        from django.core import mail
+        from .tasks import send_course_update_chunk
+
+        cache.set('lms:fanout:chunk:chunk-retry', self.subscriptions[1].id)
+        send_course_update_chunk.apply(
+            args=('course_update', self.course.id, 0, self.subscriptions[3].id),
+            task_id='chunk-retry',
+        )
+
+        self.assertEqual(
+            [message.to for message in mail.outbox],
+            [['student2@test.com'], ['student3@test.com']]
+        )
+        self.assertEqual(cache.get('lms:fanout:chunk:chunk-retry'), self.subscriptions[3].id)
+
+
+@override_settings(NOTIFICATION_DEBOUNCE=60)
+class CourseNotificationCoalescingTestCase(TestCase):
+    """Тесты объединения уведомлений об обновлении курса"""
+
+    def setUp(self):
+        from config.celery import app as celery_app
+
+        self.celery_app = celery_app
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+        self.owner = User.objects.create_user(email='owner@test.com', password='pass')
+        self.course = Course.objects.create(title='Объединение', owner=self.owner)
+        self.lessons = [
+            Lesson.objects.create(course=self.course, title=f'Урок {i}', owner=self.owner)
+            for i in range(2)
+        ]
+        Subscription.objects.create(
+            user=User.objects.create_user(email='student@test.com', password='pass'),
+            course=self.course,
+        )
+        cache.delete_pattern('lms:notifications:*')
+        self.addCleanup(cache.delete_pattern, 'lms:notifications:*')
+
+    def tearDown(self):
+        self.celery_app.conf.task_always_eager = self.always_eager
+
+    def dispatch_now(self):
+        """Диспетчер outbox после конца окна объединения"""
+        from .tasks import dispatch_outbox
+
+        Outbox.objects.filter(status=Outbox.Status.PENDING).update(available_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatch_outbox.delay()
+
+    def test_saves_coalesced_into_one_notification(self):
+        """Серия сохранений курса и уроков дает одну запись outbox и одно письмо"""
+        from unittest import mock
+        from django.core import mail
+        from .tasks import dispatch_outbox
+
+        with mock.patch.object(dispatch_outbox, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(3):
+                    self.course.save()
+                for lesson in self.lessons:
+                    lesson.title += ' (обновлен)'
+                    lesson.save()
+                # Уведомление записано в транзакции изменения, диспетчер
+                # ставится только после коммита
+                entry = Outbox.objects.get()
+                apply_async.assert_not_called()
+
+        apply_async.assert_called_once()
+        self.assertTrue(0 <= apply_async.call_args.kwargs['countdown'] <= 60)
+        entry.refresh_from_db()
+        self.assertEqual(entry.kind, Outbox.Kind.COURSE_UPDATE)
+        self.assertEqual(entry.payload['lesson_ids'], [lesson.id for lesson in self.lessons])
+        self.assertGreater(entry.available_at, timezone.now())
+
+        self.dispatch_now()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Урок 0 (обновлен)', mail.outbox[0].body)
+        self.assertIn('Урок 1 (обновлен)', mail.outbox[0].body)
+        self.course.refresh_from_db()
+        self.assertIsNotNone(self.course.last_notification_sent)
+
+        # Изменение после отправки уходит в новое уведомление, но в
+        # течение 4 часов оно не отправляется
+        with mock.patch.object(dispatch_outbox, 'apply_async'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.lessons[0].save()
+        self.assertEqual(Outbox.objects.filter(kind=Outbox.Kind.COURSE_UPDATE).count(), 2)
+        self.dispatch_now()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(Outbox.objects.filter(status=Outbox.Status.PENDING).exists())
+
+    def test_notification_rolls_back_with_change(self):
+        """Уведомление не переживает откат изменения, которое его вызвало"""
+        from django.db import transaction
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.course.title = 'Откат'
+            self.course.save()
+            self.assertTrue(Outbox.objects.exists())
+            raise RuntimeError
+
+        self.assertFalse(Outbox.objects.exists())
+
+    def test_claim_notification(self):
+        """Из двух резервирований в интервале 4 часа успешно только первое"""
+        from .notifications import claim_notification
+
+        self.assertTrue(claim_notification(self.course.id))
+        self.assertFalse(claim_notification(self.course.id))
+
+        Course.objects.filter(pk=self.course.pk).update(
+            last_notification_sent=timezone.now() - timedelta(hours=5)
+        )
+        self.assertTrue(claim_notification(self.course.id))
+
+
+class OutboxTestCase(TestCase):
+    """Тесты outbox уведомлений и диспетчера"""
+
+    def setUp(self):
+        from config.celery import app as celery_app
+
+        self.celery_app = celery_app
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+        self.user = User.objects.create_user(email='student@test.com', password='pass')
+
+    def tearDown(self):
+        self.celery_app.conf.task_always_eager = self.always_eager
+
+    def test_dispatch_delivers_once(self):
+        """Письмо с повторным ключом записывается один раз и отправляется один раз"""
+        from django.core import mail
+        from .outbox import enqueue_email
+        from .tasks import dispatch_outbox
+
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_email('test:1', 'welcome', {}, [self.user.id])
+            enqueue_email('test:1', 'welcome', {}, [self.user.id])
+
+        self.assertEqual(len(mail.outbox), 1)
+        entry = Outbox.objects.get()
+        self.assertEqual(entry.status, Outbox.Status.DELIVERED)
+        self.assertEqual(entry.attempts, 1)
+        self.assertIsNotNone(entry.delivered_at)
+
+        # Доставленное уведомление повторно не отправляется
+        dispatch_outbox.delay()
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed_delivery_is_retried_later(self):
+        """Ошибка отправки откладывает повтор, после всех попыток строка помечается ошибочной"""
+        from unittest import mock
+        from .outbox import HANDLERS, enqueue_email
+        from .tasks import dispatch_outbox
+
+        enqueue_email('test:fail', 'welcome', {}, [self.user.id])
+        failing = mock.Mock(side_effect=OSError('connection refused'))
+
+        with mock.patch.dict(HANDLERS, {Outbox.Kind.EMAIL: failing}):
+            dispatch_outbox.delay()
+            entry = Outbox.objects.get()
+            self.assertEqual(entry.status, Outbox.Status.PENDING)
+            self.assertEqual(entry.last_error, 'connection refused')
+            self.assertGreater(entry.available_at, timezone.now())
+
+            # До наступления available_at строка не забирается
+            dispatch_outbox.delay()
+            self.assertEqual(failing.call_count, 1)
+
+            Outbox.objects.update(available_at=timezone.now())
+            dispatch_outbox.delay()
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, Outbox.Status.FAILED)
+        self.assertEqual(entry.attempts, 2)
+
+    def test_welcome_email_goes_through_outbox(self):
+        """Приветственное письмо пишется в outbox один раз на пользователя"""
+        from django.core import mail
+        from users.tasks import send_welcome_email
+
+        user = User.objects.create_user(email='welcome@test.com', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            send_welcome_email(user.id)
+            send_welcome_email(user.id)
+
+        self.assertEqual(Outbox.objects.filter(idempotency_key=f'welcome:{user.id}').count(), 1)
+        self.assertEqual([message.to for message in mail.outbox], [['welcome@test.com']])
+
+    def test_backlog_metric(self):
+        """Размер очереди outbox отдается в /metrics"""
+        from .outbox import enqueue_email
+
+        enqueue_email('test:metric', 'welcome', {}, [self.user.id])
+
+        with self.settings(METRICS_PUBLIC=True):
+            response = self.client.get('/metrics')
+        self.assertContains(response, 'lms_outbox_pending 1.0')
+
+
+class EmailTemplateTestCase(TestCase):
+    """Тесты реестра шаблонов писем"""
+
+    def test_course_update_multipart(self):
+        """Письмо об обновлении курса: персональный текст и HTML с экранированием"""
+        from .emails import build_context, render_messages
+
+        course = Course.objects.create(title='Python & <Django>')
+        lesson = Lesson.objects.create(course=course, title='Модели')
+        context = build_context('course_update', {'course_id': course.id, 'lesson_ids': [lesson.id]})
+
+        messages = render_messages('course_update', context, [
+            {'email': 'anna@test.com', 'first_name': 'Анна'},
+            {'email': 'anon@test.com', 'first_name': ''},
+            {'email': '', 'first_name': 'Без адреса'},
+        ])
+
+        self.assertEqual([message.to for message in messages], [['anna@test.com'], ['anon@test.com']])
+        first, second = messages
+        self.assertEqual(first.subject, 'Обновление курса: Python & <Django>')
+        self.assertIn('Добрый день, Анна!', first.body)
+        self.assertIn('Добрый день!', second.body)
+        self.assertIn('- Модели', first.body)
+        self.assertIn(f'/courses/{course.id}/', first.body)
+
+        html, mimetype = first.alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn('Python &amp; &lt;Django&gt;', html)
+        self.assertIn('<li>Модели</li>', html)
+
+    def test_templates_compiled_once(self):
+        """Шаблон компилируется один раз на процесс"""
+        from .emails import _compile, build_context, render_messages
+
+        _compile.cache_clear()
+        user = User.objects.create_user(email='welcome@test.com', password='pass')
+        for _ in range(3):
+            render_messages('welcome', build_context('welcome', {}), [user])
+
+        info = _compile.cache_info()
+        self.assertEqual(info.misses, 3)
+        self.assertEqual(info.hits, 6)
+
+    def test_unknown_template(self):
+        """Неизвестный ключ шаблона - ошибка"""
+        from .emails import build_context
+
+        with self.assertRaises(ValueError):
+            build_context('missing', {})
+
+
+class OutboxSkipLockedTestCase(TransactionTestCase):
+    """Параллельные диспетчеры не забирают одни и те же строки"""
+
+    def test_claim_skips_locked_rows(self):
+        import threading
+        from django.db import connections, transaction
+        from .outbox import claim_batch
+
+        Outbox.objects.bulk_create([
+            Outbox(kind=Outbox.Kind.EMAIL, idempotency_key=f'test:{i}', payload={})
+            for i in range(4)
+        ])
+
+        claimed = threading.Event()
+        release = threading.Event()
+        other = []
+
+        def dispatcher():
+            try:
+                with transaction.atomic():
+                    other.extend(entry.id for entry in claim_batch(2))
+                    claimed.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=dispatcher)
+        thread.start()
+        try:
+            self.assertTrue(claimed.wait(10))
+            with transaction.atomic():
+                mine = [entry.id for entry in claim_batch(10)]
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(len(other), 2)
+        self.assertEqual(len(mine), 2)
+        self.assertFalse(set(mine) & set(other))
+
+
+class ScheduleCourseNotificationsTestCase(TestCase):
+    """Тесты периодической проверки обновлений курсов"""
+
+    def setUp(self):
+        from config.celery import app as celery_app
+
+        self.celery_app = celery_app
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+    def tearDown(self):
+        self.celery_app.conf.task_always_eager = self.always_eager
+
+    def test_only_eligible_courses_are_claimed(self):
+        """Уведомление получают курсы, обновленные за 4 часа и без уведомления за 4 часа"""
+        from unittest import mock
+        from django.core import mail
+        from .tasks import send_course_updates_notifications
+
+        now = timezone.now()
+        never_notified = [Course.objects.create(title=f'Новый {i}') for i in range(3)]
+        notified_long_ago = Course.objects.create(title='Давно уведомлен')
+        notified_recently = Course.objects.create(title='Недавно уведомлен')
+        stale = Course.objects.create(title='Старый')
+        Course.objects.filter(pk=notified_long_ago.pk).update(
+            last_notification_sent=now - timedelta(hours=5)
+        )
+        Course.objects.filter(pk=notified_recently.pk).update(
+            last_notification_sent=now - timedelta(hours=1)
+        )
+        Course.objects.filter(pk=stale.pk).update(updated_at=now - timedelta(days=1))
+
+        for course in never_notified + [notified_long_ago]:
+            Subscription.objects.create(
+                user=User.objects.create_user(email=f'sub{course.id}@test.com', password='pass'),
+                course=course,
+            )
+
+        # Пачки по 2 курса: курсор должен пройти через несколько пачек
+        with mock.patch('lms.tasks.SCHEDULE_BATCH_SIZE', 2), \
+                self.captureOnCommitCallbacks(execute=True):
+            result = send_course_updates_notifications.delay().get()
+
+        expected = {course.id for course in never_notified + [notified_long_ago]}
+        self.assertEqual(result, 'Отправлено уведомлений для 4 курсов')
+        self.assertEqual(
+            {entry.payload['course_id'] for entry in Outbox.objects.filter(kind=Outbox.Kind.COURSE_UPDATE)},
+            expected
+        )
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(
+            set(Course.objects.filter(last_notification_sent__gte=now).values_list('id', flat=True)),
+            expected
+        )
+
+        # Повторный запуск ничего не резервирует
+        self.assertEqual(
+            send_course_updates_notifications.delay().get(),
+            'Отправлено уведомлений для 0 курсов'
+        )
+
+
+class FakeSMTP:
+    """SMTP-соединение без сети для тестов пула"""
+    instances = []
+    disconnect_next = False
+
+    def __init__(self, host, port, **kwargs):
+        self.sent = []
+        self.closed = False
+        self.alive = True
+        FakeSMTP.instances.append(self)
+
+    def starttls(self, **kwargs):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def noop(self):
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected('closed')
+        return 250, b'OK'
+
+    def sendmail(self, from_email, recipients, message):
+        if FakeSMTP.disconnect_next:
+            FakeSMTP.disconnect_next = False
+            self.alive = False
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent.append(recipients)
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@override_settings(
+    EMAIL_BACKEND='lms.mail.PooledEmailBackend',
+    EMAIL_HOST='smtp.test',
+    EMAIL_PORT=25,
+    EMAIL_USE_TLS=True,
+    EMAIL_HOST_USER='user',
+    EMAIL_HOST_PASSWORD='secret',
+    EMAIL_POOL_SIZE=2,
+    EMAIL_POOL_CHECK_INTERVAL=30,
+)
+class PooledEmailBackendTestCase(TestCase):
+    """Тесты SMTP-бэкенда с пулом соединений"""
+
+    def setUp(self):
+        from unittest import mock
+        from . import mail
+
+        FakeSMTP.instances = []
+        FakeSMTP.disconnect_next = False
+        patcher = mock.patch('smtplib.SMTP', FakeSMTP)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mail.close_all()
+        self.addCleanup(mail.close_all)
+
+    def test_send_mail_reuses_connection(self):
+        """Несколько send_mail идут через одно соединение"""
+        from django.core.mail import send_mail
+        from .mail import pool_stats
+
+        for i in range(3):
+            send_mail('Тема', 'Текст', 'lms@test.com', [f'user{i}@test.com'])
+
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        self.assertEqual(len(FakeSMTP.instances[0].sent), 3)
+        self.assertFalse(FakeSMTP.instances[0].closed)
+        self.assertEqual(
+            pool_stats()[('smtp.test', 25)],
+            {'size': 2, 'opened': 1, 'idle': 1, 'created': 1, 'reused': 2}
+        )
+
+    def test_stale_connection_replaced(self):
+        """Соединение, не прошедшее проверку NOOP, заменяется новым"""
+        from django.core.mail import send_mail
+
+        send_mail('Тема', 'Текст', 'lms@test.com', ['user@test.com'])
+        FakeSMTP.instances[0].alive = False
+
+        with override_settings(EMAIL_POOL_CHECK_INTERVAL=0):
+            send_mail('Тема', 'Текст', 'lms@test.com', ['user@test.com'])
+
+        self.assertEqual(len(FakeSMTP.instances), 2)
+        self.assertTrue(FakeSMTP.instances[0].closed)
+        self.assertEqual(FakeSMTP.instances[1].sent, [['user@test.com']])
+
+    def test_reconnect_on_disconnect(self):
+        """Письмо, оборванное разрывом соединения, отправляется через новое"""
+        from django.core.mail import get_connection, EmailMessage
+
+        with get_connection() as connection:
+            EmailMessage('Тема', 'Текст', 'lms@test.com', ['first@test.com'], connection=connection).send()
+            FakeSMTP.disconnect_next = True
+            with self.assertLogs('lms.mail', 'WARNING'):
+                EmailMessage('Тема', 'Текст', 'lms@test.com', ['second@test.com'], connection=connection).send()
+
+        self.assertEqual(len(FakeSMTP.instances), 2)
+        self.assertEqual(FakeSMTP.instances[0].sent, [['first@test.com']])
+        self.assertEqual(FakeSMTP.instances[1].sent, [['second@test.com']])
+
+    def test_pool_is_bounded(self):
+        """Одновременно открыто не больше EMAIL_POOL_SIZE соединений"""
+        import smtplib
+        from django.core.mail import get_connection
+
+        with override_settings(EMAIL_POOL_TIMEOUT=0):
+            first, second, third = (get_connection() for _ in range(3))
+            first.open()
+            second.open()
+            with self.assertRaises(smtplib.SMTPServerDisconnected):
+                third.open()
+            first.close()
+            third.open()
+
+        self.assertEqual(len(FakeSMTP.instances), 2)
+        self.assertIs(third.connection, FakeSMTP.instances[0])
+        second.close()
+        third.close()
+
+
+@override_settings(
+    EMAIL_RATE_LIMIT=0.001,
+    EMAIL_RATE_BURST=10,
+    EMAIL_DAILY_LIMIT=0,
+    EMAIL_RATE_PRIORITIES={'transactional': 0.0, 'bulk': 0.2},
+)
+class EmailRateLimitTestCase(TestCase):
+    """Тесты общего ограничителя скорости отправки писем"""
+
+    def setUp(self):
+        from config.celery import app as celery_app
+
+        self.celery_app = celery_app
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+        cache.delete_pattern('lms:email:*')
+        self.addCleanup(cache.delete_pattern, 'lms:email:*')
+
+    def tearDown(self):
+        self.celery_app.conf.task_always_eager = self.always_eager
+        cache.delete('lms:fanout:chunk:chunk-limited')
+
+    def test_bulk_leaves_reserve_for_transactional(self):
+        """Массовая рассылка не занимает запас транзакционных писем"""
+        from .ratelimit import BULK, TRANSACTIONAL, acquire
+
+        self.assertEqual(acquire(BULK, 10, minimum=1)[0], 8)
+
+        granted, retry_after = acquire(BULK, 1)
+        self.assertEqual(granted, 0)
+        self.assertGreater(retry_after, 0)
+
+        self.assertEqual(acquire(TRANSACTIONAL, 2), (2, 0))
+        self.assertEqual(acquire(TRANSACTIONAL, 1)[0], 0)
+
+    @override_settings(EMAIL_RATE_LIMIT=0, EMAIL_DAILY_LIMIT=3)
+    def test_daily_limit_defers_until_tomorrow(self):
+        """После суточного лимита отправка откладывается до следующих суток"""
+        from .ratelimit import TRANSACTIONAL, acquire
+
+        self.assertEqual(acquire(TRANSACTIONAL, 3), (3, 0))
+
+        granted, retry_after = acquire(TRANSACTIONAL, 1)
+        self.assertEqual(granted, 0)
+        self.assertTrue(0 < retry_after <= 24 * 60 * 60)
+
+    @override_settings(EMAIL_RATE_BURST=3, EMAIL_RATE_PRIORITIES={'bulk': 0.0})
+    def test_chunk_defers_when_quota_exhausted(self):
+        """Чанк отправляет разрешенную часть и ставит себя заново с тем же id"""
+        from unittest import mock
+        from django.core import mail
+        from .tasks import COURSE_UPDATE_TEMPLATE, send_course_update_chunk
+
+        course = Course.objects.create(title='Квота')
+        subscriptions = [
+            Subscription.objects.create(
+                user=User.objects.create_user(email=f'limited{i}@test.com', password='pass'),
+                course=course,
+            )
+            for i in range(5)
+        ]
+
+        with mock.patch.object(send_course_update_chunk, 'apply_async') as apply_async:
+            send_course_update_chunk.apply(
+                args=(COURSE_UPDATE_TEMPLATE, course.id, 0, subscriptions[-1].id),
+                task_id='chunk-limited',
+            )
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(cache.get('lms:fanout:chunk:chunk-limited'), subscriptions[2].id)
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['task_id'], 'chunk-limited')
+        self.assertGreater(apply_async.call_args.kwargs['countdown'], 0)
+
+    @override_settings(EMAIL_RATE_BURST=2)
+    def test_outbox_defers_without_spending_attempt(self):
+        """Письмо без квоты откладывается в outbox, попытка не расходуется"""
+        from django.core import mail
+        from .outbox import enqueue_email
+        from .ratelimit import TRANSACTIONAL, acquire
+        from .tasks import dispatch_outbox
+
+        users = [
+            User.objects.create_user(email=f'report{i}@test.com', password='pass')
+            for i in range(2)
+        ]
+        self.assertEqual(acquire(TRANSACTIONAL, 1), (1, 0))
+        enqueue_email('test:limited', 'welcome', {}, [user.id for user in users])
+        dispatch_outbox.delay()
+
+        self.assertEqual(len(mail.outbox), 0)
+        entry = Outbox.objects.get()
+        self.assertEqual(entry.status, Outbox.Status.PENDING)
+        self.assertEqual(entry.attempts, 0)
+        self.assertGreater(entry.available_at, timezone.now())
+
+
+    def test_max_grant(self):
+        """Наибольший запрос, который можно выполнить за раз, учитывает запас приоритета"""
+        from .ratelimit import BULK, TRANSACTIONAL, acquire, max_grant
+
+        self.assertEqual(max_grant(BULK), 8)
+        self.assertEqual(max_grant(TRANSACTIONAL), 10)
+        self.assertEqual(acquire(BULK, 9)[0], 0)
+        self.assertEqual(acquire(BULK, 8), (8, 0))
+        with self.settings(EMAIL_RATE_LIMIT=0, EMAIL_DAILY_LIMIT=100):
+            self.assertEqual(max_grant(BULK), 80)
+        with self.settings(EMAIL_RATE_LIMIT=0):
+            self.assertIsNone(max_grant(BULK))
+
+    @override_settings(EMAIL_RATE_BURST=2)
+    def test_outbox_fails_entry_larger_than_quota(self):
+        """Письмо, которое не помещается в квоту, сразу помечается ошибочным"""
+        from django.core import mail
+        from .outbox import enqueue_email
+        from .tasks import dispatch_outbox
+
+        users = [
+            User.objects.create_user(email=f'oversized{i}@test.com', password='pass')
+            for i in range(3)
+        ]
+        enqueue_email('test:oversized', 'welcome', {}, [user.id for user in users])
+        dispatch_outbox.delay()
+
+        self.assertEqual(len(mail.outbox), 0)
+        entry = Outbox.objects.get()
+        self.assertEqual(entry.status, Outbox.Status.FAILED)
+        self.assertEqual(entry.attempts, 1)
+        self.assertIn('больше квоты', entry.last_error)
+
+
+class NotificationBenchTestCase(TransactionTestCase):
+    """
+    Тесты локального SMTP-сервера и замера рассылки (manage.py notification_bench).
+
+    Чанки рассылки уходят в outbox и отправляются после коммита, как в замере.
+    """
+
+    def setUp(self):
+        from config.celery import app as celery_app
+        from . import mail
+        from .smtp_sink import SMTPSink
+
+        self.celery_app = celery_app
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+        self.sink = SMTPSink(store=True)
+        self.sink.start()
+        self.addCleanup(self.sink.stop)
+        self.addCleanup(mail.close_all)
+        settings_override = override_settings(
+            EMAIL_BACKEND='lms.mail.PooledEmailBackend',
+            EMAIL_HOST=self.sink.host,
+            EMAIL_PORT=self.sink.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            DEFAULT_FROM_EMAIL='lms@test.com',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def tearDown(self):
+        self.celery_app.conf.task_always_eager = self.always_eager
+
+    def test_sink_receives_messages(self):
+        """Письма по SMTP принимаются и сохраняются целиком"""
+        from django.core.mail import send_mail
+
+        send_mail('Тема', 'Строка\n.с точкой', 'lms@test.com', ['first@test.com', 'second@test.com'])
+
+        self.assertTrue(self.sink.wait_for(1, timeout=5))
+        message = self.sink.messages[0]
+        self.assertEqual(message.sender, 'lms@test.com')
+        self.assertEqual(message.recipients, ['first@test.com', 'second@test.com'])
+        self.assertIn('.с точкой'.encode(), message.data)
+
+    def test_run_fanout_reports_throughput(self):
+        """Замер доставляет письмо каждому подписчику и считает скорость"""
+        from .benchmark import run_fanout, seed_subscribers
+
+        course = seed_subscribers(5)
+        result = run_fanout(course, self.sink, 5, timeout=10)
+
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['delivered'], 5)
+        self.assertGreater(result['messages_per_s'], 0)
+        self.assertGreater(result['peak_rss_mb'], 0)
+        self.assertEqual(
+            sorted(message.recipients[0] for message in self.sink.messages),
+            sorted(f'fanout{i}@bench.local' for i in range(5))
+        )
+
+
+class DailyDigestTestCase(TestCase):
+    """Тесты ежедневной сводки обновлений курсов"""
+
+    def setUp(self):
+        from config.celery import app as celery_app
+
+        self.celery_app = celery_app
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        cache.delete_pattern('lms:digest:*')
+        self.addCleanup(cache.delete_pattern, 'lms:digest:*')
+
+        self.python = Course.objects.create(title='Python')
+        self.django = Course.objects.create(title='Django')
+        self.lesson = Lesson.objects.create(
+            title='Генераторы', course=self.python, video_url='https://www.youtube.com/watch?v=test'
+        )
+
+        digest = User.NotificationMode.DIGEST
+        self.both = User.objects.create_user(email='both@test.com', password='pass', notification_mode=digest)
+        self.first = User.objects.create_user(email='first@test.com', password='pass', notification_mode=digest)
+        self.second = User.objects.create_user(email='second@test.com', password='pass', notification_mode=digest)
+        self.instant = User.objects.create_user(email='instant@test.com', password='pass')
+        for user in (self.both, self.first, self.second, self.instant):
+            Subscription.objects.create(user=user, course=self.python)
+        Subscription.objects.create(user=self.both, course=self.django)
+
+    def tearDown(self):
+        self.celery_app.conf.task_always_eager = self.always_eager
+
+    def test_digest_users_skip_instant_notification(self):
+        """Мгновенное уведомление не уходит пользователям со сводкой"""
+        from django.core import mail
+        from .tasks import send_course_update_notification
+
+        with self.captureOnCommitCallbacks(execute=True):
+            send_course_update_notification.delay(self.python.id)
+
+        self.assertEqual([message.to for message in mail.outbox], [['instant@test.com']])
+
+    def test_daily_digest_groups_recipients(self):
+        """Одно письмо на пользователя в день, одинаковые наборы курсов - одна запись outbox"""
+        from django.core import mail
+        from .digest import record_course_update, send_digests
+
+        record_course_update(self.python.id, self.lesson.id)
+        record_course_update(self.django.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(send_digests('2026-01-01'), 3)
+
+        self.assertEqual(Outbox.objects.count(), 2)
+        self.assertEqual(
+            sorted(entry.payload['user_ids'] for entry in Outbox.objects.all()),
+            [[self.both.id], [self.first.id, self.second.id]]
+        )
+        messages = {message.to[0]: message for message in mail.outbox}
+        self.assertEqual(sorted(messages), ['both@test.com', 'first@test.com', 'second@test.com'])
+        self.assertIn('Django', messages['both@test.com'].body)
+        self.assertIn('Генераторы', messages['first@test.com'].body)
+        self.assertNotIn('Django', messages['first@test.com'].body)
+
+        # Повтор за тот же день ничего не отправляет
+        self.assertEqual(send_digests('2026-01-01'), 0)
+        self.assertEqual(Outbox.objects.count(), 2)
+
+    def test_digest_resumes_from_cursor(self):
+        """Повтор прерванной сводки продолжает с сохраненного курсора"""
+        from .digest import CURSOR_KEY, record_course_update, send_digests
+
+        record_course_update(self.python.id)
+        cache.set(CURSOR_KEY.format(day='2026-01-02'), self.first.id)
+
+        self.assertEqual(send_digests('2026-01-02'), 1)
+        self.assertEqual(Outbox.objects.get().payload['user_ids'], [self.second.id])
+
+    @override_settings(
+        EMAIL_RATE_LIMIT=0.001,
+        EMAIL_RATE_BURST=10,
+        EMAIL_DAILY_LIMIT=0,
+        EMAIL_RATE_PRIORITIES={'transactional': 0.0, 'bulk': 0.2},
+        DIGEST_GROUP_SIZE=10,
+    )
+    def test_digest_groups_fit_rate_limit(self):
+        """При ограничении скорости письмо сводки помещается в квоту bulk за раз"""
+        from django.core import mail
+        from .digest import record_course_update, send_digests
+
+        cache.delete_pattern('lms:email:*')
+        self.addCleanup(cache.delete_pattern, 'lms:email:*')
+        for i in range(10):
+            user = User.objects.create_user(
+                email=f'digest{i}@test.com', password='pass', notification_mode=User.NotificationMode.DIGEST
+            )
+            Subscription.objects.create(user=user, course=self.django)
+        record_course_update(self.django.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(send_digests('2026-01-04'), 11)
+
+        self.assertEqual(
+            sorted(len(entry.payload['user_ids']) for entry in Outbox.objects.all()), [3, 8]
+        )
+        self.assertEqual(Outbox.objects.filter(status=Outbox.Status.DELIVERED).count(), 1)
+        self.assertEqual(Outbox.objects.filter(status=Outbox.Status.PENDING).count(), 1)
+        self.assertEqual(len(mail.outbox), 8)
+
+    def test_lesson_update_is_recorded_for_digest(self):
+        """Обновление урока попадает в сводку даже в пределах интервала 4 часа"""
+        from unittest import mock
+        from .digest import take_snapshot
+
+        Course.objects.filter(id=self.python.id).update(last_notification_sent=timezone.now())
+        with mock.patch('lms.tasks.dispatch_outbox.apply_async'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.lesson.title = 'Генераторы и итераторы'
+            self.lesson.save()
+
+        self.assertEqual(take_snapshot('2026-01-03'), {self.python.id: [self.lesson.id]})
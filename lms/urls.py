@@ -7,6 +7,9 @@ from .views import (
     LessonUpdateView,
     LessonDestroyView,
     SubscriptionViewSet,
+    CacheStatsAPIView,
+    SearchAPIView,
+    SearchAutocompleteAPIView,
 )
 
 router = DefaultRouter()
@@ -22,6 +25,13 @@ urlpatterns = [
     path('lessons/<int:pk>/update/', LessonUpdateView.as_view(), name='lesson-update'),
     path('lessons/<int:pk>/delete/', LessonDestroyView.as_view(), name='lesson-delete'),
 
+    # Поиск
+    path('search/', SearchAPIView.as_view(), name='search'),
+    path('search/autocomplete/', SearchAutocompleteAPIView.as_view(), name='search-autocomplete'),
+
+    # Статистика кэша
+    path('cache/stats/', CacheStatsAPIView.as_view(), name='cache-stats'),
+
     # Эндпоинты для подписок
     path('subscriptions/subscribe/', SubscriptionViewSet.as_view({'post': 'subscribe'}), name='subscription-subscribe'),
     path('subscriptions/unsubscribe/', SubscriptionViewSet.as_view({'post': 'unsubscribe'}),
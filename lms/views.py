@@ -1,16 +1,32 @@
 from rest_framework import viewsets, generics, permissions, status
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.contrib.auth import get_user_model
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
-from .models import Course, Lesson
-from .serializers import CourseSerializer, LessonSerializer, SubscriptionSerializer
+from django.db.models import Count, Exists, Max, OuterRef, Prefetch, Subquery, Value, BooleanField
+from .models import Course, Lesson, Subscription
+from . import cache as api_cache
+from .serializers import (
+    CourseSerializer,
+    LessonSerializer,
+    SubscriptionSerializer,
+    CourseSearchSerializer,
+    LessonSearchSerializer,
+    AutocompleteSerializer,
+)
 from users.permissions import IsOwnerOrModerator, IsModerator, IsOwner
-from .paginators import CoursePagination, LessonPagination, SubscriptionPagination
+from .paginators import CoursePagination, LessonPagination, SubscriptionPagination, SearchPagination
+from .fieldsets import restrict_to_serializer, fields_parameter, expand_parameter
+from .search import FullTextSearchFilter, search_parameter, search, autocomplete
+from .conditional import ConditionalGetMixin
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+User = get_user_model()
 
-class CourseViewSet(viewsets.ModelViewSet):
+
+class CourseViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API для управления курсами.
 
@@ -27,13 +43,112 @@ class CourseViewSet(viewsets.ModelViewSet):
     serializer_class = CourseSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = CoursePagination
+    filter_backends = [FullTextSearchFilter]
+
+    def get_queryset(self):
+        """
+        Курсы с аннотациями для сериализатора.
+
+        Количество уроков, флаг подписки и сами уроки загружаются
+        фиксированным числом запросов, независимо от размера страницы.
+        Для GET-запросов читаются только поля, выбранные через ?fields=,
+        а уроки подгружаются только по ?expand=lessons.
+        """
+        queryset = Course.objects.all()
+        if self.request.method == 'GET':
+            serializer = self.get_serializer()
+            fields = serializer.fields
+            queryset = restrict_to_serializer(queryset, serializer)
+        else:
+            fields = {'lessons_count', 'is_subscribed', 'lessons'}
+
+        if 'lessons_count' in fields:
+            queryset = queryset.annotate(lessons_count=Count('lessons'))
+
+        if 'is_subscribed' in fields:
+            user = self.request.user
+            if user.is_authenticated:
+                is_subscribed = Exists(
+                    Subscription.objects.filter(
+                        course=OuterRef('pk'),
+                        user=user,
+                        is_active=True
+                    )
+                )
+            else:
+                is_subscribed = Value(False, output_field=BooleanField())
+            queryset = queryset.annotate(is_subscribed=is_subscribed)
+
+        if 'lessons' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('lessons', queryset=Lesson.objects.order_by('created_at'))
+            )
+
+        return queryset
+
+    def get_conditional_validators(self, request):
+        """
+        Валидаторы для условных запросов.
+
+        Для курса - одним запросом: updated_at курса, последнее изменение
+        и количество уроков (удаление урока тоже меняет ETag) и изменение
+        подписки текущего пользователя. Для списка - версия каталога из
+        кэша и подписки пользователя.
+        """
+        user = self.request.user
+        subscriptions = Subscription.objects.filter(user=user)
+
+        if self.action == 'list':
+            state = subscriptions.aggregate(
+                updated=Max('updated_at'),
+                count=Count('id'),
+            )
+            parts = (api_cache.catalog_version(), state['updated'], state['count'])
+            return parts, None
+
+        try:
+            courses = Course.objects.filter(pk=self.kwargs['pk'])
+        except (TypeError, ValueError):
+            return None
+
+        state = courses.annotate(
+            lessons_updated=Max('lessons__updated_at'),
+            lessons_total=Count('lessons'),
+            subscription_updated=Subquery(
+                subscriptions.filter(course=OuterRef('pk')).values('updated_at')[:1]
+            ),
+        ).values('updated_at', 'lessons_updated', 'lessons_total', 'subscription_updated').first()
+
+        if state is None:
+            return None
+
+        last_modified = max(
+            value for value in (
+                state['updated_at'],
+                state['lessons_updated'],
+                state['subscription_updated'],
+            ) if value is not None
+        )
+        return tuple(state.values()), last_modified
 
     @swagger_auto_schema(
         operation_description="Получить список курсов",
+        manual_parameters=[search_parameter, fields_parameter, expand_parameter],
         responses={200: CourseSerializer(many=True)}
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        return self.conditional_response(request, self.get_list_response, *args, **kwargs)
+
+    def get_list_response(self, request, *args, **kwargs):
+        key = api_cache.course_list_key(request)
+        data = api_cache.get_response(key)
+        if data is not None:
+            api_cache.overlay_is_subscribed(data['results'], request.user)
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        api_cache.set_response(key, response.data)
+        return response
 
     @swagger_auto_schema(
         operation_description="Создать новый курс",
@@ -49,13 +164,26 @@ class CourseViewSet(viewsets.ModelViewSet):
 
     @swagger_auto_schema(
         operation_description="Получить детальную информацию о курсе",
+        manual_parameters=[fields_parameter, expand_parameter],
         responses={
             200: CourseSerializer,
+            304: "Курс не изменился",
             404: "Курс не найден"
         }
     )
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(request, self.get_retrieve_response, *args, **kwargs)
+
+    def get_retrieve_response(self, request, *args, **kwargs):
+        key = api_cache.course_detail_key(self.kwargs['pk'], request)
+        data = api_cache.get_response(key)
+        if data is not None:
+            api_cache.overlay_is_subscribed([data], request.user)
+            return Response(data)
+
+        response = super().retrieve(request, *args, **kwargs)
+        api_cache.set_response(key, response.data)
+        return response
 
     @swagger_auto_schema(
         operation_description="Обновить курс",
@@ -105,6 +233,19 @@ class LessonListCreateView(generics.ListCreateAPIView):
     serializer_class = LessonSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = LessonPagination
+    filter_backends = [FullTextSearchFilter]
+
+    def get_queryset(self):
+        """Уроки с фильтром по курсу и только запрошенными полями"""
+        queryset = Lesson.objects.all()
+
+        course_id = self.request.query_params.get('course')
+        if course_id:
+            queryset = queryset.filter(course_id=course_id)
+
+        if self.request.method == 'GET':
+            queryset = restrict_to_serializer(queryset, self.get_serializer())
+        return queryset
 
     @swagger_auto_schema(
         operation_description="Получить список уроков",
@@ -114,7 +255,9 @@ class LessonListCreateView(generics.ListCreateAPIView):
                 openapi.IN_QUERY,
                 description="Фильтр по ID курса",
                 type=openapi.TYPE_INTEGER
-            )
+            ),
+            search_parameter,
+            fields_parameter,
         ],
         responses={200: LessonSerializer(many=True)}
     )
@@ -134,7 +277,7 @@ class LessonListCreateView(generics.ListCreateAPIView):
         return super().post(request, *args, **kwargs)
 
 
-class LessonRetrieveView(generics.RetrieveAPIView):
+class LessonRetrieveView(ConditionalGetMixin, generics.RetrieveAPIView):
     """
     API для получения детальной информации об уроке.
 
@@ -145,18 +288,187 @@ class LessonRetrieveView(generics.RetrieveAPIView):
     serializer_class = LessonSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrModerator]
 
+    def get_queryset(self):
+        """Только запрошенные поля, владелец и курс нужны для прав и кэша"""
+        return restrict_to_serializer(
+            super().get_queryset(),
+            self.get_serializer(),
+            extra=('owner', 'course')
+        )
+
     @swagger_auto_schema(
         operation_description="Получить детальную информацию об уроке",
+        manual_parameters=[fields_parameter],
         responses={
             200: LessonSerializer,
+            304: "Урок не изменился",
             403: "Нет прав доступа к уроку",
             404: "Урок не найден"
         }
     )
+    def get(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().get, *args, **kwargs)
+
+    def get_conditional_validators(self, request):
+        """
+        Валидаторы по updated_at урока.
+
+        Права проверяются здесь же, чтобы ответ 304 не подтверждал
+        существование урока пользователю без доступа.
+        """
+        state = Lesson.objects.filter(pk=self.kwargs['pk']).values(
+            'updated_at', 'owner', 'course'
+        ).first()
+        if state is None:
+            return None
+
+        self.check_object_permissions(request, self.get_permission_object(state))
+        return (state['updated_at'],), state['updated_at']
+
+    def retrieve(self, request, *args, **kwargs):
+        entry = api_cache.get_lesson_response(self.kwargs['pk'], request)
+        if entry is not None:
+            self.check_object_permissions(request, self.get_permission_object(entry))
+            return Response(entry['data'])
+
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        api_cache.set_lesson_response(instance, request, serializer.data)
+        return Response(serializer.data)
+
+    def get_permission_object(self, entry):
+        """
+        Урок для проверки прав по записи из кэша без запроса к базе.
+
+        Владелец подставляется объектом с тем же id, поэтому сравнение
+        obj.owner == request.user в IsOwnerOrModerator работает как обычно.
+        """
+        owner = User(pk=entry['owner']) if entry['owner'] else None
+        return Lesson(pk=self.kwargs['pk'], course_id=entry['course'], owner=owner)
+
+
+search_type_parameter = openapi.Parameter(
+    'type',
+    openapi.IN_QUERY,
+    description="Где искать: courses (по умолчанию) или lessons",
+    type=openapi.TYPE_STRING,
+    enum=['courses', 'lessons']
+)
+
+
+class SearchTypeMixin:
+    """Выбор модели для поиска по параметру ?type="""
+    search_models = {
+        'courses': (Course, CourseSearchSerializer),
+        'lessons': (Lesson, LessonSearchSerializer),
+    }
+
+    def get_search_type(self):
+        search_type = self.request.query_params.get('type', 'courses')
+        return search_type if search_type in self.search_models else 'courses'
+
+    def get_search_text(self):
+        return self.request.query_params.get('q', '').strip()
+
+
+class SearchAPIView(SearchTypeMixin, generics.ListAPIView):
+    """
+    API полнотекстового поиска по курсам и урокам.
+
+    Результаты упорядочены по релевантности и разбиты на страницы
+    курсором по (релевантность, id).
+    Требуется аутентификация через JWT токен.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SearchPagination
+
+    def get_serializer_class(self):
+        return self.search_models[self.get_search_type()][1]
+
+    def get_queryset(self):
+        model = self.search_models[self.get_search_type()][0]
+        fields = ['id', 'title', 'price'] if model is Course else ['id', 'title', 'course']
+        queryset = model.objects.only(*fields)
+        text = self.get_search_text()
+        if not text:
+            # Пустой запрос: аннотация ранга нужна пагинации, запроса к базе не будет
+            queryset = queryset.none()
+        return search(queryset, text)
+
+    @swagger_auto_schema(
+        operation_description="Полнотекстовый поиск по курсам и урокам",
+        manual_parameters=[
+            openapi.Parameter(
+                'q',
+                openapi.IN_QUERY,
+                description="Поисковый запрос",
+                type=openapi.TYPE_STRING
+            ),
+            search_type_parameter,
+        ],
+        responses={200: CourseSearchSerializer(many=True)}
+    )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
 
+class SearchAutocompleteAPIView(SearchTypeMixin, APIView):
+    """
+    API подсказок для строки поиска.
+
+    Нечеткое совпадение по началу слов заголовка, поэтому опечатки
+    и недописанные слова тоже находятся.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    limit = 10
+
+    @swagger_auto_schema(
+        operation_description="Подсказки по заголовкам курсов или уроков",
+        manual_parameters=[
+            openapi.Parameter(
+                'q',
+                openapi.IN_QUERY,
+                description="Начало заголовка",
+                type=openapi.TYPE_STRING
+            ),
+            search_type_parameter,
+        ],
+        responses={200: AutocompleteSerializer(many=True)}
+    )
+    def get(self, request):
+        text = self.get_search_text()
+        if not text:
+            return Response([])
+
+        model = self.search_models[self.get_search_type()][0]
+        queryset = autocomplete(model.objects.only('id', 'title'), text, limit=self.limit)
+        return Response(AutocompleteSerializer(queryset, many=True).data)
+
+
+class CacheStatsAPIView(APIView):
+    """
+    API для просмотра статистики кэша курсов и уроков.
+
+    Доступ: только администраторы.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Получить количество попаданий и промахов кэша",
+        responses={200: "Статистика кэша"}
+    )
+    def get(self, request):
+        return Response(api_cache.get_stats())
+
+    @swagger_auto_schema(
+        operation_description="Сбросить счетчики кэша",
+        responses={204: "Счетчики сброшены"}
+    )
+    def delete(self, request):
+        api_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class LessonUpdateView(generics.UpdateAPIView):
     """
     API для обновления урока.
@@ -247,6 +559,10 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = SubscriptionPagination
 
+    def get_queryset(self):
+        """Подписки текущего пользователя"""
+        return Subscription.objects.filter(user=self.request.user)
+
     @swagger_auto_schema(
         operation_description="Подписаться на курс",
         request_body=openapi.Schema(
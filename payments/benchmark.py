@@ -0,0 +1,180 @@
+"""
+Замер checkout по HTTP (manage.py checkout_bench).
+
+Синхронное представление работает в WSGI-сервере с фиксированным числом
+потоков, асинхронное - под uvicorn, оба в этом же процессе. Stripe
+заменяет локальный сервер с задержкой ответа (payments/fake_stripe.py).
+Нагрузку создает асинхронный httpx-клиент с заданным числом
+одновременных запросов.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.db import connections
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from lms.benchmark import percentile
+from lms.models import Course, StripeProduct
+
+from .products import cache_price, unit_amount
+
+User = get_user_model()
+
+
+def seed_checkout(price=Decimal('1990.00'), fake=None):
+    """
+    Платный курс с готовой ценой Stripe в кэше и покупатель.
+
+    Курс создается через bulk_create, без сигнала создания цены: цена
+    записывается сразу. fake - локальная замена Stripe
+    (payments/fake_stripe.py), в которой создаются те же продукт и цена.
+    Возвращает (курс, access-токен покупателя).
+    """
+    course, = Course.objects.bulk_create([
+        Course(title='Замер checkout', description='Курс для замера checkout', price=price)
+    ])
+    stripe_product = StripeProduct.objects.create(
+        course=course, product_id='prod_bench', price_id='price_bench', unit_amount=unit_amount(price)
+    )
+    cache_price(stripe_product, course.title)
+    if fake is not None:
+        fake.create_product(id='prod_bench', name=course.title)
+        fake.create_price(
+            id='price_bench', product='prod_bench', currency=settings.STRIPE_CURRENCY,
+            unit_amount=stripe_product.unit_amount,
+        )
+    user = User.objects.create(email='checkout@bench.local', password=make_password(None))
+    return course, str(RefreshToken.for_user(user).access_token)
+
+
+class _WSGIRequestHandler(WSGIRequestHandler):
+    # Соединение закрывается после ответа, как в синхронных воркерах
+    # gunicorn: keep-alive не занимает воркер между запросами
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _PooledWSGIServer(WSGIServer):
+    """WSGI-сервер с фиксированным числом потоков-воркеров"""
+    request_queue_size = 1024
+
+    def __init__(self, *args, workers, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wsgi-worker')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            connections.close_all()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+@contextmanager
+def serve_wsgi(workers, host='127.0.0.1'):
+    """config/wsgi.py в workers потоках этого процесса, возвращает адрес сервера"""
+    from django.core.wsgi import get_wsgi_application
+
+    server = _PooledWSGIServer((host, 0), _WSGIRequestHandler, workers=workers)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, name='wsgi-server', daemon=True)
+    thread.start()
+    try:
+        yield f'http://{host}:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+@contextmanager
+def serve_asgi(host='127.0.0.1', startup_timeout=10):
+    """config/asgi.py под uvicorn в потоке этого процесса, возвращает адрес сервера"""
+    import uvicorn
+
+    from config.asgi import application
+
+    # Порт выбирает uvicorn: на его сокетах asyncio включает TCP_NODELAY
+    server = uvicorn.Server(uvicorn.Config(
+        application, host=host, port=0, lifespan='on', log_level='warning',
+        access_log=False, backlog=1024,
+    ))
+    thread = threading.Thread(target=server.run, name='asgi-server', daemon=True)
+    thread.start()
+    deadline = time.monotonic() + startup_timeout
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError('ASGI-сервер не запустился')
+        time.sleep(0.01)
+    try:
+        yield f'http://{host}:{server.servers[0].sockets[0].getsockname()[1]}'
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def run_http_load(url, body=None, headers=None, requests=200, concurrency=50, warmup=5, timeout=60,
+                  make_request=None):
+    """
+    Нагрузка POST-запросами с JSON: concurrency запросов одновременно,
+    всего requests. make_request() вместо body возвращает аргументы
+    client.post для каждого запроса (тело, заголовки). Возвращает сводку
+    задержек и пропускной способности.
+    """
+    import httpx
+
+    def request_kwargs():
+        return make_request() if make_request else {'json': body}
+
+    async def run():
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=timeout, headers=headers) as client:
+            for _ in range(warmup):
+                await client.post(url, **request_kwargs())
+
+            pending = iter(range(requests))
+            samples = []
+
+            async def worker():
+                for _ in pending:
+                    start = time.perf_counter()
+                    try:
+                        status_code = (await client.post(url, **request_kwargs())).status_code
+                    except httpx.HTTPError:
+                        status_code = None
+                    samples.append((time.perf_counter() - start, status_code))
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return samples, time.perf_counter() - start
+
+    samples, elapsed = asyncio.run(run())
+    latencies = [latency for latency, _ in samples]
+    return {
+        'requests': len(samples),
+        'concurrency': concurrency,
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'errors': sum(1 for _, status_code in samples if status_code != 200),
+    }
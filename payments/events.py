@@ -0,0 +1,192 @@
+"""
+Обработка событий webhook Stripe.
+
+Webhook проверяет подпись, сохраняет событие в таблицу StripeEvent и
+сразу отвечает 200: Stripe не ждет обработки и не повторяет доставку из-за
+медленного ответа. Повторная доставка того же события отсекается
+уникальным event_id (INSERT ... ON CONFLICT DO NOTHING).
+
+Задача process_stripe_events забирает события пачками через SELECT ...
+FOR UPDATE SKIP LOCKED. События одного объекта Stripe (сессии, платежа)
+обрабатываются в порядке создания: в пачку попадает только самое раннее
+необработанное событие объекта, следующее становится доступно после него,
+в том числе когда первое ждет повтора после ошибки.
+
+Ошибка обработчика откладывает повтор с растущей задержкой, после
+STRIPE_EVENTS_MAX_ATTEMPTS попыток событие помечается как
+необработанное (dead) и больше не задерживает события своего объекта.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from lms.models import StripeEvent
+from users.models import Payment
+
+logger = logging.getLogger(__name__)
+
+QUEUED_KEY = 'payments:stripe:events:queued'
+# Задача обработки ставится не чаще раза в QUEUED_TIMEOUT секунд, если
+# предыдущая еще не начала работу
+QUEUED_TIMEOUT = 60
+
+# Задержка повторной обработки: 30 с, 1 мин, 2 мин ... но не больше часа
+RETRY_DELAY = timedelta(seconds=30)
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+
+def store_event(event):
+    """
+    Сохранение проверенного события (словарь из тела webhook).
+
+    Уже сохраненное событие игнорируется. После коммита ставится задача
+    обработки, если она еще не ждет в очереди.
+    """
+    data_object = event.get('data', {}).get('object', {})
+    StripeEvent.objects.bulk_create([StripeEvent(
+        event_id=event['id'],
+        type=event.get('type', ''),
+        object_id=data_object.get('id') or '',
+        created=datetime.fromtimestamp(event.get('created', 0), tz=dt_timezone.utc),
+        payload=event,
+    )], ignore_conflicts=True)
+
+    transaction.on_commit(schedule_processing)
+
+
+def schedule_processing():
+    from .tasks import process_stripe_events
+
+    if cache.add(QUEUED_KEY, 1, timeout=QUEUED_TIMEOUT):
+        process_stripe_events.delay()
+
+
+def claim_events(batch_size):
+    """
+    Блокировка пачки событий, готовых к обработке.
+
+    Должна вызываться в транзакции. Событие готово, если у его объекта нет
+    более раннего необработанного события (события без объекта независимы);
+    события, заблокированные другим обработчиком, пропускаются.
+    """
+    earlier = StripeEvent.objects.filter(
+        Q(created__lt=OuterRef('created')) | Q(created=OuterRef('created'), id__lt=OuterRef('id')),
+        status=StripeEvent.Status.PENDING,
+        object_id=OuterRef('object_id'),
+    )
+    return list(
+        StripeEvent.objects.select_for_update(skip_locked=True)
+        .filter(status=StripeEvent.Status.PENDING, available_at__lte=timezone.now())
+        .filter(Q(object_id='') | ~Exists(earlier))
+        .order_by('created', 'id')[:batch_size]
+    )
+
+
+# Обработчики событий
+#
+# Платеж находится по уникальному ID сессии оплаты (сохраняется при
+# checkout) или ID платежа Stripe (сохраняется при завершении сессии).
+# Событие по неизвестной сессии или платежу пропускается.
+
+def _set_status(payments, status, **fields):
+    # Оплаченный платеж не становится неоплаченным из-за запоздавшего события
+    if status != Payment.Status.PAID:
+        payments = payments.exclude(status=Payment.Status.PAID)
+    return payments.update(status=status, **fields)
+
+
+def handle_checkout_session_completed(event):
+    """
+    Сессия оплаты завершена.
+
+    Оплата картой подтверждена сразу (payment_status = paid); для
+    отложенных способов оплаты платеж ждет события async_payment_*.
+    """
+    session = event['data']['object']
+    fields = {}
+    if session.get('payment_intent'):
+        fields['stripe_payment_intent_id'] = session['payment_intent']
+
+    payments = Payment.objects.filter(stripe_session_id=session['id'])
+    if session.get('payment_status') in ('paid', 'no_payment_required'):
+        _set_status(payments, Payment.Status.PAID, **fields)
+    elif fields:
+        payments.update(**fields)
+
+
+def handle_checkout_session_paid(event):
+    """Отложенная оплата сессии прошла"""
+    session = event['data']['object']
+    _set_status(Payment.objects.filter(stripe_session_id=session['id']), Payment.Status.PAID)
+
+
+def handle_checkout_session_failed(event):
+    """Отложенная оплата не прошла или сессия истекла"""
+    session = event['data']['object']
+    _set_status(Payment.objects.filter(stripe_session_id=session['id']), Payment.Status.FAILED)
+
+
+def handle_payment_intent_succeeded(event):
+    """Успешный платеж"""
+    payment_intent = event['data']['object']
+    _set_status(
+        Payment.objects.filter(stripe_payment_intent_id=payment_intent['id']), Payment.Status.PAID
+    )
+
+
+def handle_payment_intent_failed(event):
+    """Платеж отклонен"""
+    payment_intent = event['data']['object']
+    _set_status(
+        Payment.objects.filter(stripe_payment_intent_id=payment_intent['id']), Payment.Status.FAILED
+    )
+
+
+HANDLERS = {
+    'checkout.session.completed': handle_checkout_session_completed,
+    'checkout.session.async_payment_succeeded': handle_checkout_session_paid,
+    'checkout.session.async_payment_failed': handle_checkout_session_failed,
+    'checkout.session.expired': handle_checkout_session_failed,
+    'payment_intent.succeeded': handle_payment_intent_succeeded,
+    'payment_intent.payment_failed': handle_payment_intent_failed,
+}
+
+
+def process_events(events):
+    """
+    Обработка пачки событий.
+
+    Каждое событие обрабатывается в своей точке сохранения: ошибка
+    откатывает только его изменения. События без обработчика отмечаются
+    обработанными. Возвращает количество обработанных событий.
+    """
+    processed = 0
+    for event in events:
+        now = timezone.now()
+        event.attempts += 1
+        try:
+            handler = HANDLERS.get(event.type)
+            if handler:
+                with transaction.atomic():
+                    handler(event.payload)
+        except Exception as e:
+            logger.warning(f"Событие Stripe {event.event_id} ({event.type}) не обработано: {e}")
+            event.last_error = str(e)
+            event.available_at = now + min(RETRY_DELAY * 2 ** (event.attempts - 1), MAX_RETRY_DELAY)
+            if event.attempts >= settings.STRIPE_EVENTS_MAX_ATTEMPTS:
+                event.status = StripeEvent.Status.DEAD
+        else:
+            event.status = StripeEvent.Status.PROCESSED
+            event.processed_at = now
+            event.last_error = ''
+            processed += 1
+
+    StripeEvent.objects.bulk_update(
+        events, ['status', 'attempts', 'available_at', 'processed_at', 'last_error']
+    )
+    return processed
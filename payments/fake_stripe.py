@@ -0,0 +1,526 @@
+"""
+Локальная замена Stripe API для тестов, замеров и разработки без сети.
+
+HTTP-сервер на asyncio в отдельном потоке отвечает как Stripe API на
+запросы, которые делает проект: продукты, цены (создание, архивирование)
+и сессии оплаты. stripe-python и асинхронный клиент (payments/stripe_async.py)
+направляются на него через api_base:
+
+    with FakeStripe(latency=0.3) as fake:
+        with override_settings(STRIPE_API_BASE=fake.url), \\
+                mock.patch('stripe.api_base', fake.url):
+            ...
+
+Объекты хранятся в памяти процесса. Запросы с одинаковым Idempotency-Key
+получают один и тот же ответ, как в Stripe. Задержка ответа (latency и
+случайная добавка jitter) имитирует время ответа настоящего API, ошибки
+задаются правилами fail() или долей случайных отказов error_rate.
+
+Оплата: страница checkout_url (GET /c/pay/<id>) завершает сессию и
+перенаправляет на success_url, а события checkout.session.completed и
+payment_intent.succeeded подписываются секретом webhook и отправляются на
+webhook_url, как это делает Stripe. В тестах без HTTP-сервера приложения
+события берутся из complete_session и подписываются через signed().
+
+Соединения держатся открытыми (HTTP/1.1 keep-alive): по счетчику
+connections видно, переиспользует ли клиент соединения.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from urllib.parse import parse_qsl
+
+import stripe
+
+REASONS = {
+    200: 'OK', 303: 'See Other', 400: 'Bad Request', 401: 'Unauthorized', 402: 'Request Failed',
+    404: 'Not Found', 405: 'Method Not Allowed', 429: 'Too Many Requests', 500: 'Internal Server Error',
+}
+ERROR_TYPES = {400: 'invalid_request_error', 402: 'card_error', 404: 'invalid_request_error'}
+
+# (метод, путь) -> обработчик; id объекта - группа id
+ROUTES = [
+    ('POST', re.compile(r'^/v1/products$'), '_create_product'),
+    ('GET', re.compile(r'^/v1/products/(?P<id>[^/]+)$'), '_retrieve'),
+    ('POST', re.compile(r'^/v1/products/(?P<id>[^/]+)$'), '_update'),
+    ('POST', re.compile(r'^/v1/prices$'), '_create_price'),
+    ('GET', re.compile(r'^/v1/prices/(?P<id>[^/]+)$'), '_retrieve'),
+    ('POST', re.compile(r'^/v1/prices/(?P<id>[^/]+)$'), '_update'),
+    ('POST', re.compile(r'^/v1/checkout/sessions$'), '_create_session'),
+    ('GET', re.compile(r'^/v1/checkout/sessions/(?P<id>[^/]+)$'), '_retrieve'),
+    ('POST', re.compile(r'^/v1/checkout/sessions/(?P<id>[^/]+)/expire$'), '_expire_session'),
+    ('GET', re.compile(r'^/c/pay/(?P<id>[^/]+)$'), '_pay_page'),
+]
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Заголовок Stripe-Signature для тела webhook payload (str)"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def decode_params(pairs):
+    """
+    Разбор параметров в формате Stripe API: line_items[0][price]=... в
+    {'line_items': [{'price': ...}]}. Обратная операция к encode_params
+    (payments/stripe_async.py).
+    """
+    root = {}
+    for key, value in pairs:
+        parts = re.findall(r'[^\[\]]+', key)
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if parts:
+            node[parts[-1]] = value
+    return _lists(root)
+
+
+def _lists(node):
+    if not isinstance(node, dict):
+        return node
+    node = {key: _lists(value) for key, value in node.items()}
+    if node and all(key.isdigit() for key in node):
+        return [node[key] for key in sorted(node, key=int)]
+    return node
+
+
+class StripeError(Exception):
+    """Ответ с ошибкой в формате Stripe"""
+
+    def __init__(self, status, message, param=None, code=None):
+        super().__init__(message)
+        self.status = status
+        self.body = {'error': {
+            'type': ERROR_TYPES.get(status, 'api_error'),
+            'message': message,
+            **({'param': param} if param else {}),
+            **({'code': code} if code else {}),
+        }}
+
+
+@dataclass
+class ReceivedRequest:
+    """Принятый запрос"""
+    method: str
+    path: str
+    headers: dict
+    params: dict
+    received_at: float
+
+
+class FakeStripe:
+    """
+    Сервер, который отвечает как Stripe API.
+
+    port=0 - свободный порт, выбранный системой (атрибут port после
+    start). latency и jitter - задержка ответа в секундах, error_rate -
+    доля запросов к API, которые получают ошибку 500. webhook_url и
+    webhook_secret - куда и с какой подписью отправлять события.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, jitter=0, error_rate=0,
+                 webhook_url=None, webhook_secret=None, store=True, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.store = store
+        self.objects = {}
+        self.requests = []
+        self.deliveries = []  # (id события, статус ответа webhook или None)
+        self.count = 0
+        self.connections = 0
+        self._errors = []
+        self._idempotent = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._writers = set()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port)
+                )
+            except OSError as e:
+                errors.append(e)
+                started.set()
+                self._loop.close()
+                return
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            try:
+                self._loop.run_forever()
+            finally:
+                self._server.close()
+                for writer in list(self._writers):
+                    writer.close()
+                self._loop.run_until_complete(self._server.wait_closed())
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='fake-stripe', daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        """Сброс счетчиков, принятых запросов и правил ошибок (объекты остаются)"""
+        with self._lock:
+            self.requests = []
+            self.deliveries = []
+            self.count = 0
+            self.connections = 0
+            self._errors = []
+
+    def fail(self, status=500, message='Injected error', path=None, method=None, times=None, code=None):
+        """
+        Ошибка для запросов к API.
+
+        path - начало пути (/v1/prices), method - метод; по умолчанию все
+        запросы. times - сколько запросов получат ошибку (None - все).
+        """
+        with self._lock:
+            self._errors.append({
+                'status': status, 'message': message, 'path': path,
+                'method': method, 'times': times, 'code': code,
+            })
+
+    # Объекты
+
+    def _id(self, prefix):
+        return f'{prefix}_{uuid.uuid4().hex[:24]}'
+
+    def _save(self, obj):
+        with self._lock:
+            self.objects[obj['id']] = obj
+        return obj
+
+    def _get(self, object_id, kind=None):
+        with self._lock:
+            obj = self.objects.get(object_id)
+        if obj is None or (kind and obj['object'] != kind):
+            raise StripeError(404, f"No such {kind or 'object'}: '{object_id}'", param='id', code='resource_missing')
+        return obj
+
+    def create_product(self, **params):
+        if not params.get('name'):
+            raise StripeError(400, 'Missing required param: name.', param='name')
+        return self._save({
+            'id': params.get('id') or self._id('prod'),
+            'object': 'product',
+            'active': True,
+            'name': params['name'],
+            'description': params.get('description'),
+            'metadata': params.get('metadata') or {},
+            'created': int(time.time()),
+            'livemode': False,
+        })
+
+    def create_price(self, **params):
+        for name in ('currency', 'product', 'unit_amount'):
+            if params.get(name) in (None, ''):
+                raise StripeError(400, f'Missing required param: {name}.', param=name)
+        self._get(params['product'], 'product')
+        try:
+            amount = int(params['unit_amount'])
+        except ValueError:
+            raise StripeError(400, 'Invalid integer: unit_amount', param='unit_amount')
+        return self._save({
+            'id': params.get('id') or self._id('price'),
+            'object': 'price',
+            'active': True,
+            'currency': params['currency'],
+            'product': params['product'],
+            'unit_amount': amount,
+            'type': 'one_time',
+            'metadata': params.get('metadata') or {},
+            'created': int(time.time()),
+            'livemode': False,
+        })
+
+    def create_session(self, **params):
+        line_items = params.get('line_items')
+        if not line_items:
+            raise StripeError(400, 'Missing required param: line_items.', param='line_items')
+        amount = 0
+        for index, item in enumerate(line_items):
+            price = self._get(item.get('price'), 'price')
+            if not price['active']:
+                raise StripeError(
+                    400, f"The price specified is inactive: '{price['id']}'", param=f'line_items[{index}][price]'
+                )
+            amount += price['unit_amount'] * int(item.get('quantity') or 1)
+        for name in ('success_url', 'mode'):
+            if not params.get(name):
+                raise StripeError(400, f'Missing required param: {name}.', param=name)
+
+        session_id = self._id('cs_test')
+        return self._save({
+            'id': session_id,
+            'object': 'checkout.session',
+            'url': f'{self.url}/c/pay/{session_id}',
+            'mode': params['mode'],
+            'status': 'open',
+            'payment_status': 'unpaid',
+            'payment_intent': None,
+            'amount_total': amount,
+            'currency': price['currency'],
+            'success_url': params['success_url'],
+            'cancel_url': params.get('cancel_url'),
+            'customer_email': params.get('customer_email'),
+            'metadata': params.get('metadata') or {},
+            'created': int(time.time()),
+            'livemode': False,
+        })
+
+    def complete_session(self, session_id, payment_status='paid'):
+        """
+        Оплата сессии, как будто покупатель прошел checkout.
+
+        Возвращает события, которые Stripe отправил бы на webhook; если
+        задан webhook_url, они отправляются.
+        """
+        session = self._get(session_id, 'checkout.session')
+        with self._lock:
+            if session['status'] != 'open':
+                raise StripeError(400, f"Session is not open: '{session_id}'")
+            session['status'] = 'complete'
+            session['payment_status'] = payment_status
+            session['payment_intent'] = self._id('pi')
+
+        events = [self.event('checkout.session.completed', dict(session))]
+        if payment_status == 'paid':
+            events.append(self.event('payment_intent.succeeded', {
+                'id': session['payment_intent'],
+                'object': 'payment_intent',
+                'amount': session['amount_total'],
+                'currency': session['currency'],
+                'status': 'succeeded',
+                'metadata': session['metadata'],
+            }))
+        if self.webhook_url:
+            self.deliver(events)
+        return events
+
+    def expire_session(self, session_id):
+        session = self._get(session_id, 'checkout.session')
+        with self._lock:
+            if session['status'] != 'open':
+                raise StripeError(400, f"Session is not open: '{session_id}'")
+            session['status'] = 'expired'
+        events = [self.event('checkout.session.expired', dict(session))]
+        if self.webhook_url:
+            self.deliver(events)
+        return session
+
+    # Webhook
+
+    def event(self, event_type, data_object):
+        return {
+            'id': self._id('evt'),
+            'object': 'event',
+            'type': event_type,
+            'api_version': stripe.api_version,
+            'created': int(time.time()),
+            'data': {'object': data_object},
+            'livemode': False,
+            'pending_webhooks': 1,
+        }
+
+    def signed(self, event, secret=None):
+        """Тело webhook и заголовок Stripe-Signature"""
+        payload = json.dumps(event)
+        return payload, sign_payload(payload, secret or self.webhook_secret)
+
+    def deliver(self, events):
+        """Отправка событий на webhook_url по одному, в порядке создания"""
+        import httpx
+
+        with httpx.Client(timeout=30) as client:
+            for event in events:
+                payload, signature = self.signed(event)
+                try:
+                    status = client.post(self.webhook_url, content=payload, headers={
+                        'Content-Type': 'application/json',
+                        'Stripe-Signature': signature,
+                    }).status_code
+                except httpx.HTTPError:
+                    status = None
+                with self._lock:
+                    self.deliveries.append((event['id'], status))
+
+    # HTTP
+
+    async def _handle(self, reader, writer):
+        with self._lock:
+            self.connections += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length') or 0))
+
+                status, payload, extra = await self._respond(method, path, headers, body.decode())
+                data = json.dumps(payload).encode()
+                extra_headers = ''.join(f'{name}: {value}\r\n' for name, value in extra.items())
+                writer.write(
+                    f'HTTP/1.1 {status} {REASONS.get(status, "Error")}\r\n'
+                    f'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(data)}\r\n'
+                    f'Request-Id: req_{uuid.uuid4().hex[:14]}\r\n'
+                    f'{extra_headers}'
+                    f'\r\n'.encode() + data
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _respond(self, method, path, headers, body):
+        path, _, query = path.partition('?')
+        params = decode_params(parse_qsl(body or query, keep_blank_values=True))
+        with self._lock:
+            self.count += 1
+            if self.store:
+                self.requests.append(ReceivedRequest(method, path, headers, params, time.monotonic()))
+
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        try:
+            if path.startswith('/v1/'):
+                self._injected_error(method, path)
+                if not headers.get('authorization', '').startswith('Bearer '):
+                    raise StripeError(401, 'You did not provide an API key.')
+
+            handler, object_id = self._route(method, path)
+            key = headers.get('idempotency-key') if method == 'POST' else None
+            if key:
+                with self._lock:
+                    cached = self._idempotent.get((key, path))
+                if cached:
+                    return cached
+
+            result = await handler(object_id, params)
+            response = result if isinstance(result, tuple) else (200, result, {})
+            if key:
+                with self._lock:
+                    self._idempotent[(key, path)] = response
+            return response
+        except StripeError as e:
+            return e.status, e.body, {}
+
+    def _route(self, method, path):
+        allowed = False
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if match:
+                if route_method == method:
+                    return getattr(self, name), match.groupdict().get('id')
+                allowed = True
+        if allowed:
+            raise StripeError(405, f'Method not allowed: {method} {path}')
+        raise StripeError(404, f'Unrecognized request URL ({method}: {path}).')
+
+    def _injected_error(self, method, path):
+        with self._lock:
+            for rule in self._errors:
+                if rule['path'] and not path.startswith(rule['path']):
+                    continue
+                if rule['method'] and rule['method'] != method:
+                    continue
+                if rule['times'] is not None:
+                    rule['times'] -= 1
+                    if not rule['times']:
+                        self._errors.remove(rule)
+                raise StripeError(rule['status'], rule['message'], code=rule['code'])
+            if self.error_rate and self._random.random() < self.error_rate:
+                raise StripeError(500, 'An unknown error occurred')
+
+    async def _create_product(self, object_id, params):
+        return self.create_product(**params)
+
+    async def _create_price(self, object_id, params):
+        return self.create_price(**params)
+
+    async def _create_session(self, object_id, params):
+        return self.create_session(**params)
+
+    async def _retrieve(self, object_id, params):
+        return self._get(object_id)
+
+    async def _update(self, object_id, params):
+        obj = self._get(object_id)
+        with self._lock:
+            if 'active' in params:
+                obj['active'] = params.pop('active') == 'true'
+            if 'metadata' in params:
+                obj['metadata'] = {**obj['metadata'], **params.pop('metadata')}
+            for name in ('name', 'description'):
+                if name in params and name in obj:
+                    obj[name] = params[name]
+        return obj
+
+    async def _expire_session(self, object_id, params):
+        return await asyncio.to_thread(self.expire_session, object_id)
+
+    async def _pay_page(self, object_id, params):
+        # Страница оплаты: сессия оплачивается сразу, события уходят на
+        # webhook в фоне, покупатель возвращается на success_url
+        session = self._get(object_id, 'checkout.session')
+        asyncio.get_running_loop().run_in_executor(None, self.complete_session, object_id)
+        return 303, {}, {'Location': session['success_url']}
@@ -0,0 +1,114 @@
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.benchmark import bench_environment
+from payments import benchmark, events
+from payments.fake_stripe import FakeStripe
+
+SUCCESS_URL = 'http://localhost/success/'
+CANCEL_URL = 'http://localhost/cancel/'
+
+
+class Command(BaseCommand):
+    help = ('Замер checkout: синхронное представление под WSGI против асинхронного '
+            'под ASGI, Stripe заменяет локальный сервер с задержкой ответа. '
+            'Режим webhook - прием подписанных событий Stripe')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['sync', 'async', 'webhook'], action='append',
+                            help='Замерить только этот режим (по умолчанию sync и async)')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на представление')
+        parser.add_argument('--concurrency', type=int, default=50, help='Одновременных запросов')
+        parser.add_argument('--latency', type=float, default=0.3,
+                            help='Задержка ответа Stripe, секунды (по умолчанию 0.3)')
+        parser.add_argument('--sync-workers', type=int, default=4,
+                            help='Потоков WSGI-сервера для синхронного представления')
+        parser.add_argument('--max-concurrency', type=int,
+                            help='STRIPE_MAX_CONCURRENCY на время замера')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять тестовую базу после прогона')
+
+    def handle(self, *args, **options):
+        modes = options['mode'] or ['sync', 'async']
+
+        # Прогон идет в отдельной тестовой базе с отдельным префиксом кэша;
+        # оба клиента Stripe обращаются к локальному серверу
+        overrides = {}
+        if options['max_concurrency']:
+            overrides['STRIPE_MAX_CONCURRENCY'] = options['max_concurrency']
+
+        results = {}
+        with FakeStripe(latency=options['latency'], store=False) as fake, bench_environment(
+            keepdb=options['keepdb'],
+            stripe_api_base=fake.url,
+            ALLOWED_HOSTS=['127.0.0.1', 'localhost'],
+            **overrides,
+        ):
+            # Задача обработки событий webhook не ставится: замеряется только прием
+            cache.set(events.QUEUED_KEY, 1, timeout=None)
+            course, token = benchmark.seed_checkout(fake=fake)
+            body = {'course_id': course.id, 'success_url': SUCCESS_URL, 'cancel_url': CANCEL_URL}
+            headers = {'Authorization': f'Bearer {token}'}
+
+            for mode in modes:
+                self.stdout.write(f'Замер {mode}...')
+                fake.reset()
+                results[mode] = self.run(mode, body, headers, fake, options)
+                results[mode]['stripe_requests'] = fake.count
+                results[mode]['stripe_connections'] = fake.connections
+
+        self.report(results, options)
+
+    def run(self, mode, body, headers, fake, options):
+        load = {
+            'body': body,
+            'headers': headers,
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+        }
+        if mode == 'webhook':
+            # Каждый запрос - новое событие с подписью, как доставляет Stripe
+            def make_request():
+                event = fake.event('payment_intent.succeeded', {'id': f'pi_{uuid.uuid4().hex}'})
+                payload, signature = fake.signed(event, settings.STRIPE_WEBHOOK_SECRET)
+                return {'content': payload, 'headers': {
+                    'Content-Type': 'application/json', 'Stripe-Signature': signature,
+                }}
+
+            with benchmark.serve_wsgi(options['sync_workers']) as url:
+                return benchmark.run_http_load(
+                    f'{url}/api/payments/webhook/', make_request=make_request,
+                    requests=options['requests'], concurrency=options['concurrency'],
+                )
+        if mode == 'sync':
+            with benchmark.serve_wsgi(options['sync_workers']) as url:
+                return benchmark.run_http_load(f'{url}/api/payments/checkout/', **load)
+        with benchmark.serve_asgi() as url:
+            return benchmark.run_http_load(f'{url}/api/payments/checkout/async/', **load)
+
+    def report(self, results, options):
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, sort_keys=True))
+        else:
+            self.stdout.write(
+                f'Задержка Stripe {options["latency"]} с, {options["concurrency"]} одновременных запросов, '
+                f'WSGI-потоков {options["sync_workers"]}'
+            )
+            self.stdout.write(
+                f'{"Режим":<8}{"RPS":>10}{"p50 мс":>10}{"p95 мс":>10}{"p99 мс":>10}'
+                f'{"Ошибки":>8}{"Соединений Stripe":>20}'
+            )
+            for mode, result in results.items():
+                self.stdout.write(
+                    f'{mode:<8}{result["rps"]:>10}{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                    f'{result["p99_ms"]:>10}{result["errors"]:>8}{result["stripe_connections"]:>20}'
+                )
+
+        failed = {mode: result['errors'] for mode, result in results.items() if result['errors']}
+        if failed:
+            raise CommandError(f'Запросы с ошибкой: {failed}')
@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.fake_stripe import FakeStripe
+
+
+class Command(BaseCommand):
+    help = ('Локальная замена Stripe API для разработки без сети: продукты, цены, '
+            'сессии оплаты и подписанные события webhook')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Адрес (по умолчанию 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=12111, help='Порт (по умолчанию 12111)')
+        parser.add_argument('--latency', type=float, default=0, help='Задержка ответа, секунды')
+        parser.add_argument('--jitter', type=float, default=0,
+                            help='Случайная добавка к задержке, до стольких секунд')
+        parser.add_argument('--error-rate', type=float, default=0,
+                            help='Доля запросов, которые получают ошибку 500')
+        parser.add_argument('--webhook-url', default='http://127.0.0.1:8000/api/payments/webhook/',
+                            help='Куда отправлять события после оплаты')
+        parser.add_argument('--webhook-secret', default=settings.STRIPE_WEBHOOK_SECRET,
+                            help='Секрет подписи событий (по умолчанию STRIPE_WEBHOOK_SECRET)')
+
+    def handle(self, *args, **options):
+        fake = FakeStripe(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            webhook_url=options['webhook_url'],
+            webhook_secret=options['webhook_secret'],
+            store=False,
+        )
+        with fake:
+            self.stdout.write(self.style.SUCCESS(f'Stripe API: {fake.url}'))
+            self.stdout.write(f'Запустите приложение и воркер Celery с STRIPE_API_BASE={fake.url}')
+            self.stdout.write(f'События webhook: {fake.webhook_url}')
+            self.stdout.write('Остановка - Ctrl+C')
+            delivered = 0
+            try:
+                while True:
+                    time.sleep(1)
+                    for event_id, status in fake.deliveries[delivered:]:
+                        self.stdout.write(f'Событие {event_id}: {status or "нет соединения"}')
+                    delivered = len(fake.deliveries)
+            except KeyboardInterrupt:
+                pass
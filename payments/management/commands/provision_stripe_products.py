@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from lms.models import Course
+from payments.tasks import provision_stripe_product
+
+
+class Command(BaseCommand):
+    help = 'Создание цен в Stripe для платных курсов, у которых нет актуальной цены'
+
+    def handle(self, *args, **options):
+        # Курсы до появления задачи provision_stripe_product и курсы,
+        # цена которых в Stripe не совпадает с текущей
+        course_ids = Course.objects.filter(price__gt=0).exclude(
+            stripe_product__unit_amount=F('price') * 100
+        ).values_list('id', flat=True)
+
+        count = 0
+        for course_id in course_ids.iterator():
+            provision_stripe_product.delay(course_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Поставлено задач: {count}'))
@@ -0,0 +1,94 @@
+"""
+Соответствие курсов продуктам и ценам Stripe.
+
+Продукт и цена создаются задачей provision_stripe_product (payments/tasks.py)
+при создании курса и при смене цены, а не в запросе оплаты. Результат
+лежит в кэше по id курса: checkout берет price_id из кэша и сразу создает
+сессию, без обращений к базе и к Stripe. При промахе кэша запись
+восстанавливается из таблицы StripeProduct одним запросом.
+"""
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from lms.models import Course, StripeProduct
+
+PRICE_KEY = 'payments:stripe:price:{course_id}'
+QUEUED_KEY = 'payments:stripe:provision:{course_id}:queued'
+# Не чаще скольких секунд повторно ставить задачу из checkout
+PROVISION_RETRY = 30
+
+
+class PriceNotReady(Exception):
+    """Цена курса в Stripe еще создается"""
+
+
+def unit_amount(price):
+    """Цена курса в минимальных единицах валюты (копейки, центы)"""
+    return int((Decimal(price or 0) * 100).to_integral_value())
+
+
+def price_key(course_id):
+    return PRICE_KEY.format(course_id=course_id)
+
+
+def cache_price(stripe_product, title):
+    entry = {
+        'price_id': stripe_product.price_id,
+        'unit_amount': stripe_product.unit_amount,
+        'title': title,
+    }
+    cache.set(price_key(stripe_product.course_id), entry, timeout=None)
+    return entry
+
+
+def schedule_provision(course_id):
+    """Постановка задачи создания цены, не чаще раза в PROVISION_RETRY секунд"""
+    from .tasks import provision_stripe_product
+
+    if cache.add(QUEUED_KEY.format(course_id=course_id), 1, timeout=PROVISION_RETRY):
+        provision_stripe_product.delay(course_id)
+
+
+def get_price(course_id):
+    """
+    Цена курса в Stripe: {'price_id', 'unit_amount', 'title'}.
+
+    None - курс бесплатный. Если курса нет, выбрасывается
+    Course.DoesNotExist; если цена еще не создана (или создана по старой
+    цене курса) - PriceNotReady, а задача создания ставится в очередь.
+    """
+    entry = cache.get(price_key(course_id))
+    if entry is not None:
+        return entry
+
+    course = Course.objects.select_related('stripe_product').get(id=course_id)
+    return price_for_course(course)
+
+
+async def aget_price(course_id):
+    """get_price для асинхронных представлений"""
+    entry = await cache.aget(price_key(course_id))
+    if entry is not None:
+        return entry
+
+    course = await Course.objects.select_related('stripe_product').aget(id=course_id)
+    return await sync_to_async(price_for_course)(course)
+
+
+def price_for_course(course):
+    """Цена по загруженному курсу (с select_related('stripe_product'))"""
+    amount = unit_amount(course.price)
+    if not amount:
+        return None
+
+    try:
+        stripe_product = course.stripe_product
+    except StripeProduct.DoesNotExist:
+        stripe_product = None
+    if stripe_product and stripe_product.unit_amount == amount:
+        return cache_price(stripe_product, course.title)
+
+    schedule_provision(course.id)
+    raise PriceNotReady(course.id)
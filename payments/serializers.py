@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from lms.models import Course, StripeProduct
+from lms.models import Course
 
 
 class CoursePaymentSerializer(serializers.ModelSerializer):
@@ -11,7 +11,12 @@ class CoursePaymentSerializer(serializers.ModelSerializer):
 
 
 class StripeCheckoutSerializer(serializers.Serializer):
-    """Сериализатор для создания сессии оплаты в Stripe"""
+    """
+    Сериализатор для создания сессии оплаты в Stripe.
+
+    Существование курса проверяет checkout при промахе кэша цен, чтобы
+    не делать лишний запрос в базу на каждую оплату.
+    """
     course_id = serializers.IntegerField(required=True)
     success_url = serializers.URLField(
         required=False,
@@ -21,11 +26,3 @@ class StripeCheckoutSerializer(serializers.Serializer):
         required=False,
         default='http://localhost:3000/payment/cancel/'
     )
-
-    def validate_course_id(self, value):
-        """Проверяем что курс существует"""
-        try:
-            Course.objects.get(id=value)
-        except Course.DoesNotExist:
-            raise serializers.ValidationError("Курс не найден")
-        return value
\ No newline at end of file
@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from lms.models import Course
+
+from .products import price_key, unit_amount
+
+
+@receiver(post_save, sender=Course)
+def course_price_handler(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Создание цены в Stripe для нового курса и при смене цены.
+
+    Цена сравнивается с записью в кэше, поэтому сохранение курса без
+    смены цены не ставит задачу и не обращается к базе.
+    """
+    if update_fields is not None and not {'price', 'title'} & set(update_fields):
+        return
+
+    key = price_key(instance.id)
+    entry = cache.get(key)
+    amount = unit_amount(instance.price)
+    if entry is None and not amount:
+        return
+
+    if entry is not None and entry['unit_amount'] == amount:
+        if entry['title'] != instance.title:
+            cache.set(key, {**entry, 'title': instance.title}, timeout=None)
+        return
+
+    from .tasks import provision_stripe_product
+
+    course_id = instance.id
+
+    def provision():
+        # До создания новой цены checkout не должен брать старую
+        cache.delete(key)
+        provision_stripe_product.delay(course_id)
+
+    transaction.on_commit(provision)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted_handler(sender, instance, **kwargs):
+    """Удаленный курс больше не продается"""
+    course_id = instance.id
+    transaction.on_commit(lambda: cache.delete(price_key(course_id)))
@@ -0,0 +1,161 @@
+"""
+Асинхронный клиент Stripe API для checkout под ASGI.
+
+stripe-python 7.x выполняет запросы синхронно и держит поток на все время
+ответа Stripe. Этот клиент обращается к тому же REST API через
+httpx.AsyncClient: пока Stripe отвечает, цикл событий обслуживает другие
+запросы. Соединения с STRIPE_API_BASE держатся открытыми (keep-alive) и
+переиспользуются, TLS-рукопожатие выполняется один раз на соединение.
+
+Одновременных запросов к Stripe не больше STRIPE_MAX_CONCURRENCY на
+процесс. Остальные ждут свободного места не дольше STRIPE_QUEUE_TIMEOUT
+секунд и получают StripeBusy, чтобы при всплеске нагрузки запросы не
+копились в очереди без ограничения.
+
+Клиент и семафор привязаны к циклу событий и создаются для каждого цикла
+(в uvicorn он один на процесс), соединения закрываются при остановке
+сервера (lifespan в config/asgi.py). Ошибки приводятся к исключениям
+stripe.error, поэтому обрабатываются так же, как ошибки синхронного SDK.
+"""
+import asyncio
+import weakref
+from urllib.parse import urlencode
+
+import httpx
+import stripe
+from django.conf import settings
+
+_clients = weakref.WeakKeyDictionary()
+
+
+class StripeBusy(Exception):
+    """Все места для запросов к Stripe заняты дольше STRIPE_QUEUE_TIMEOUT"""
+
+
+def encode_params(params, prefix=None):
+    """
+    Параметры запроса в формате Stripe API (application/x-www-form-urlencoded).
+
+    Вложенные словари и списки кодируются как в stripe-python:
+    line_items[0][price]=..., metadata[course_id]=...
+    """
+    for key, value in params.items():
+        key = f'{prefix}[{key}]' if prefix else key
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            yield from encode_params(value, key)
+        elif isinstance(value, (list, tuple)):
+            for index, item in enumerate(value):
+                if isinstance(item, dict):
+                    yield from encode_params(item, f'{key}[{index}]')
+                else:
+                    yield f'{key}[{index}]', _encode_value(item)
+        else:
+            yield key, _encode_value(value)
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _error(response):
+    """Исключение stripe.error по ответу Stripe с ошибкой"""
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    error = body.get('error', {}) if isinstance(body, dict) else {}
+    message = error.get('message') or f'Stripe ответил {response.status_code}'
+    kwargs = {
+        'http_body': response.text,
+        'http_status': response.status_code,
+        'json_body': body,
+        'headers': dict(response.headers),
+    }
+
+    if response.status_code == 401:
+        return stripe.error.AuthenticationError(message, **kwargs)
+    if response.status_code == 402:
+        return stripe.error.CardError(message, error.get('param'), error.get('code'), **kwargs)
+    if response.status_code == 429:
+        return stripe.error.RateLimitError(message, **kwargs)
+    if response.status_code in (400, 404):
+        return stripe.error.InvalidRequestError(message, error.get('param'), error.get('code'), **kwargs)
+    return stripe.error.APIError(message, **kwargs)
+
+
+class AsyncStripeClient:
+    """Пул соединений с Stripe API и ограничение одновременных запросов"""
+
+    def __init__(self):
+        size = settings.STRIPE_MAX_CONCURRENCY
+        self.semaphore = asyncio.Semaphore(size)
+        self.http = httpx.AsyncClient(
+            base_url=settings.STRIPE_API_BASE,
+            headers={
+                'Authorization': f'Bearer {settings.STRIPE_API_KEY}',
+                'Stripe-Version': stripe.api_version,
+            },
+            limits=httpx.Limits(
+                max_connections=size,
+                max_keepalive_connections=size,
+                keepalive_expiry=settings.STRIPE_KEEPALIVE_EXPIRY,
+            ),
+            timeout=settings.STRIPE_TIMEOUT,
+        )
+
+    async def request(self, method, path, params=None, idempotency_key=None):
+        """Запрос к Stripe API, возвращает ответ в виде словаря"""
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        try:
+            # Ожидание места отменяется вместе с задачей, поэтому место не
+            # может остаться занятым после таймаута (как с wait_for)
+            async with asyncio.timeout(settings.STRIPE_QUEUE_TIMEOUT) as queue_timeout:
+                async with self.semaphore:
+                    # Дальше время ответа ограничивает STRIPE_TIMEOUT
+                    queue_timeout.reschedule(None)
+                    response = await self.http.request(
+                        method, path,
+                        content=urlencode(list(encode_params(params or {}))),
+                        headers=headers,
+                    )
+        except TimeoutError:
+            raise StripeBusy()
+        except httpx.TransportError as e:
+            raise stripe.error.APIConnectionError(f'Нет соединения со Stripe: {e}')
+
+        if response.status_code >= 400:
+            raise _error(response)
+        try:
+            return response.json()
+        except ValueError:
+            raise stripe.error.APIError(
+                'Некорректный ответ Stripe', http_body=response.text, http_status=response.status_code
+            )
+
+    async def create_checkout_session(self, **params):
+        return await self.request('POST', '/v1/checkout/sessions', params)
+
+    async def close(self):
+        await self.http.aclose()
+
+
+def get_client():
+    """Клиент текущего цикла событий"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncStripeClient()
+    return client
+
+
+async def close_client():
+    """Закрытие соединений клиента текущего цикла событий"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
@@ -0,0 +1,126 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+import logging
+import stripe
+
+from lms.models import Course, StripeProduct
+
+from . import events
+from .products import cache_price, price_key, unit_amount
+
+logger = logging.getLogger(__name__)
+
+stripe.api_key = settings.STRIPE_API_KEY
+stripe.api_base = settings.STRIPE_API_BASE
+
+# Сколько держится блокировка создания продукта одного курса (секунды)
+PROVISION_LOCK_TIMEOUT = 60
+
+
+@shared_task(
+    autoretry_for=(stripe.error.APIConnectionError, stripe.error.RateLimitError),
+    retry_backoff=True,
+    max_retries=5,
+)
+def provision_stripe_product(course_id):
+    """
+    Создание продукта и цены курса в Stripe.
+
+    Вызывается после создания курса и смены цены. Задачи по одному курсу
+    выполняются по очереди (блокировка в Redis), запросы к Stripe идут с
+    ключами идемпотентности, поэтому повтор не создает дубликатов. Цена в
+    Stripe неизменяема: при новой цене курса создается новая цена, а старая
+    архивируется. price_id кладется в кэш для checkout.
+    """
+    with cache.lock(f'payments:stripe:provision:{course_id}', timeout=PROVISION_LOCK_TIMEOUT):
+        try:
+            course = Course.objects.get(id=course_id)
+        except Course.DoesNotExist:
+            cache.delete(price_key(course_id))
+            return f"Курс с ID {course_id} не найден"
+
+        amount = unit_amount(course.price)
+        stripe_product = StripeProduct.objects.filter(course=course).first()
+        if not amount:
+            # Бесплатный курс через Stripe не продается
+            cache.delete(price_key(course_id))
+            return f"Курс {course.title} бесплатный"
+
+        if stripe_product and stripe_product.unit_amount == amount:
+            cache_price(stripe_product, course.title)
+            return f"Цена курса {course.title} уже создана"
+
+        if stripe_product is None:
+            product = stripe.Product.create(
+                name=course.title,
+                description=course.description or "Онлайн курс",
+                metadata={
+                    'course_id': str(course.id),
+                    'type': 'course'
+                },
+                idempotency_key=f'course-{course.id}-product',
+            )
+            product_id = product.id
+        else:
+            product_id = stripe_product.product_id
+
+        # Ключ включает заменяемую цену: при возврате к прежней цене курса
+        # (A -> B -> A) Stripe не вернет архивированную цену первого запроса
+        old_price_id = stripe_product.price_id if stripe_product else None
+        price = stripe.Price.create(
+            unit_amount=amount,
+            currency=settings.STRIPE_CURRENCY,
+            product=product_id,
+            metadata={
+                'course_id': str(course.id)
+            },
+            idempotency_key=f'course-{course.id}-price-{amount}-{old_price_id or "new"}',
+        )
+
+        with transaction.atomic():
+            stripe_product, _ = StripeProduct.objects.update_or_create(
+                course=course,
+                defaults={'product_id': product_id, 'price_id': price.id, 'unit_amount': amount},
+            )
+        cache_price(stripe_product, course.title)
+
+        if old_price_id and old_price_id != price.id:
+            try:
+                stripe.Price.modify(old_price_id, active=False)
+            except stripe.error.StripeError as e:
+                logger.warning(f"Старая цена {old_price_id} курса {course.id} не архивирована: {e}")
+
+        logger.info(f"Цена курса {course.title} в Stripe: {price.id} ({amount})")
+        return price.id
+
+
+@shared_task
+def process_stripe_events(batch_size=None):
+    """
+    Обработка сохраненных событий webhook Stripe пачками (payments/events.py).
+
+    Пачка блокируется через SELECT ... FOR UPDATE SKIP LOCKED и отмечается
+    в той же транзакции, поэтому параллельные задачи не обрабатывают одно
+    событие дважды. Работает, пока есть готовые события.
+    """
+    # Сброс отметки до выборки: события, сохраненные во время работы,
+    # поставят новую задачу, если эта их уже не увидит
+    cache.delete(events.QUEUED_KEY)
+
+    batch_size = batch_size or settings.STRIPE_EVENTS_BATCH_SIZE
+    claimed = 0
+    processed = 0
+    while True:
+        with transaction.atomic():
+            batch = events.claim_events(batch_size)
+            if batch:
+                processed += events.process_events(batch)
+        if not batch:
+            break
+        claimed += len(batch)
+
+    if claimed:
+        logger.info(f"События Stripe: получено {claimed}, обработано {processed}")
+    return processed
@@ -1,3 +1,637 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from lms.models import Course
+
+User = get_user_model()
+
+
+class StripeProvisioningTestCase(APITestCase):
+    """Тесты заблаговременного создания цен курсов в Stripe"""
+
+    def setUp(self):
+        from types import SimpleNamespace
+        from unittest import mock
+        from config.celery import app as celery_app
+
+        self.celery_app = celery_app
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        cache.delete_pattern('payments:stripe:*')
+        self.addCleanup(cache.delete_pattern, 'payments:stripe:*')
+
+        prices = iter(range(1, 100))
+        self.product_create = self.patch('stripe.Product.create', return_value=SimpleNamespace(id='prod_1'))
+        self.price_create = self.patch(
+            'stripe.Price.create', side_effect=lambda **kwargs: SimpleNamespace(id=f'price_{next(prices)}')
+        )
+        self.price_modify = self.patch('stripe.Price.modify')
+        self.mock = mock
+
+        self.user = User.objects.create_user(email='buyer@test.com', password='pass')
+
+    def tearDown(self):
+        self.celery_app.conf.task_always_eager = self.always_eager
+
+    def patch(self, target, **kwargs):
+        from unittest import mock
+
+        patcher = mock.patch(target, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def create_course(self, price):
+        from decimal import Decimal
+
+        with self.captureOnCommitCallbacks(execute=True):
+            return Course.objects.create(title='Платный курс', price=Decimal(price))
+
+    def test_course_creation_provisions_price(self):
+        """Новый платный курс получает цену в Stripe по своей цене"""
+        from django.conf import settings
+        from payments.products import price_key
+
+        course = self.create_course('49.90')
+
+        self.product_create.assert_called_once()
+        self.assertEqual(self.price_create.call_args.kwargs['unit_amount'], 4990)
+        self.assertEqual(self.price_create.call_args.kwargs['currency'], settings.STRIPE_CURRENCY)
+        self.assertEqual(course.stripe_product.price_id, 'price_1')
+        self.assertEqual(
+            cache.get(price_key(course.id)),
+            {'price_id': 'price_1', 'unit_amount': 4990, 'title': 'Платный курс'}
+        )
+
+    def test_price_change_creates_new_price(self):
+        """Смена цены создает новую цену, старая архивируется"""
+        from decimal import Decimal
+        from payments.products import price_key
+
+        course = self.create_course('49.90')
+        course.price = Decimal('59.90')
+        with self.captureOnCommitCallbacks(execute=True):
+            course.save()
+
+        self.product_create.assert_called_once()
+        self.assertEqual(self.price_create.call_args.kwargs['unit_amount'], 5990)
+        self.price_modify.assert_called_once_with('price_1', active=False)
+        self.assertEqual(cache.get(price_key(course.id))['price_id'], 'price_2')
+
+    def test_save_without_price_change_skips_stripe(self):
+        """Сохранение курса без смены цены не обращается к Stripe"""
+        from payments.products import price_key
+
+        course = self.create_course('49.90')
+        course.title = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            course.save()
+
+        self.assertEqual(self.price_create.call_count, 1)
+        self.assertEqual(cache.get(price_key(course.id))['title'], 'Новое название')
+        self.assertFalse(any('provision' in repr(callback) for callback in callbacks))
+
+    def test_free_course_is_not_provisioned(self):
+        """Бесплатный курс в Stripe не создается"""
+        self.create_course('0')
+        self.product_create.assert_not_called()
+
+    def test_checkout_uses_cached_price(self):
+        """Checkout создает сессию без запросов к базе и к Stripe до нее"""
+        from types import SimpleNamespace
+
+        course = self.create_course('49.90')
+        self.client.force_authenticate(self.user)
+        calls = []
+
+        def create_session(**kwargs):
+            calls.append((kwargs, len(queries.captured_queries)))
+            return SimpleNamespace(id='cs_1', url='https://checkout.stripe.test/cs_1')
+
+        self.patch('stripe.checkout.Session.create', side_effect=create_session)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/payments/checkout/', {'course_id': course.id}, format='json')
+
+        (kwargs, queries_before), = calls
+        self.assertEqual(queries_before, 0)
+        self.assertEqual(kwargs['line_items'], [{'price': 'price_1', 'quantity': 1}])
+        self.assertEqual(self.price_create.call_count, 1)
+
+        from users.models import Payment
+        payment = Payment.objects.get(stripe_session_id='cs_1')
+        self.assertEqual((payment.user, payment.status), (self.user, Payment.Status.PENDING))
+
+    def test_checkout_before_price_is_ready(self):
+        """Пока цена создается, checkout отвечает 503 и ставит задачу один раз"""
+        from decimal import Decimal
+
+        course = Course.objects.create(title='Без цены', price=Decimal('10'))
+        self.client.force_authenticate(self.user)
+
+        with self.mock.patch('payments.tasks.provision_stripe_product.delay') as delay:
+            first = self.client.post('/api/payments/checkout/', {'course_id': course.id}, format='json')
+            self.client.post('/api/payments/checkout/', {'course_id': course.id}, format='json')
+
+        self.assertEqual(first.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(first['Retry-After'], '5')
+        delay.assert_called_once_with(course.id)
+
+        response = self.client.post('/api/payments/checkout/', {'course_id': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncCheckoutTestCase(TestCase):
+    """Тесты асинхронного checkout с локальной заменой Stripe API"""
+
+    @classmethod
+    def setUpClass(cls):
+        from payments.fake_stripe import FakeStripe
+
+        super().setUpClass()
+        cls.fake = FakeStripe()
+        cls.fake.start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        from payments.benchmark import seed_checkout
+
+        settings_override = override_settings(STRIPE_API_BASE=self.fake.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.delete_pattern('payments:stripe:*')
+        self.addCleanup(cache.delete_pattern, 'payments:stripe:*')
+        self.fake.reset()
+
+        self.course, token = seed_checkout(fake=self.fake)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        self.data = {
+            'course_id': self.course.id,
+            'success_url': 'http://localhost/success/',
+            'cancel_url': 'http://localhost/cancel/',
+        }
+
+    def post(self, data=None, **extra):
+        return self.client.post(
+            '/api/payments/checkout/async/', data or self.data, content_type='application/json', **extra
+        )
+
+    def test_checkout_creates_session_and_payment(self):
+        """Сессия создается в Stripe, платеж записывается через асинхронный ORM"""
+        from decimal import Decimal
+        from users.models import Payment
+
+        response = self.post(**self.auth)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertTrue(body['session_id'].startswith('cs_test_'))
+        self.assertIn(body['session_id'], body['checkout_url'])
+
+        request, = self.fake.requests
+        self.assertEqual(request.path, '/v1/checkout/sessions')
+        self.assertTrue(request.headers['authorization'].startswith('Bearer '))
+        self.assertEqual(request.params['line_items'], [{'price': 'price_bench', 'quantity': '1'}])
+        self.assertEqual(request.params['metadata']['course_id'], str(self.course.id))
+
+        payment = Payment.objects.get(stripe_session_id=body['session_id'])
+        self.assertEqual(payment.status, Payment.Status.PENDING)
+        self.assertEqual(payment.course_id, self.course.id)
+        self.assertEqual(payment.user.email, 'checkout@bench.local')
+        self.assertEqual(payment.amount, Decimal('1990.00'))
+
+    def test_checkout_requires_jwt(self):
+        """Без токена или с неверным токеном - 401, Stripe не вызывается"""
+        self.assertEqual(self.post().status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.post(HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.fake.count, 0)
+
+    def test_checkout_errors(self):
+        """Бесплатный курс, несуществующий курс и ошибка Stripe"""
+        from decimal import Decimal
+        from users.models import Payment
+
+        free, = Course.objects.bulk_create([Course(title='Бесплатный', price=Decimal('0'))])
+        response = self.post({**self.data, 'course_id': free.id}, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.post({**self.data, 'course_id': 0}, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.fake.fail(402, 'Your card was declined.', code='card_declined')
+        response = self.post(**self.auth)
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertIn('Your card was declined.', response.json()['error'])
+        self.assertFalse(Payment.objects.exists())
+
+    async def test_connection_is_reused(self):
+        """Запросы к Stripe в одном цикле событий идут через одно соединение"""
+        from payments.stripe_async import close_client
+
+        headers = {'Authorization': self.auth['HTTP_AUTHORIZATION']}
+        try:
+            for _ in range(3):
+                response = await self.async_client.post(
+                    '/api/payments/checkout/async/', self.data,
+                    content_type='application/json', headers=headers,
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        finally:
+            await close_client()
+
+        self.assertEqual(self.fake.count, 3)
+        self.assertEqual(self.fake.connections, 1)
+
+    @override_settings(STRIPE_MAX_CONCURRENCY=1, STRIPE_QUEUE_TIMEOUT=0.05)
+    async def test_concurrency_is_bounded(self):
+        """Когда все места заняты, checkout отвечает 503 и не ждет бесконечно"""
+        from payments.stripe_async import close_client, get_client
+
+        semaphore = get_client().semaphore
+        await semaphore.acquire()
+        try:
+            response = await self.async_client.post(
+                '/api/payments/checkout/async/', self.data, content_type='application/json',
+                headers={'Authorization': self.auth['HTTP_AUTHORIZATION']},
+            )
+        finally:
+            semaphore.release()
+            await close_client()
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.fake.count, 0)
+        # Место, которое запрос не дождался, не остается занятым
+        self.assertFalse(semaphore.locked())
+
+    async def test_client_closed_on_shutdown(self):
+        """При остановке ASGI-сервера соединения с Stripe закрываются"""
+        from config.asgi import application
+        from payments.stripe_async import get_client
+
+        client = get_client()
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await application({'type': 'lifespan'}, receive, send)
+
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertTrue(client.http.is_closed)
+
+    def test_encode_params(self):
+        """Параметры кодируются так же, как в stripe-python"""
+        from payments.stripe_async import encode_params
+
+        params = {
+            'line_items': [{'price': 'price_1', 'quantity': 1}],
+            'payment_method_types': ['card'],
+            'metadata': {'course_id': '5'},
+            'customer_email': None,
+            'livemode': False,
+        }
+        self.assertEqual(list(encode_params(params)), [
+            ('line_items[0][price]', 'price_1'),
+            ('line_items[0][quantity]', '1'),
+            ('payment_method_types[0]', 'card'),
+            ('metadata[course_id]', '5'),
+            ('livemode', 'false'),
+        ])
+
+
+class StripeWebhookEventsTestCase(TestCase):
+    """Тесты сохранения событий webhook Stripe и их обработки пачками"""
+
+    def setUp(self):
+        from decimal import Decimal
+        from unittest import mock
+        from payments import events
+        from users.models import Payment
+
+        self.events = events
+        self.mock = mock
+        cache.delete(events.QUEUED_KEY)
+        self.addCleanup(cache.delete, events.QUEUED_KEY)
+
+        self.user = User.objects.create_user(email='buyer@test.com', password='pass')
+        self.course, = Course.objects.bulk_create([Course(title='Платный курс', price=Decimal('10'))])
+        self.Payment = Payment
+        self.payment = Payment.objects.create(
+            user=self.user, course=self.course, amount=Decimal('10'),
+            status=Payment.Status.PENDING, stripe_session_id='cs_1',
+        )
+
+    def event(self, event_id, object_id='cs_1', event_type='checkout.session.completed',
+              created=1700000000, **fields):
+        return {
+            'id': event_id,
+            'type': event_type,
+            'created': created,
+            'data': {'object': {
+                'id': object_id,
+                'payment_status': 'paid',
+                'payment_intent': 'pi_1',
+                'metadata': {'course_id': str(self.course.id), 'user_id': str(self.user.id)},
+                **fields,
+            }},
+        }
+
+    def post(self, event, secret=None):
+        from django.conf import settings
+        from payments.fake_stripe import sign_payload
+
+        payload = json.dumps(event)
+        return self.client.post(
+            '/api/payments/webhook/', payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload, secret or settings.STRIPE_WEBHOOK_SECRET),
+        )
+
+    def process(self):
+        from payments.tasks import process_stripe_events
+
+        return process_stripe_events()
+
+    def test_webhook_stores_event_once(self):
+        """Повторная доставка события не создает вторую запись"""
+        from lms.models import StripeEvent
+
+        with self.mock.patch('payments.tasks.process_stripe_events.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                first = self.post(self.event('evt_1'))
+            with self.captureOnCommitCallbacks(execute=True):
+                second = self.post(self.event('evt_1'))
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        event = StripeEvent.objects.get()
+        self.assertEqual((event.event_id, event.object_id, event.status), ('evt_1', 'cs_1', 'pending'))
+        # Задача уже ждет в очереди: вторая доставка ее не ставит
+        delay.assert_called_once_with()
+
+    def test_webhook_rejects_invalid_signature(self):
+        """Событие с неверной подписью не сохраняется"""
+        from lms.models import StripeEvent
+
+        response = self.post(self.event('evt_1'), secret='whsec_wrong')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_consumer_updates_payment(self):
+        """Обработчик отмечает платеж оплаченным и сохраняет ID платежа Stripe"""
+        from lms.models import StripeEvent
+
+        self.events.store_event(self.event('evt_1'))
+        self.events.store_event(self.event('evt_2', object_id='pi_1', event_type='charge.updated'))
+
+        self.assertEqual(self.process(), 2)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, self.Payment.Status.PAID)
+        self.assertEqual(self.payment.stripe_payment_intent_id, 'pi_1')
+        self.assertEqual(
+            set(StripeEvent.objects.values_list('status', flat=True)), {StripeEvent.Status.PROCESSED}
+        )
+
+    def test_events_of_object_are_processed_in_order(self):
+        """Пока раннее событие объекта ждет повтора, следующие не обрабатываются"""
+        from lms.models import StripeEvent
+
+        calls = []
+        failing = {'evt_1'}
+
+        def handler(event):
+            if event['id'] in failing:
+                raise RuntimeError('Временная ошибка')
+            calls.append(event['id'])
+
+        self.events.store_event(self.event('evt_2', created=1700000002))
+        self.events.store_event(self.event('evt_1', created=1700000001))
+        self.events.store_event(self.event('evt_3', object_id='cs_2', created=1700000003))
+
+        with self.mock.patch.dict(self.events.HANDLERS, {'checkout.session.completed': handler}):
+            self.process()
+            self.assertEqual(calls, ['evt_3'])
+            first = StripeEvent.objects.get(event_id='evt_1')
+            self.assertEqual((first.status, first.attempts), ('pending', 1))
+            self.assertIn('Временная ошибка', first.last_error)
+            self.assertEqual(StripeEvent.objects.get(event_id='evt_2').attempts, 0)
+
+            failing.clear()
+            StripeEvent.objects.filter(event_id='evt_1').update(available_at=timezone.now())
+            self.process()
+
+        self.assertEqual(calls, ['evt_3', 'evt_1', 'evt_2'])
+
+    @override_settings(STRIPE_EVENTS_MAX_ATTEMPTS=2)
+    def test_dead_letter_unblocks_object(self):
+        """После последней попытки событие помечается dead, следующие обрабатываются"""
+        from lms.models import StripeEvent
+
+        calls = []
+
+        def handler(event):
+            if event['id'] == 'evt_1':
+                raise RuntimeError('Ошибка обработки')
+            calls.append(event['id'])
+
+        self.events.store_event(self.event('evt_1', created=1700000001))
+        self.events.store_event(self.event('evt_2', created=1700000002))
+
+        with self.mock.patch.dict(self.events.HANDLERS, {'checkout.session.completed': handler}):
+            for _ in range(2):
+                StripeEvent.objects.filter(status='pending').update(available_at=timezone.now())
+                self.process()
+
+        self.assertEqual(StripeEvent.objects.get(event_id='evt_1').status, StripeEvent.Status.DEAD)
+        self.assertEqual(calls, ['evt_2'])
+
+
+class FakeStripeTestCase(APITestCase):
+    """Тесты оплаты через локальную замену Stripe API (payments/fake_stripe.py)"""
+
+    @classmethod
+    def setUpClass(cls):
+        from payments.fake_stripe import FakeStripe
+
+        super().setUpClass()
+        cls.fake = FakeStripe()
+        cls.fake.start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        from unittest import mock
+        from payments import events
+
+        # stripe-python и асинхронный клиент обращаются к локальному серверу
+        patcher = mock.patch('stripe.api_base', self.fake.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        settings_override = override_settings(STRIPE_API_BASE=self.fake.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.delete_pattern('payments:stripe:*')
+        self.addCleanup(cache.delete_pattern, 'payments:stripe:*')
+        # Задача обработки событий вызывается в тестах напрямую
+        cache.set(events.QUEUED_KEY, 1)
+        self.fake.reset()
+
+    def test_provision_through_sdk(self):
+        """Продукт и цена создаются через stripe-python, старая цена архивируется"""
+        from decimal import Decimal
+        from lms.models import StripeProduct
+        from payments.tasks import provision_stripe_product
+
+        course, = Course.objects.bulk_create([Course(title='Платный курс', price=Decimal('10'))])
+        price_id = provision_stripe_product(course.id)
+
+        stripe_product = StripeProduct.objects.get(course=course)
+        self.assertEqual(stripe_product.price_id, price_id)
+        product = self.fake.objects[stripe_product.product_id]
+        self.assertEqual((product['name'], product['metadata']['course_id']), ('Платный курс', str(course.id)))
+        price = self.fake.objects[price_id]
+        self.assertEqual((price['unit_amount'], price['product']), (1000, product['id']))
+        self.assertTrue(all(request.headers.get('idempotency-key') for request in self.fake.requests))
+
+        # Повтор запроса с тем же ключом идемпотентности возвращает ту же цену
+        StripeProduct.objects.filter(course=course).delete()
+        self.assertEqual(provision_stripe_product(course.id), price_id)
+
+        Course.objects.filter(id=course.id).update(price=Decimal('20'))
+        new_price_id = provision_stripe_product(course.id)
+        self.assertNotEqual(new_price_id, price_id)
+        self.assertFalse(self.fake.objects[price_id]['active'])
+        self.assertEqual(self.fake.objects[new_price_id]['unit_amount'], 2000)
+
+    def test_price_returns_to_previous_amount(self):
+        """Возврат к прежней цене курса создает новую активную цену, а не архивированную"""
+        from decimal import Decimal
+        from payments.tasks import provision_stripe_product
+
+        course, = Course.objects.bulk_create([Course(title='Платный курс', price=Decimal('10'))])
+        first = provision_stripe_product(course.id)
+        Course.objects.filter(id=course.id).update(price=Decimal('20'))
+        second = provision_stripe_product(course.id)
+        Course.objects.filter(id=course.id).update(price=Decimal('10'))
+        third = provision_stripe_product(course.id)
+
+        self.assertEqual(len({first, second, third}), 3)
+        self.assertEqual(
+            [self.fake.objects[price_id]['active'] for price_id in (first, second, third)],
+            [False, False, True]
+        )
+        self.assertEqual(self.fake.objects[third]['unit_amount'], 1000)
+
+    def test_checkout_and_webhook_mark_payment_paid(self):
+        """Сессия создается, после оплаты подписанные события отмечают платеж оплаченным"""
+        from payments.benchmark import seed_checkout
+        from payments.tasks import process_stripe_events
+        from users.models import Payment
+
+        course, _ = seed_checkout(fake=self.fake)
+        self.client.force_authenticate(User.objects.get(email='checkout@bench.local'))
+        response = self.client.post('/api/payments/checkout/', {
+            'course_id': course.id,
+            'success_url': 'http://localhost/success/',
+            'cancel_url': 'http://localhost/cancel/',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        session_id = response.json()['session_id']
+        self.assertEqual(self.fake.objects[session_id]['amount_total'], 199000)
+
+        events = self.fake.complete_session(session_id)
+        self.assertEqual(
+            [event['type'] for event in events], ['checkout.session.completed', 'payment_intent.succeeded']
+        )
+        self.client.force_authenticate(None)
+        for event in events:
+            payload, signature = self.fake.signed(event, 'whsec_test')
+            with override_settings(STRIPE_WEBHOOK_SECRET='whsec_test'):
+                response = self.client.post(
+                    '/api/payments/webhook/', payload, content_type='application/json',
+                    HTTP_STRIPE_SIGNATURE=signature,
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        process_stripe_events()
+
+        payment = Payment.objects.get(stripe_session_id=session_id)
+        self.assertEqual(payment.status, Payment.Status.PAID)
+        self.assertEqual(payment.stripe_payment_intent_id, self.fake.objects[session_id]['payment_intent'])
+
+    def test_error_injection(self):
+        """Ошибка Stripe приходит только на заданное число запросов, неверные параметры - 400"""
+        import stripe
+        from payments.benchmark import seed_checkout
+        from users.models import Payment
+
+        course, _ = seed_checkout(fake=self.fake)
+        self.client.force_authenticate(User.objects.get(email='checkout@bench.local'))
+        data = {'course_id': course.id, 'success_url': 'http://localhost/success/'}
+        self.fake.fail(500, path='/v1/checkout/sessions', times=1)
+
+        response = self.client.post('/api/payments/checkout/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(Payment.objects.exists())
+        response = self.client.post('/api/payments/checkout/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            stripe.Price.create(product='prod_missing', currency='usd', unit_amount=100)
+
+    def test_pay_page_delivers_signed_webhooks(self):
+        """Страница оплаты перенаправляет на success_url и отправляет события с подписью"""
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        import httpx
+        import stripe
+
+        received = []
+
+        class Receiver(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+                received.append((body, self.headers['Stripe-Signature']))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Receiver)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.fake.webhook_url = f'http://127.0.0.1:{server.server_address[1]}/'
+        self.fake.webhook_secret = 'whsec_test'
+        self.addCleanup(setattr, self.fake, 'webhook_url', None)
+
+        product = stripe.Product.create(name='Курс')
+        price = stripe.Price.create(product=product.id, currency='usd', unit_amount=500)
+        session = stripe.checkout.Session.create(
+            line_items=[{'price': price.id, 'quantity': 1}], mode='payment',
+            success_url='http://localhost/success/',
+        )
+
+        response = httpx.get(session.url)
+        self.assertEqual(response.status_code, 303)
+        self.assertEqual(response.headers['Location'], 'http://localhost/success/')
+
+        deadline = time.monotonic() + 5
+        while len(self.fake.deliveries) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([status_code for _, status_code in self.fake.deliveries], [200, 200])
+        for body, signature in received:
+            stripe.WebhookSignature.verify_header(body, signature, 'whsec_test')
+        self.assertEqual(json.loads(received[0][0])['data']['object']['id'], session.id)
+        self.assertEqual(stripe.checkout.Session.retrieve(session.id).payment_status, 'paid')
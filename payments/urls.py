@@ -1,12 +1,14 @@
 from django.urls import path
 from .views import (
     StripeCheckoutAPIView,
+    StripeCheckoutAsyncView,
     StripeWebhookAPIView,
     CoursePriceAPIView,
 )
 
 urlpatterns = [
     path('checkout/', StripeCheckoutAPIView.as_view(), name='stripe-checkout'),
+    path('checkout/async/', StripeCheckoutAsyncView.as_view(), name='stripe-checkout-async'),
     path('webhook/', StripeWebhookAPIView.as_view(), name='stripe-webhook'),
     path('courses/<int:pk>/price/', CoursePriceAPIView.as_view(), name='course-price'),
 ]
\ No newline at end of file
@@ -1,22 +1,61 @@
+import json
+
 import stripe
+from asgiref.sync import sync_to_async
+from decimal import Decimal
 from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from .serializers import StripeCheckoutSerializer, CoursePaymentSerializer
-from lms.models import Course, StripeProduct, Payment
+from .events import store_event
+from .products import PriceNotReady, aget_price, get_price
+from .stripe_async import StripeBusy, get_client
+from lms.models import Course
+from users.models import Payment
 
 # Настройка Stripe
 stripe.api_key = settings.STRIPE_API_KEY
+stripe.api_base = settings.STRIPE_API_BASE
+
+# Через сколько секунд повторить checkout, пока цена курса создается
+PRICE_RETRY_AFTER = 5
+# Через сколько секунд повторить checkout, если заняты все места для запросов к Stripe
+BUSY_RETRY_AFTER = 1
+
+
+def checkout_session_params(price, course_id, user, success_url, cancel_url):
+    """Параметры сессии оплаты Stripe, общие для синхронного и асинхронного checkout"""
+    return {
+        'payment_method_types': ['card'],
+        'line_items': [{
+            'price': price['price_id'],
+            'quantity': 1,
+        }],
+        'mode': 'payment',
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        'metadata': {
+            'course_id': str(course_id),
+            'user_id': str(user.id),
+            'course_title': price['title']
+        },
+        'customer_email': user.email,
+    }
 
 
 class StripeCheckoutAPIView(APIView):
     """
     API для создания сессии оплаты в Stripe.
 
-    Создает или получает продукт в Stripe, создает цену и сессию оплаты.
+    Продукт и цена курса создаются заранее задачей provision_stripe_product,
+    здесь price_id берется из кэша и создается только сессия оплаты.
     Возвращает URL для перенаправления пользователя на страницу оплаты Stripe.
     """
     permission_classes = [permissions.IsAuthenticated]
@@ -41,9 +80,10 @@ class StripeCheckoutAPIView(APIView):
                     }
                 )
             ),
-            400: "Неверные данные",
+            400: "Неверные данные или бесплатный курс",
             404: "Курс не найден",
-            500: "Ошибка Stripe API"
+            500: "Ошибка Stripe API",
+            503: "Цена курса в Stripe еще создается"
         }
     )
     def post(self, request):
@@ -54,35 +94,28 @@ class StripeCheckoutAPIView(APIView):
             cancel_url = serializer.validated_data['cancel_url']
 
             try:
-                course = Course.objects.get(id=course_id)
-
-                # Проверяем существует ли уже продукт в Stripe
-                stripe_product = self.get_or_create_stripe_product(course)
+                # Цена создается заранее (payments/tasks.py) и берется из кэша
+                price = get_price(course_id)
+                if price is None:
+                    return Response(
+                        {'error': 'Курс бесплатный, оплата не требуется'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
 
                 # Создаем сессию checkout в Stripe
-                checkout_session = stripe.checkout.Session.create(
-                    payment_method_types=['card'],
-                    line_items=[{
-                        'price': stripe_product.price_id,
-                        'quantity': 1,
-                    }],
-                    mode='payment',
-                    success_url=success_url,
-                    cancel_url=cancel_url,
-                    metadata={
-                        'course_id': str(course.id),
-                        'user_id': str(request.user.id),
-                        'course_title': course.title
-                    },
-                    customer_email=request.user.email,
-                )
+                checkout_session = stripe.checkout.Session.create(**checkout_session_params(
+                    price, course_id, request.user, success_url, cancel_url
+                ))
 
-                # Создаем запись о платеже (ожидающий оплаты)
+                # Создаем запись о платеже (ожидающий оплаты), webhook
+                # найдет ее по ID сессии
                 Payment.objects.create(
                     user=request.user,
-                    course=course,
-                    amount=5000,  # Фиксированная цена для примера
-                    payment_method='transfer',  # Для Stripe
+                    course_id=course_id,
+                    amount=Decimal(price['unit_amount']) / 100,
+                    payment_method=Payment.PaymentMethod.TRANSFER,  # Для Stripe
+                    status=Payment.Status.PENDING,
+                    stripe_session_id=checkout_session.id,
                 )
 
                 return Response({
@@ -95,6 +128,12 @@ class StripeCheckoutAPIView(APIView):
                     {'error': 'Курс не найден'},
                     status=status.HTTP_404_NOT_FOUND
                 )
+            except PriceNotReady:
+                return Response(
+                    {'error': 'Оплата курса еще не готова, повторите запрос позже'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(PRICE_RETRY_AFTER)}
+                )
             except stripe.error.StripeError as e:
                 return Response(
                     {'error': f'Ошибка Stripe: {str(e)}'},
@@ -108,51 +147,126 @@ class StripeCheckoutAPIView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def get_or_create_stripe_product(self, course):
-        """Создает или получает продукт в Stripe"""
-        try:
-            # Пытаемся найти существующий продукт
-            stripe_product = StripeProduct.objects.get(course=course)
-            return stripe_product
-        except StripeProduct.DoesNotExist:
-            # Создаем новый продукт в Stripe
-            product = stripe.Product.create(
-                name=course.title,
-                description=course.description or "Онлайн курс",
-                metadata={
-                    'course_id': str(course.id),
-                    'type': 'course'
-                }
+
+class StripeCheckoutAsyncView(View):
+    """
+    Асинхронный вариант StripeCheckoutAPIView для запуска под ASGI
+    (config/asgi.py).
+
+    Пока Stripe создает сессию, процесс обслуживает другие запросы:
+    сессия создается через асинхронный клиент с пулом соединений
+    (payments/stripe_async.py), курс и платеж читаются и пишутся через
+    асинхронный ORM. Запросов к Stripe одновременно не больше
+    STRIPE_MAX_CONCURRENCY, при переполнении ответ 503 с Retry-After.
+
+    DRF 3.14 не поддерживает асинхронные представления, поэтому это
+    обычное представление Django: JWT проверяется так же, как в
+    JWTAuthentication, тело запроса проверяет StripeCheckoutSerializer.
+    """
+    http_method_names = ['post']
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Аутентификация по JWT, CSRF-токен не нужен (как в APIView)
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def post(self, request):
+        user = await self.authenticate(request)
+        if user is None:
+            return JsonResponse(
+                {'detail': 'Учетные данные не были предоставлены.'},
+                status=status.HTTP_401_UNAUTHORIZED,
+                headers={'WWW-Authenticate': 'Bearer realm="api"'}
             )
 
-            # Создаем цену для продукта
-            price = stripe.Price.create(
-                unit_amount=5000,  # 50.00 USD в центах
-                currency='usd',
-                recurring=None,  # Разовый платеж
-                product=product.id,
-                metadata={
-                    'course_id': str(course.id)
-                }
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Некорректный JSON'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = StripeCheckoutSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        course_id = serializer.validated_data['course_id']
+        try:
+            price = await aget_price(course_id)
+            if price is None:
+                return JsonResponse(
+                    {'error': 'Курс бесплатный, оплата не требуется'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            checkout_session = await get_client().create_checkout_session(**checkout_session_params(
+                price, course_id, user,
+                serializer.validated_data['success_url'],
+                serializer.validated_data['cancel_url'],
+            ))
+
+            await Payment.objects.acreate(
+                user=user,
+                course_id=course_id,
+                amount=Decimal(price['unit_amount']) / 100,
+                payment_method=Payment.PaymentMethod.TRANSFER,
+                status=Payment.Status.PENDING,
+                stripe_session_id=checkout_session['id'],
             )
 
-            # Сохраняем в базе данных
-            stripe_product = StripeProduct.objects.create(
-                course=course,
-                product_id=product.id,
-                price_id=price.id
+            return JsonResponse({
+                'checkout_url': checkout_session['url'],
+                'session_id': checkout_session['id']
+            }, status=status.HTTP_200_OK)
+
+        except Course.DoesNotExist:
+            return JsonResponse({'error': 'Курс не найден'}, status=status.HTTP_404_NOT_FOUND)
+        except PriceNotReady:
+            return JsonResponse(
+                {'error': 'Оплата курса еще не готова, повторите запрос позже'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(PRICE_RETRY_AFTER)}
+            )
+        except StripeBusy:
+            return JsonResponse(
+                {'error': 'Сервис оплаты перегружен, повторите запрос позже'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(BUSY_RETRY_AFTER)}
+            )
+        except stripe.error.StripeError as e:
+            return JsonResponse(
+                {'error': f'Ошибка Stripe: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        except Exception as e:
+            return JsonResponse(
+                {'error': f'Ошибка сервера: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-            return stripe_product
+    async def authenticate(self, request):
+        """Пользователь по заголовку Authorization: Bearer <JWT> или None"""
+        authentication = JWTAuthentication()
+        header = authentication.get_header(request)
+        raw_token = authentication.get_raw_token(header) if header else None
+        if raw_token is None:
+            return None
+        try:
+            validated_token = authentication.get_validated_token(raw_token)
+            return await sync_to_async(authentication.get_user)(validated_token)
+        except (InvalidToken, AuthenticationFailed):
+            return None
 
 
 class StripeWebhookAPIView(APIView):
     """
-    Webhook для обработки событий от Stripe.
+    Webhook для событий от Stripe.
 
-    Обрабатывает успешные оплаты и обновляет статусы платежей.
+    Проверяет подпись, сохраняет событие и сразу отвечает 200; платежи
+    обновляет задача process_stripe_events (payments/events.py). Повторная
+    доставка события не обрабатывается второй раз.
     Не требует аутентификации (вызывается Stripe).
     """
+    authentication_classes = []
     permission_classes = []  # No authentication required for webhooks
 
     @swagger_auto_schema(
@@ -162,19 +276,23 @@ class StripeWebhookAPIView(APIView):
             description='Raw event data from Stripe'
         ),
         responses={
-            200: "Webhook обработан",
-            400: "Неверная подпись webhook",
-            500: "Ошибка обработки webhook"
+            200: "Событие принято",
+            400: "Неверная подпись webhook"
         }
     )
     def post(self, request):
-        payload = request.body
+        payload = request.body.decode('utf-8', 'replace')
         sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
 
         try:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
+            # Подпись проверяется до разбора JSON, событие разбирается один раз
+            stripe.WebhookSignature.verify_header(
+                payload, sig_header, settings.STRIPE_WEBHOOK_SECRET,
+                stripe.Webhook.DEFAULT_TOLERANCE
             )
+            event = json.loads(payload)
+            if not isinstance(event, dict) or not event.get('id'):
+                raise ValueError('В событии нет id')
         except ValueError as e:
             # Invalid payload
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -182,43 +300,9 @@ class StripeWebhookAPIView(APIView):
             # Invalid signature
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Обработка событий
-        if event['type'] == 'checkout.session.completed':
-            session = event['data']['object']
-            self.handle_checkout_session_completed(session)
-
-        elif event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            self.handle_payment_intent_succeeded(payment_intent)
-
+        store_event(event)
         return Response({'status': 'success'}, status=status.HTTP_200_OK)
 
-    def handle_checkout_session_completed(self, session):
-        """Обработка успешного завершения сессии оплаты"""
-        try:
-            course_id = session['metadata']['course_id']
-            user_id = session['metadata']['user_id']
-
-            # Обновляем статус платежа
-            payment = Payment.objects.filter(
-                user_id=user_id,
-                course_id=course_id,
-                payment_method='transfer'
-            ).last()
-
-            if payment:
-                payment.payment_method = 'stripe'
-                # Можно добавить дополнительные поля: transaction_id и т.д.
-                payment.save()
-
-        except (KeyError, Payment.DoesNotExist):
-            pass
-
-    def handle_payment_intent_succeeded(self, payment_intent):
-        """Обработка успешного платежа"""
-        # Можно добавить дополнительную логику обработки
-        pass
-
 
 class CoursePriceAPIView(generics.RetrieveAPIView):
     """
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Payment
+from .models import InactiveUsersReport, Payment, User
 
 class CustomUserAdmin(UserAdmin):
     model = User
@@ -8,7 +8,7 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ('is_staff', 'is_superuser', 'is_active')
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
-        ('Personal info', {'fields': ('first_name', 'last_name', 'phone', 'city', 'avatar')}),
+        ('Personal info', {'fields': ('first_name', 'last_name', 'phone', 'city', 'avatar', 'notification_mode')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
     )
@@ -25,7 +25,14 @@ admin.site.register(User, CustomUserAdmin)
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
-    list_display = ('user', 'amount', 'payment_method', 'payment_date', 'course', 'lesson')
-    list_filter = ('payment_method', 'payment_date')
-    search_fields = ('user__email', 'course__title', 'lesson__title')
-    ordering = ('-payment_date',)
\ No newline at end of file
+    list_display = ('user', 'amount', 'payment_method', 'status', 'payment_date', 'course', 'lesson')
+    list_filter = ('status', 'payment_method', 'payment_date')
+    search_fields = ('user__email', 'course__title', 'lesson__title', 'stripe_session_id', 'stripe_payment_intent_id')
+    ordering = ('-payment_date',)
+
+@admin.register(InactiveUsersReport)
+class InactiveUsersReportAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'finished_at', 'status', 'count', 'cutoff')
+    list_filter = ('status',)
+    readonly_fields = ('cutoff', 'status', 'count', 'cursor_last_login', 'cursor_id', 'started_at', 'finished_at')
+    ordering = ('-started_at',)
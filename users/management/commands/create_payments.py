@@ -3,6 +3,9 @@ from django.core.management.base import BaseCommand
 class Command(BaseCommand):
     help = 'Создание тестовых платежей'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=20, help='Количество платежей')
+
     def handle(self, *args, **kwargs):
         # Импортируем внутри функции чтобы избежать циклического импорта
         from django.contrib.auth import get_user_model
@@ -15,20 +18,20 @@ class Command(BaseCommand):
 
         User = get_user_model()
 
-        # Создаем тестовые данные
-        users = User.objects.all()
-        courses = Course.objects.all()
-        lessons = Lesson.objects.all()
+        # Для выбора нужны только id: списки загружаются один раз
+        user_ids = list(User.objects.values_list('id', flat=True))
+        course_ids = list(Course.objects.values_list('id', flat=True))
+        lesson_ids = list(Lesson.objects.values_list('id', flat=True))
 
-        if not users.exists():
+        if not user_ids:
             self.stdout.write(self.style.ERROR('Нет пользователей. Сначала создайте пользователей.'))
             return
 
-        if not courses.exists():
+        if not course_ids:
             self.stdout.write(self.style.ERROR('Нет курсов. Сначала создайте курсы.'))
             return
 
-        if not lessons.exists():
+        if not lesson_ids:
             self.stdout.write(self.style.ERROR('Нет уроков. Сначала создайте уроки.'))
             return
 
@@ -37,20 +40,17 @@ class Command(BaseCommand):
 
         payments = []
 
-        for i in range(20):  # Создаем 20 платежей
-            user = random.choice(users)
-            is_course = random.choice([True, False])
+        for i in range(kwargs['count']):
+            user_id = random.choice(user_ids)
 
-            if is_course and courses.exists():
-                course = random.choice(courses)
-                lesson = None
+            if random.choice([True, False]):
+                course_id = random.choice(course_ids)
+                lesson_id = None
                 amount = Decimal(str(round(random.uniform(1000, 5000), 2)))
-            elif lessons.exists():
-                course = None
-                lesson = random.choice(lessons)
-                amount = Decimal(str(round(random.uniform(100, 1000), 2)))
             else:
-                continue
+                course_id = None
+                lesson_id = random.choice(lesson_ids)
+                amount = Decimal(str(round(random.uniform(100, 1000), 2)))
 
             payment_method = random.choice(['cash', 'transfer'])
 
@@ -59,15 +59,20 @@ class Command(BaseCommand):
             payment_date = timezone.now() - timedelta(days=random_days)
 
             payment = Payment(
-                user=user,
-                course=course,
-                lesson=lesson,
+                user_id=user_id,
+                course_id=course_id,
+                lesson_id=lesson_id,
                 amount=amount,
                 payment_method=payment_method,
             )
-            payment.payment_date = payment_date  # Переопределяем auto_now_add
-            payments.append(payment)
+            payments.append((payment, payment_date))
+
+        created = Payment.objects.bulk_create([payment for payment, _ in payments], batch_size=1000)
 
-        Payment.objects.bulk_create(payments)
+        # auto_now_add перезаписывает дату при вставке, поэтому даты
+        # из прошлого проставляются после загрузки
+        for payment, (_, payment_date) in zip(created, payments):
+            payment.payment_date = payment_date
+        Payment.objects.bulk_update(created, ['payment_date'], batch_size=1000)
 
-        self.stdout.write(self.style.SUCCESS(f'Успешно создано {len(payments)} платежей'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'Успешно создано {len(created)} платежей'))
@@ -0,0 +1,330 @@
+import io
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+WORDS = [
+    'python', 'django', 'алгоритмы', 'данные', 'веб', 'разработка', 'анализ',
+    'дизайн', 'тестирование', 'базы', 'сети', 'безопасность', 'машинное',
+    'обучение', 'интерфейсы', 'архитектура', 'основы', 'продвинутый',
+    'практикум', 'javascript', 'sql', 'devops', 'облака', 'математика',
+]
+FIRST_NAMES = ['Иван', 'Петр', 'Анна', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Елена']
+LAST_NAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев']
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', None]
+VIDEO_URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+
+class RowStream(io.RawIOBase):
+    """
+    Файловый объект для COPY FROM поверх генератора строк.
+
+    Строки формируются по мере чтения, поэтому память не зависит
+    от количества загружаемых записей.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        if not self.buffer:
+            # Набираем примерно запрошенный объем одним join, без
+            # повторного копирования буфера на каждую строку
+            chunk, size = [], 0
+            for line in self.lines:
+                data = line.encode()
+                chunk.append(data)
+                size += len(data)
+                if size >= len(target):
+                    break
+            self.buffer = b''.join(chunk)
+
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def copy_value(value):
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class Command(BaseCommand):
+    help = 'Генерация больших объемов тестовых данных (пользователи, курсы, уроки, подписки, платежи)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help='Количество пользователей')
+        parser.add_argument('--courses', type=int, default=1000, help='Количество курсов')
+        parser.add_argument('--lessons', type=int, default=10, help='Среднее число уроков в курсе')
+        parser.add_argument('--subscriptions', type=float, default=3,
+                            help='Среднее число подписок на пользователя')
+        parser.add_argument('--payments', type=float, default=1,
+                            help='Среднее число платежей на пользователя')
+        parser.add_argument('--password', default='password123',
+                            help='Пароль всех сгенерированных пользователей')
+        parser.add_argument('--email-domain', default='generated.local')
+        parser.add_argument('--seed', type=int, default=None, help='Seed генератора')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Размер пачки bulk_create (если COPY недоступен)')
+        parser.add_argument('--skip-search-vector', action='store_true',
+                            help='Не заполнять поисковый индекс курсов и уроков')
+
+    def handle(self, *args, **options):
+        from django.contrib.auth import get_user_model
+        from lms.models import Course, Lesson, Subscription
+        from users.models import Payment
+
+        if options['users'] < 1 or options['courses'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и один курс')
+
+        self.rnd = random.Random(options['seed'])
+        self.options = options
+        self.now = timezone.now()
+        User = get_user_model()
+
+        # Хэш пароля считается один раз: PBKDF2 на каждого пользователя
+        # занял бы часы на миллионах записей
+        self.password_hash = make_password(options['password'])
+
+        users = self.load(User, self.user_rows, options['users'])
+        courses = self.load(Course, lambda start: self.course_rows(start, users), options['courses'])
+
+        # Число уроков в курсах задается заранее: так известен
+        # диапазон id уроков еще до их загрузки
+        lessons_total = 0
+        lesson_counts = []
+        for _ in range(options['courses']):
+            count = max(1, int(self.rnd.expovariate(1 / options['lessons'])))
+            lesson_counts.append(count)
+            lessons_total += count
+
+        lessons = self.load(
+            Lesson, lambda start: self.lesson_rows(start, courses, lesson_counts), lessons_total
+        )
+        self.load(Subscription, lambda start: self.subscription_rows(start, users, courses))
+        self.load(Payment, lambda start: self.payment_rows(start, users, courses, lessons))
+
+        if not options['skip_search_vector']:
+            from lms.search import build_search_vector
+
+            for model in (Course, Lesson):
+                started = time.monotonic()
+                model.objects.filter(pk__gte=courses[0] if model is Course else lessons[0]).update(
+                    search_vector=build_search_vector()
+                )
+                self.stdout.write(f'  {model.__name__}: поисковый индекс за {time.monotonic() - started:.1f} с')
+
+        with connection.cursor() as cursor:
+            for model in (User, Course, Lesson, Subscription, Payment):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+        self.stdout.write(self.style.SUCCESS('Генерация завершена'))
+
+    # Загрузка
+
+    def load(self, model, rows, expected=None):
+        """
+        Загрузка строк в таблицу модели, возвращает (первый id, последний id).
+
+        Id назначаются явно подряд от текущего максимума под блокировкой
+        таблицы, поэтому связанные строки могут ссылаться на диапазон id
+        без хранения самих объектов в памяти.
+        """
+        table = model._meta.db_table
+        started = time.monotonic()
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+                cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+                start = cursor.fetchone()[0] + 1
+
+            counter = {'count': 0}
+
+            def counted():
+                for row in rows(start):
+                    counter['count'] += 1
+                    yield row
+
+            if connection.vendor == 'postgresql':
+                self.copy(model, counted())
+            else:
+                self.bulk_create(model, counted())
+
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                    cursor.execute(sql)
+
+        count = counter['count']
+        if expected is not None and count != expected:
+            raise CommandError(f'{model.__name__}: ожидалось {expected} строк, загружено {count}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'  {model.__name__}: {count} записей за {elapsed:.1f} с')
+        return start, start + count - 1
+
+    def copy(self, model, rows):
+        fields = model._meta.concrete_fields
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+
+        def lines():
+            for row in rows:
+                yield '\t'.join(copy_value(row.get(field.attname)) for field in fields) + '\n'
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {model._meta.db_table} ({columns}) FROM STDIN',
+                io.BufferedReader(RowStream(lines()), buffer_size=1 << 20),
+            )
+
+    def bulk_create(self, model, rows):
+        batch = []
+        for row in rows:
+            batch.append(model(**row))
+            if len(batch) >= self.options['batch_size']:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+
+    # Распределения
+
+    def past(self, days):
+        return self.now - timedelta(seconds=self.rnd.randint(0, days * 86400))
+
+    def popular(self, id_range, skew=3):
+        """
+        Id с перекосом к началу диапазона: несколько популярных курсов
+        собирают большую часть подписок и платежей.
+        """
+        first, last = id_range
+        return first + int((last - first + 1) * self.rnd.random() ** skew)
+
+    def activity(self, mean):
+        """Количество действий пользователя: у большинства мало, у немногих много"""
+        return int(self.rnd.paretovariate(1.5) * mean / 3)
+
+    def title(self, words=3):
+        return ' '.join(self.rnd.choice(WORDS) for _ in range(words)).capitalize()
+
+    # Генераторы строк
+
+    def user_rows(self, start):
+        from users.models import User
+
+        domain = self.options['email_domain']
+        for user_id in range(start, start + self.options['users']):
+            # Около пятой части пользователей не заходили больше месяца
+            last_login = self.past(120) if self.rnd.random() < 0.2 else self.past(30)
+            yield {
+                'id': user_id,
+                'password': self.password_hash,
+                'last_login': last_login,
+                'is_superuser': False,
+                'first_name': self.rnd.choice(FIRST_NAMES),
+                'last_name': self.rnd.choice(LAST_NAMES),
+                'is_staff': False,
+                'is_active': True,
+                'date_joined': last_login - timedelta(days=self.rnd.randint(0, 365)),
+                'email': f'user{user_id}@{domain}',
+                'city': self.rnd.choice(CITIES),
+                # Каждый десятый получает обновления курсов ежедневной сводкой
+                'notification_mode': (
+                    User.NotificationMode.DIGEST if self.rnd.random() < 0.1
+                    else User.NotificationMode.INSTANT
+                ),
+            }
+
+    def course_rows(self, start, users):
+        for course_id in range(start, start + self.options['courses']):
+            created_at = self.past(365)
+            yield {
+                'id': course_id,
+                'title': self.title(),
+                'description': self.title(15),
+                'owner_id': self.rnd.randint(*users),
+                'created_at': created_at,
+                'updated_at': created_at + timedelta(days=self.rnd.randint(0, 30)),
+                'price': Decimal(self.rnd.randint(10, 500) * 100),
+            }
+
+    def lesson_rows(self, start, courses, lesson_counts):
+        lesson_id = start
+        for offset, count in enumerate(lesson_counts):
+            course_id = courses[0] + offset
+            for _ in range(count):
+                created_at = self.past(365)
+                yield {
+                    'id': lesson_id,
+                    'course_id': course_id,
+                    'title': self.title(),
+                    'description': self.title(30),
+                    'video_url': VIDEO_URL,
+                    'created_at': created_at,
+                    'updated_at': created_at,
+                }
+                lesson_id += 1
+
+    def subscription_rows(self, start, users, courses):
+        subscription_id = start
+        total_courses = courses[1] - courses[0] + 1
+        for user_id in range(users[0], users[1] + 1):
+            count = min(self.activity(self.options['subscriptions']), total_courses)
+            picked = set()
+            while len(picked) < count:
+                picked.add(self.popular(courses))
+            for course_id in picked:
+                subscribed_at = self.past(365)
+                yield {
+                    'id': subscription_id,
+                    'user_id': user_id,
+                    'course_id': course_id,
+                    'is_active': self.rnd.random() > 0.1,
+                    'subscribed_at': subscribed_at,
+                    'updated_at': subscribed_at,
+                }
+                subscription_id += 1
+
+    def payment_rows(self, start, users, courses, lessons):
+        payment_id = start
+        for user_id in range(users[0], users[1] + 1):
+            for _ in range(self.activity(self.options['payments'])):
+                row = {
+                    'id': payment_id,
+                    'user_id': user_id,
+                    'payment_date': self.past(365),
+                    'payment_method': self.rnd.choice(['cash', 'transfer']),
+                    'status': 'paid',
+                }
+                if self.rnd.random() < 0.7:
+                    row['course_id'] = self.popular(courses)
+                    row['amount'] = Decimal(self.rnd.randint(1000, 5000))
+                else:
+                    row['lesson_id'] = self.rnd.randint(*lessons)
+                    row['amount'] = Decimal(self.rnd.randint(100, 1000))
+                yield row
+                payment_id += 1
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-17 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_payment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', '-payment_date', '-id'], name='payment_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-17 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='notification_mode',
+            field=models.CharField(choices=[('instant', 'Сразу после обновления'), ('digest', 'Ежедневная сводка')], default='instant', max_length=10, verbose_name='уведомления об обновлении курсов'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('notification_mode', 'digest')), fields=['id'], name='user_digest_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2 on 2026-10-17 01:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_notification_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeactivatedUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, verbose_name='email address')),
+            ],
+            options={
+                'verbose_name': 'заблокированный пользователь',
+                'verbose_name_plural': 'заблокированные пользователи',
+            },
+        ),
+        migrations.CreateModel(
+            name='InactiveUsersReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cutoff', models.DateTimeField(verbose_name='последний вход раньше')),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('done', 'Завершен')], default='running', max_length=10, verbose_name='статус')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='заблокировано')),
+                ('cursor_last_login', models.DateTimeField(blank=True, null=True, verbose_name='курсор: последний вход')),
+                ('cursor_id', models.PositiveBigIntegerField(default=0, verbose_name='курсор: id')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='начало')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='окончание')),
+            ],
+            options={
+                'verbose_name': 'отчет о неактивных пользователях',
+                'verbose_name_plural': 'отчеты о неактивных пользователях',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_active_last_login_idx',
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['last_login', 'id'], name='user_active_last_login_idx'),
+        ),
+        migrations.AddField(
+            model_name='deactivateduser',
+            name='report',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='users', to='users.inactiveusersreport', verbose_name='отчет'),
+        ),
+        migrations.AddField(
+            model_name='deactivateduser',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-17 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_inactive_users_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'ожидает оплаты'), ('paid', 'оплачен'), ('failed', 'не оплачен')], default='paid', max_length=16, verbose_name='статус'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='ID платежа в Stripe'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='stripe_session_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='ID сессии оплаты в Stripe'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['payment_date'], name='payment_pending_idx'),
+        ),
+    ]
@@ -29,17 +29,103 @@ class UserManager(BaseUserManager):
 
 class User(AbstractUser):
     """Кастомная модель пользователя"""
+
+    class NotificationMode(models.TextChoices):
+        INSTANT = 'instant', _('Сразу после обновления')
+        DIGEST = 'digest', _('Ежедневная сводка')
+
     username = None
     email = models.EmailField(_('email address'), unique=True)
     phone = models.CharField(_('phone number'), max_length=15, blank=True, null=True)
     city = models.CharField(_('city'), max_length=100, blank=True, null=True)
     avatar = models.ImageField(_('avatar'), upload_to='avatars/', blank=True, null=True)
+    notification_mode = models.CharField(
+        _('уведомления об обновлении курсов'),
+        max_length=10,
+        choices=NotificationMode.choices,
+        default=NotificationMode.INSTANT
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Обход неактивных пользователей в check_inactive_users по курсору
+            # (last_login, id) (частичный индекс)
+            models.Index(
+                fields=['last_login', 'id'],
+                name='user_active_last_login_idx',
+                condition=models.Q(is_active=True)
+            ),
+            # Обход получателей сводки по id в send_daily_digests (частичный индекс)
+            models.Index(
+                fields=['id'],
+                name='user_digest_idx',
+                condition=models.Q(is_active=True, notification_mode='digest')
+            ),
+        ]
+
+    def __str__(self):
+        return self.email
+
+
+class InactiveUsersReport(models.Model):
+    """
+    Отчет о блокировке неактивных пользователей (check_inactive_users).
+
+    Курсор (cursor_last_login, cursor_id) сохраняется после каждой пачки,
+    незавершенная блокировка продолжается со следующего запуска.
+    """
+
+    class Status(models.TextChoices):
+        RUNNING = 'running', _('Выполняется')
+        DONE = 'done', _('Завершен')
+
+    cutoff = models.DateTimeField(_('последний вход раньше'))
+    status = models.CharField(
+        _('статус'),
+        max_length=10,
+        choices=Status.choices,
+        default=Status.RUNNING
+    )
+    count = models.PositiveIntegerField(_('заблокировано'), default=0)
+    cursor_last_login = models.DateTimeField(_('курсор: последний вход'), null=True, blank=True)
+    cursor_id = models.PositiveBigIntegerField(_('курсор: id'), default=0)
+    started_at = models.DateTimeField(_('начало'), auto_now_add=True)
+    finished_at = models.DateTimeField(_('окончание'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('отчет о неактивных пользователях')
+        verbose_name_plural = _('отчеты о неактивных пользователях')
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.started_at:%d.%m.%Y %H:%M} - {self.count}"
+
+
+class DeactivatedUser(models.Model):
+    """Пользователь, заблокированный в рамках отчета"""
+    report = models.ForeignKey(
+        InactiveUsersReport,
+        on_delete=models.CASCADE,
+        related_name='users',
+        verbose_name=_('отчет')
+    )
+    user = models.ForeignKey(
+        'User',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('пользователь')
+    )
+    email = models.EmailField(_('email address'))
+
+    class Meta:
+        verbose_name = _('заблокированный пользователь')
+        verbose_name_plural = _('заблокированные пользователи')
+
     def __str__(self):
         return self.email
 
@@ -52,6 +138,10 @@ class Payment(models.Model):
         CASH = 'cash', _('Наличные')
         TRANSFER = 'transfer', _('Перевод на счет')
 
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('ожидает оплаты')
+        PAID = 'paid', _('оплачен')
+        FAILED = 'failed', _('не оплачен')
 
     user = models.ForeignKey(
         'User',
@@ -89,11 +179,43 @@ class Payment(models.Model):
         choices=PaymentMethod.choices,
         default=PaymentMethod.TRANSFER
     )
+    # Платеж через Stripe создается при checkout в статусе pending,
+    # webhook находит его по ID сессии (payments/events.py)
+    status = models.CharField(
+        _('статус'),
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PAID
+    )
+    stripe_session_id = models.CharField(
+        _('ID сессии оплаты в Stripe'),
+        max_length=255,
+        unique=True,
+        null=True,
+        blank=True
+    )
+    stripe_payment_intent_id = models.CharField(
+        _('ID платежа в Stripe'),
+        max_length=255,
+        unique=True,
+        null=True,
+        blank=True
+    )
 
     class Meta:
         verbose_name = _('платеж')
         verbose_name_plural = _('платежи')
         ordering = ['-payment_date']
+        indexes = [
+            # Список платежей пользователя и курсорная пагинация PaymentPagination
+            models.Index(fields=['user', '-payment_date', '-id'], name='payment_user_date_idx'),
+            # Неоплаченные платежи (частичный индекс)
+            models.Index(
+                fields=['payment_date'],
+                name='payment_pending_idx',
+                condition=models.Q(status='pending')
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.amount} руб. - {self.payment_date}"
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Payment
 from lms.serializers import CourseSerializer, LessonSerializer
+from lms.fieldsets import SparseFieldsMixin
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
@@ -13,10 +14,10 @@ class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'
-        read_only_fields = ('payment_date',)
+        read_only_fields = ('payment_date', 'status', 'stripe_session_id', 'stripe_payment_intent_id')
 
 
-class PaymentDetailSerializer(serializers.ModelSerializer):
+class PaymentDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для детального отображения платежа"""
     course = CourseSerializer(read_only=True)
     lesson = LessonSerializer(read_only=True)
@@ -32,7 +33,10 @@ class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = ['id', 'email', 'first_name', 'last_name', 'phone', 'city', 'avatar', 'password', 'is_active']
+        fields = [
+            'id', 'email', 'first_name', 'last_name', 'phone', 'city', 'avatar', 'password', 'is_active',
+            'notification_mode',
+        ]
         read_only_fields = ['id', 'is_active']
 
     def create(self, validated_data):
@@ -100,7 +104,10 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = ['id', 'email', 'first_name', 'last_name', 'phone', 'city', 'avatar', 'date_joined']
+        fields = [
+            'id', 'email', 'first_name', 'last_name', 'phone', 'city', 'avatar', 'date_joined',
+            'notification_mode',
+        ]
         read_only_fields = ['id', 'email', 'date_joined']
 
 
@@ -1,46 +1,117 @@
 from celery import shared_task
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db import connection, transaction
 from django.utils import timezone
 from django.contrib.auth import get_user_model
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 import logging
 
+from lms.models import Outbox
+from lms.outbox import email_payload, enqueue_email, enqueue_many, max_recipients
+
+from .models import DeactivatedUser, InactiveUsersReport
+
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Курсор до первого пользователя
+CURSOR_START = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _deactivate_batch_sql():
+    user = connection.ops.quote_name(User._meta.db_table)
+    deactivated = connection.ops.quote_name(DeactivatedUser._meta.db_table)
+    # Пачка идет по частичному индексу user_active_last_login_idx от курсора
+    # (last_login, id); строки, заблокированные другими транзакциями,
+    # пропускаются и попадут в следующий запуск
+    return f"""
+        WITH batch AS (
+            SELECT id FROM {user}
+            WHERE is_active AND last_login < %(cutoff)s
+              AND (last_login, id) > (%(after_login)s, %(after_id)s)
+            ORDER BY last_login, id
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        ), updated AS (
+            UPDATE {user} SET is_active = false
+            WHERE id = ANY(ARRAY(SELECT id FROM batch))
+            RETURNING id, email, last_login
+        ), logged AS (
+            INSERT INTO {deactivated} (report_id, user_id, email)
+            SELECT %(report_id)s, id, email FROM updated
+        )
+        SELECT id, last_login FROM updated ORDER BY last_login, id
+    """
+
+
+def deactivate_batch(report_id, batch_size):
+    """
+    Блокировка одной пачки неактивных пользователей.
+
+    Короткая транзакция: блокировка строк, запись в отчет и сдвиг курсора
+    отчета. Строка отчета блокируется на время пачки, поэтому параллельные
+    запуски идут по очереди и не обрабатывают одних пользователей дважды.
+    Возвращает количество заблокированных пользователей.
+    """
+    with transaction.atomic():
+        report = InactiveUsersReport.objects.select_for_update().get(id=report_id)
+        with connection.cursor() as cursor:
+            cursor.execute(_deactivate_batch_sql(), {
+                'cutoff': report.cutoff,
+                'after_login': report.cursor_last_login or CURSOR_START,
+                'after_id': report.cursor_id,
+                'limit': batch_size,
+                'report_id': report.id,
+            })
+            rows = cursor.fetchall()
+
+        if rows:
+            report.cursor_id, report.cursor_last_login = rows[-1]
+            report.count += len(rows)
+            report.save(update_fields=['cursor_id', 'cursor_last_login', 'count'])
+    return len(rows)
+
 
 @shared_task
 def check_inactive_users():
     """
     Проверка пользователей, которые не заходили более месяца
-    и блокировка их аккаунтов
+    и блокировка их аккаунтов.
+
+    Пользователи блокируются пачками по INACTIVE_USERS_BATCH_SIZE, каждая
+    пачка - один запрос в своей транзакции, поэтому блокировки держатся
+    недолго при любом числе пользователей. Заблокированные записываются
+    в отчет InactiveUsersReport; прерванная проверка продолжается
+    следующим запуском с сохраненного курсора. Администраторам уходит
+    отчет по id, а не список адресов.
     """
     try:
-        month_ago = timezone.now() - timedelta(days=30)
-
-        inactive_users = User.objects.filter(
-            last_login__lt=month_ago,
-            is_active=True
-        )
-
-        user_count = inactive_users.count()
-
-        if user_count == 0:
+        report = InactiveUsersReport.objects.filter(status=InactiveUsersReport.Status.RUNNING).first()
+        if report is None:
+            report = InactiveUsersReport.objects.create(cutoff=timezone.now() - timedelta(days=30))
+
+        batch_size = settings.INACTIVE_USERS_BATCH_SIZE
+        while deactivate_batch(report.id, batch_size) == batch_size:
+            pass
+
+        # Отчет закрывается и записывается в outbox одной транзакцией
+        with transaction.atomic():
+            report = InactiveUsersReport.objects.select_for_update().get(id=report.id)
+            if report.status == InactiveUsersReport.Status.DONE:
+                return f"Заблокировано {report.count} неактивных пользователей"
+            report.status = InactiveUsersReport.Status.DONE
+            report.finished_at = timezone.now()
+            report.save(update_fields=['status', 'finished_at'])
+
+            if report.count:
+                send_inactive_users_report(report.id)
+
+        if not report.count:
             logger.info("Неактивных пользователей не найдено")
             return "Неактивных пользователей не найдено"
 
-        # Блокируем пользователей
-        inactive_users.update(is_active=False)
-
-        # Логируем
-        emails = list(inactive_users.values_list('email', flat=True))
-        logger.info(f"Заблокировано {user_count} неактивных пользователей: {emails}")
-
-        # Отправляем отчет администраторам
-        send_inactive_users_report.delay(user_count, emails)
-
-        return f"Заблокировано {user_count} неактивных пользователей"
+        logger.info(f"Заблокировано {report.count} неактивных пользователей (отчет {report.id})")
+        return f"Заблокировано {report.count} неактивных пользователей"
 
     except Exception as e:
         logger.error(f"Ошибка при проверке неактивных пользователей: {str(e)}")
@@ -48,43 +119,39 @@ def check_inactive_users():
 
 
 @shared_task
-def send_inactive_users_report(count, emails=None):
+def send_inactive_users_report(report_id):
     """
-    Отправка отчета администратору о заблокированных пользователях
+    Отправка отчета администратору о заблокированных пользователях.
+
+    Письмо собирается при отправке из InactiveUsersReport по id.
+    Администраторы делятся на письма outbox, каждое из которых помещается
+    в квоту отправки за раз; ключ идемпотентности - отчет и первый
+    получатель письма.
     """
     try:
-        subject = "Отчет о неактивных пользователях"
-
-        email_list = "\n".join(emails) if emails else "Список недоступен"
-
-        message = f"""
-        Отчет о выполнении периодической задачи:
-
-        Заблокировано неактивных пользователей: {count}
-
-        Заблокированные пользователи:
-        {email_list}
-
-        Время выполнения: {timezone.now()}
-
-        Это автоматическое сообщение от системы LMS.
-        """
-
-        # Получаем email администраторов
-        admin_users = User.objects.filter(is_staff=True, is_active=True)
-        admin_emails = [admin.email for admin in admin_users if admin.email]
-
-        if admin_emails:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=admin_emails,
-                fail_silently=True,
+        # Получаем id администраторов
+        admin_ids = list(
+            User.objects.filter(is_staff=True, is_active=True)
+            .exclude(email='')
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        if not admin_ids:
+            logger.warning(f"Отчет {report_id} не отправлен: нет активных администраторов с адресом")
+            return "Нет администраторов для отчета"
+
+        size = max_recipients('inactive_users_report') or len(admin_ids)
+        entries = [
+            (
+                f'inactive_users_report:{report_id}:{admin_ids[start]}',
+                email_payload('inactive_users_report', {'report_id': report_id}, admin_ids[start:start + size]),
             )
+            for start in range(0, len(admin_ids), size)
+        ]
+        enqueue_many(Outbox.Kind.EMAIL, entries)
 
-        logger.info(f"Отчет отправлен {len(admin_emails)} администраторам")
-        return f"Отчет отправлен {len(admin_emails)} администраторам"
+        logger.info(f"Отчет поставлен в очередь для {len(admin_ids)} администраторов")
+        return f"Отчет отправлен {len(admin_ids)} администраторам"
 
     except Exception as e:
         logger.error(f"Ошибка при отправке отчета: {str(e)}")
@@ -101,13 +168,14 @@ def unblock_user_after_period(user_id, days=30):
         user = User.objects.get(id=user_id)
 
         if not user.is_active:
-            user.is_active = True
-            user.save(update_fields=['is_active'])
+            with transaction.atomic():
+                user.is_active = True
+                user.save(update_fields=['is_active'])
 
-            logger.info(f"Пользователь {user.email} разблокирован")
+                logger.info(f"Пользователь {user.email} разблокирован")
 
-            # Отправляем уведомление пользователю
-            send_user_unblocked_notification.delay(user.email)
+                # Уведомление пользователю пишется в outbox вместе с разблокировкой
+                send_user_unblocked_notification(user.id)
 
             return f"Пользователь {user.email} разблокирован"
         else:
@@ -121,34 +189,18 @@ def unblock_user_after_period(user_id, days=30):
 
 
 @shared_task
-def send_user_unblocked_notification(email):
+def send_user_unblocked_notification(user_id):
     """
     Отправка уведомления пользователю о разблокировке
     """
     try:
-        subject = "Ваш аккаунт разблокирован"
-        message = f"""
-        Добрый день!
-
-        Ваш аккаунт был автоматически разблокирован.
-
-        Теперь вы можете снова войти в систему по адресу:
-        {settings.FRONTEND_URL}/login/
-
-        С уважением,
-        Команда LMS платформы
-        """
-
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email],
-            fail_silently=True,
+        enqueue_email(
+            f'user_unblocked:{user_id}:{timezone.now().isoformat()}',
+            'user_unblocked', {}, [user_id]
         )
 
-        logger.info(f"Уведомление о разблокировке отправлено на {email}")
-        return f"Уведомление отправлено на {email}"
+        logger.info(f"Уведомление о разблокировке поставлено в очередь для пользователя {user_id}")
+        return f"Уведомление отправлено пользователю {user_id}"
 
     except Exception as e:
         logger.error(f"Ошибка при отправке уведомления: {str(e)}")
@@ -163,33 +215,10 @@ def send_welcome_email(user_id):
     try:
         user = User.objects.get(id=user_id)
 
-        subject = f"Добро пожаловать в LMS, {user.first_name or 'пользователь'}!"
-
-        message = f"""
-        Добро пожаловать в нашу образовательную платформу!
-
-        Ваш email для входа: {user.email}
-
-        Теперь у вас есть доступ к:
-        - Курсам и урокам
-        - Личному кабинету
-        - Прогрессу обучения
-
-        Начните обучение прямо сейчас: {settings.FRONTEND_URL}
-
-        С уважением,
-        Команда LMS платформы
-        """
-
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            fail_silently=True,
-        )
+        # Приветствие отправляется пользователю один раз
+        enqueue_email(f'welcome:{user.id}', 'welcome', {}, [user.id])
 
-        logger.info(f"Приветственное письмо отправлено на {user.email}")
+        logger.info(f"Приветственное письмо поставлено в очередь для {user.email}")
         return f"Приветственное письмо отправлено на {user.email}"
 
     except User.DoesNotExist:
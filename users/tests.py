@@ -1,3 +1,227 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from lms.models import Course, Outbox
+
+User = get_user_model()
+
+
+@override_settings(INACTIVE_USERS_BATCH_SIZE=2)
+class InactiveUsersTestCase(TestCase):
+    """Тесты блокировки неактивных пользователей пачками"""
+
+    def setUp(self):
+        from config.celery import app as celery_app
+
+        self.celery_app = celery_app
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+        self.admin = User.objects.create_user(
+            email='admin@test.com', password='pass', is_staff=True, last_login=timezone.now()
+        )
+        self.active = User.objects.create_user(
+            email='active@test.com', password='pass', last_login=timezone.now() - timedelta(days=5)
+        )
+        self.inactive = [
+            User.objects.create_user(
+                email=f'inactive{i}@test.com', password='pass',
+                last_login=timezone.now() - timedelta(days=40 + i)
+            )
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        self.celery_app.conf.task_always_eager = self.always_eager
+
+    def test_deactivates_in_batches_and_reports(self):
+        """Неактивные блокируются пачками, отчет с адресами уходит администратору"""
+        from django.core import mail
+        from users.models import InactiveUsersReport
+        from users.tasks import check_inactive_users
+
+        with self.captureOnCommitCallbacks(execute=True):
+            check_inactive_users.delay()
+
+        self.assertEqual(
+            sorted(User.objects.filter(is_active=False).values_list('email', flat=True)),
+            ['inactive0@test.com', 'inactive1@test.com', 'inactive2@test.com']
+        )
+        report = InactiveUsersReport.objects.get()
+        self.assertEqual(report.status, InactiveUsersReport.Status.DONE)
+        self.assertEqual(report.count, 3)
+        self.assertEqual(report.users.count(), 3)
+
+        entry = Outbox.objects.get()
+        self.assertEqual(entry.payload['params'], {'report_id': report.id})
+        self.assertEqual([message.to for message in mail.outbox], [['admin@test.com']])
+        for user in self.inactive:
+            self.assertIn(user.email, mail.outbox[0].body)
+
+        # Повторный запуск не находит неактивных и не шлет отчет
+        with self.captureOnCommitCallbacks(execute=True):
+            check_inactive_users.delay()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(InactiveUsersReport.objects.count(), 2)
+
+    @override_settings(EMAIL_RATE_LIMIT=0.001, EMAIL_RATE_BURST=2, EMAIL_DAILY_LIMIT=0)
+    def test_report_is_split_to_fit_rate_limit(self):
+        """Отчет делится на письма, каждое из которых помещается в квоту за раз"""
+        from django.core import mail
+        from users.models import InactiveUsersReport
+        from users.tasks import send_inactive_users_report
+
+        cache.delete_pattern('lms:email:*')
+        self.addCleanup(cache.delete_pattern, 'lms:email:*')
+        admins = [self.admin] + [
+            User.objects.create_user(email=f'admin{i}@test.com', password='pass', is_staff=True)
+            for i in range(2)
+        ]
+        report = InactiveUsersReport.objects.create(cutoff=timezone.now() - timedelta(days=30))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            send_inactive_users_report(report.id)
+
+        entries = Outbox.objects.order_by('id')
+        self.assertEqual(
+            [entry.payload['user_ids'] for entry in entries],
+            [[admins[0].id, admins[1].id], [admins[2].id]]
+        )
+        self.assertEqual(
+            [entry.idempotency_key for entry in entries],
+            [f'inactive_users_report:{report.id}:{admins[0].id}', f'inactive_users_report:{report.id}:{admins[2].id}']
+        )
+        self.assertFalse(entries.filter(status=Outbox.Status.FAILED).exists())
+        self.assertEqual([message.to for message in mail.outbox], [['admin@test.com'], ['admin0@test.com']])
+
+    def test_report_without_admins(self):
+        """Без администраторов отчет завершается без писем"""
+        from django.core import mail
+        from users.models import InactiveUsersReport
+        from users.tasks import check_inactive_users
+
+        User.objects.filter(pk=self.admin.pk).update(is_staff=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            check_inactive_users.delay()
+
+        report = InactiveUsersReport.objects.get()
+        self.assertEqual(report.status, InactiveUsersReport.Status.DONE)
+        self.assertEqual(report.count, 3)
+        self.assertFalse(Outbox.objects.exists())
+        self.assertEqual(mail.outbox, [])
+
+    def test_interrupted_run_resumes(self):
+        """Прерванная блокировка продолжается с курсора того же отчета"""
+        from users.models import InactiveUsersReport
+        from users.tasks import check_inactive_users, deactivate_batch
+
+        report = InactiveUsersReport.objects.create(cutoff=timezone.now() - timedelta(days=30))
+        self.assertEqual(deactivate_batch(report.id, 1), 1)
+        report.refresh_from_db()
+        # Пачки идут от самого давнего входа
+        self.assertEqual(report.cursor_id, self.inactive[2].id)
+
+        check_inactive_users.delay()
+
+        report.refresh_from_db()
+        self.assertEqual(InactiveUsersReport.objects.count(), 1)
+        self.assertEqual(report.status, InactiveUsersReport.Status.DONE)
+        self.assertEqual(report.count, 3)
+        self.assertFalse(User.objects.filter(email__startswith='inactive', is_active=True).exists())
+
+
+class PaymentReconciliationTestCase(TestCase):
+    """Тесты сверки платежей по сохраненным ID сессии оплаты и платежа Stripe"""
+
+    def setUp(self):
+        from decimal import Decimal
+        from payments import events
+        from users.models import Payment
+
+        self.events = events
+        cache.delete(events.QUEUED_KEY)
+        self.addCleanup(cache.delete, events.QUEUED_KEY)
+
+        self.user = User.objects.create_user(email='buyer@test.com', password='pass')
+        self.course, = Course.objects.bulk_create([Course(title='Платный курс', price=Decimal('10'))])
+        self.Payment = Payment
+        self.payment = Payment.objects.create(
+            user=self.user, course=self.course, amount=Decimal('10'),
+            status=Payment.Status.PENDING, stripe_session_id='cs_1',
+        )
+
+    def event(self, event_id, object_id='cs_1', event_type='checkout.session.completed',
+              created=1700000000, **fields):
+        return {
+            'id': event_id,
+            'type': event_type,
+            'created': created,
+            'data': {'object': {
+                'id': object_id,
+                'payment_status': 'paid',
+                'payment_intent': 'pi_1',
+                **fields,
+            }},
+        }
+
+    def process(self):
+        from payments.tasks import process_stripe_events
+
+        return process_stripe_events()
+
+    def test_reconciliation_by_session_id(self):
+        """Платеж находится по ID сессии, а не по последней попытке checkout"""
+        from decimal import Decimal
+
+        retry = self.Payment.objects.create(
+            user=self.user, course=self.course, amount=Decimal('10'),
+            status=self.Payment.Status.PENDING, stripe_session_id='cs_2',
+        )
+        event = self.event('evt_1')['data']
+
+        with CaptureQueriesContext(connection) as queries:
+            self.events.handle_checkout_session_completed({'data': event})
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertIn('"stripe_session_id" = ', queries.captured_queries[0]['sql'])
+
+        self.payment.refresh_from_db()
+        retry.refresh_from_db()
+        self.assertEqual(self.payment.status, self.Payment.Status.PAID)
+        self.assertEqual(retry.status, self.Payment.Status.PENDING)
+
+        # Второй сессии пользователь не оплатил
+        self.events.handle_checkout_session_failed({'data': {'object': {'id': 'cs_2'}}})
+        retry.refresh_from_db()
+        self.assertEqual(retry.status, self.Payment.Status.FAILED)
+
+    def test_late_failure_does_not_unpay(self):
+        """Запоздавший отказ по платежу не отменяет подтвержденную оплату"""
+        self.events.store_event(self.event('evt_1', created=1700000001))
+        self.events.store_event(self.event(
+            'evt_2', object_id='pi_1', event_type='payment_intent.payment_failed', created=1700000002
+        ))
+        self.process()
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, self.Payment.Status.PAID)
+
+    def test_delayed_payment_method(self):
+        """Отложенная оплата: платеж ждет, пока Stripe не подтвердит ее"""
+        self.events.store_event(self.event('evt_1', created=1700000001, payment_status='unpaid'))
+        self.process()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, self.Payment.Status.PENDING)
+        self.assertEqual(self.payment.stripe_payment_intent_id, 'pi_1')
+
+        self.events.store_event(self.event(
+            'evt_2', event_type='checkout.session.async_payment_succeeded', created=1700000002
+        ))
+        self.process()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, self.Payment.Status.PAID)
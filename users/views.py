@@ -15,6 +15,9 @@ from .serializers import (
     PaymentDetailSerializer
 )
 from .permissions import IsOwnerOrAdmin, IsOwnerOrModerator
+from lms.fieldsets import restrict_to_serializer, fields_parameter
+from lms.paginators import PaymentPagination
+from lms.conditional import ConditionalGetMixin
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
@@ -272,7 +275,7 @@ class UserDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.IsAuthenticated()]
 
 
-class UserProfileAPIView(generics.RetrieveUpdateAPIView):
+class UserProfileAPIView(ConditionalGetMixin, generics.RetrieveUpdateAPIView):
     """
     API для получения и обновления профиля текущего пользователя.
 
@@ -291,11 +294,25 @@ class UserProfileAPIView(generics.RetrieveUpdateAPIView):
         operation_description="Получить профиль текущего пользователя",
         responses={
             200: UserProfileSerializer,
+            304: "Профиль не изменился",
             401: "Требуется аутентификация"
         }
     )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        return self.conditional_response(request, super().get, *args, **kwargs)
+
+    def get_conditional_validators(self, request):
+        """
+        ETag по полям профиля.
+
+        Пользователь уже загружен при аутентификации, поэтому
+        валидатор считается без запросов к базе.
+        """
+        user = request.user
+        parts = tuple(
+            str(getattr(user, name)) for name in UserProfileSerializer.Meta.fields
+        )
+        return parts, None
 
     @swagger_auto_schema(
         operation_description="Полное обновление профиля текущего пользователя",
@@ -334,15 +351,23 @@ class PaymentListAPIView(generics.ListAPIView):
     Администраторы и модераторы видят все платежи.
 
     Доступна фильтрация и сортировка:
-    - Фильтрация: по курсу, уроку, способу оплаты
+    - Фильтрация: по курсу, уроку, способу оплаты, статусу
     - Сортировка: по дате оплаты (возрастание/убывание)
     """
     serializer_class = PaymentSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ['course', 'lesson', 'payment_method']
+    filterset_fields = ['course', 'lesson', 'payment_method', 'status']
     ordering_fields = ['payment_date']
-    ordering = ['-payment_date']
+    ordering = ['-payment_date', '-id']
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaymentPagination
+
+    def get_queryset(self):
+        """Администраторы и модераторы видят все платежи, остальные - свои"""
+        user = self.request.user
+        if user.is_staff or user.groups.filter(name='moderators').exists():
+            return Payment.objects.all()
+        return Payment.objects.filter(user=user)
 
     @swagger_auto_schema(
         operation_description="Получить список платежей",
@@ -366,16 +391,29 @@ class PaymentListAPIView(generics.ListAPIView):
                 type=openapi.TYPE_STRING,
                 enum=['cash', 'transfer']
             ),
+            openapi.Parameter(
+                'status',
+                openapi.IN_QUERY,
+                description="Фильтр по статусу (pending/paid/failed)",
+                type=openapi.TYPE_STRING,
+                enum=['pending', 'paid', 'failed']
+            ),
             openapi.Parameter(
                 'ordering',
                 openapi.IN_QUERY,
                 description="Сортировка по дате оплаты (payment_date или -payment_date)",
                 type=openapi.TYPE_STRING
             ),
+            openapi.Parameter(
+                'cursor',
+                openapi.IN_QUERY,
+                description="Курсор страницы из ссылок next/previous",
+                type=openapi.TYPE_STRING
+            ),
             openapi.Parameter(
                 'page',
                 openapi.IN_QUERY,
-                description="Номер страницы",
+                description="Номер страницы (постраничный режим вместо курсора)",
                 type=openapi.TYPE_INTEGER
             ),
             openapi.Parameter(
@@ -405,8 +443,22 @@ class PaymentRetrieveAPIView(generics.RetrieveAPIView):
     serializer_class = PaymentDetailSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrModerator]
 
+    def get_queryset(self):
+        """Только запрошенные поля, курс и урок одним запросом"""
+        serializer = self.get_serializer()
+        queryset = restrict_to_serializer(
+            super().get_queryset(),
+            serializer,
+            extra=('user',)
+        )
+        related = [name for name in ('course', 'lesson') if name in serializer.fields]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset
+
     @swagger_auto_schema(
         operation_description="Получить детальную информацию о платеже",
+        manual_parameters=[fields_parameter],
         responses={
             200: openapi.Response(
                 description="Информация о платеже",